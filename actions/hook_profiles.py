@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+#
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import base64
+import json
+import os
+import sys
+
+sys.path.append('hooks/')
+
+from charmhelpers.core.hookenv import (
+    action_fail,
+    action_get,
+    action_set,
+)
+from neutron_ovs_profiling import (
+    list_profiles,
+    profile_path,
+)
+
+# Largest compressed profile returned inline in the action results
+MAX_INLINE_SIZE = 1024 * 1024
+
+
+def list_hook_profiles(args):
+    """List the hook profiles saved on the unit."""
+    action_set({'profiles': json.dumps(list_profiles(), sort_keys=True)})
+
+
+def get_hook_profile(args):
+    """Return the path of a saved hook profile and, if small enough, its
+    base64 encoded contents.
+    @raises ValueError if there is no such profile.
+    """
+    path = profile_path(action_get('name'))
+    results = {'path': path}
+    if os.path.getsize(path) <= MAX_INLINE_SIZE:
+        with open(path, 'rb') as f:
+            results['data'] = base64.b64encode(f.read()).decode('ascii')
+    action_set(results)
+
+
+# A dictionary of all the defined actions to callables (which take
+# parsed arguments).
+ACTIONS = {"list-hook-profiles": list_hook_profiles,
+           "get-hook-profile": get_hook_profile}
+
+
+def main(args):
+    action_name = os.path.basename(args[0])
+    try:
+        action = ACTIONS[action_name]
+    except KeyError:
+        s = "Action {} undefined".format(action_name)
+        action_fail(s)
+        return s
+    else:
+        try:
+            action(args)
+        except Exception as e:
+            action_fail("Action {} failed: {}".format(action_name, str(e)))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -19,30 +19,57 @@ import sys
 
 sys.path.append('hooks/')
 
-from charmhelpers.core.hookenv import action_fail
+from charmhelpers.core.hookenv import action_fail, action_set
+from charmhelpers.contrib.openstack.utils import is_unit_paused_set
 from neutron_ovs_utils import (
+    assess_status,
     pause_unit_helper,
     resume_unit_helper,
     register_configs,
+    restart_openvswitch,
 )
 
 
+def _set_timings(timings):
+    """Report the seconds taken by each service in the action results."""
+    if timings:
+        action_set({'timings.{}'.format(service): seconds
+                    for service, seconds in timings.items()})
+
+
 def pause(args):
     """Pause the Ceilometer services.
     @raises Exception should the service fail to stop.
     """
-    pause_unit_helper(register_configs())
+    timings = {}
+    try:
+        pause_unit_helper(register_configs(), timings)
+    finally:
+        _set_timings(timings)
 
 
 def resume(args):
     """Resume the Ceilometer services.
     @raises Exception should the service fail to start."""
-    resume_unit_helper(register_configs())
+    timings = {}
+    try:
+        resume_unit_helper(register_configs(), timings)
+    finally:
+        _set_timings(timings)
+
+
+def restart(args):
+    """Restart openvswitch-switch to apply deferred settings.
+    @raises Exception if the unit is paused."""
+    if is_unit_paused_set():
+        raise Exception("Unit is paused, settings are applied on resume")
+    restart_openvswitch()
+    assess_status(register_configs())
 
 
 # A dictionary of all the defined actions to callables (which take
 # parsed arguments).
-ACTIONS = {"pause": pause, "resume": resume}
+ACTIONS = {"pause": pause, "resume": resume, "restart-openvswitch": restart}
 
 
 def main(args):
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+#
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+
+sys.path.append('hooks/')
+
+from charmhelpers.core.hookenv import action_fail
+from charmhelpers.contrib.openstack.utils import is_unit_paused_set
+from neutron_ovs_hooks import (
+    CONFIGS,
+    full_reconcile,
+)
+from neutron_ovs_utils import assess_status
+
+
+def reconcile(args):
+    """Reconcile all subsystems managed by the charm.
+    @raises Exception if the unit is paused."""
+    if is_unit_paused_set():
+        raise Exception("Unit is paused, subsystems are reconciled on resume")
+    full_reconcile()
+    assess_status(CONFIGS)
+
+
+# A dictionary of all the defined actions to callables (which take
+# parsed arguments).
+ACTIONS = {"reconcile": reconcile}
+
+
+def main(args):
+    action_name = os.path.basename(args[0])
+    try:
+        action = ACTIONS[action_name]
+    except KeyError:
+        s = "Action {} undefined".format(action_name)
+        action_fail(s)
+        return s
+    else:
+        try:
+            action(args)
+        except Exception as e:
+            action_fail("Action {} failed: {}".format(action_name, str(e)))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
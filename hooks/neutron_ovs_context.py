@@ -15,12 +15,26 @@
 import collections
 import glob
 import os
+import re
 import socket
+import time
 import uuid
-from pci import PCINetDevices
+
+import netaddr
+import netifaces
+import six
+
+from pci import (
+    PCINetDevices,
+    get_pci_driver,
+    read_sysfs,
+)
 from charmhelpers.core.hookenv import (
+    cached,
     config,
     log,
+    DEBUG,
+    WARNING,
     relation_get,
     relation_ids,
     related_units,
@@ -38,14 +52,19 @@ from charmhelpers.contrib.openstack.utils import (
     get_host_ip,
 )
 from charmhelpers.contrib.network.ip import (
-    get_address_in_network,
     get_relation_ip,
+    is_ip,
+)
+from charmhelpers.fetch import (
+    apt_install,
+    filter_installed_packages,
 )
 from charmhelpers.contrib.openstack.context import (
     OSContextGenerator,
     NeutronAPIContext,
     parse_data_port_mappings
 )
+from charmhelpers.contrib.openstack.neutron import parse_bridge_mappings
 from charmhelpers.contrib.openstack.utils import (
     os_release,
     CompareOpenStackReleases,
@@ -60,6 +79,412 @@ VALID_FIREWALL_DRIVERS = (IPTABLES_HYBRID, OPENVSWITCH)
 NFG_LOG_RATE_LIMIT_MIN = 100
 NFG_LOG_BURST_LIMIT_MIN = 25
 
+DNS_CACHE_KEY = 'neutron-ovs-dns-cache'
+HOST_FQDN_KEY = 'neutron-ovs-host-fqdn'
+LCORE_MASK_KEY = 'neutron-ovs-dpdk-lcore-mask'
+# Lifetime in seconds of successful and failed name resolutions
+DNS_POSITIVE_TTL = 3600
+DNS_NEGATIVE_TTL = 300
+# Maximum time in seconds a hook may block on a single name resolution
+DNS_TIMEOUT = 5
+
+# Time in seconds the current hook spent blocked on name resolution
+_dns_blocked_time = 0.0
+# Names whose resolution timed out during the current hook
+_dns_timed_out = {}
+
+
+def dns_blocked_time():
+    '''Time in seconds the current hook spent blocked on name resolution'''
+    return _dns_blocked_time
+
+
+def _dns_resolver():
+    '''
+    Import dnspython, installing it first if required, and bound the
+    lifetime of queries made through its default resolver to DNS_TIMEOUT
+    seconds.
+
+    charmhelpers would otherwise install python3-dnspython from within the
+    first lookup and then wait on the resolver for as long as it takes.
+
+    @returns the dns package
+    '''
+    try:
+        import dns.resolver
+    except ImportError:
+        apt_install(filter_installed_packages(['python3-dnspython']),
+                    fatal=True)
+        import dns.resolver
+    try:
+        resolver = dns.resolver.get_default_resolver()
+        resolver.lifetime = DNS_TIMEOUT
+        resolver.timeout = min(resolver.timeout, DNS_TIMEOUT)
+    except dns.exception.DNSException as e:
+        log('Unable to configure DNS resolver: {}'.format(e), level=WARNING)
+    return dns
+
+
+def _cached_resolve(kind, name, resolver):
+    '''
+    Resolve name using resolver, caching successful and failed answers
+    in the unit kv store for DNS_POSITIVE_TTL and DNS_NEGATIVE_TTL
+    seconds respectively.
+
+    A lookup which times out is not cached as a failure: the last known
+    answer is used if there is one, and the name is not looked up again
+    until the next hook. A lookup which fails after a positive answer has
+    expired also keeps the last known answer, for DNS_NEGATIVE_TTL
+    seconds before it is retried.
+
+    @returns the resolved value, or None if resolution failed
+    '''
+    global _dns_blocked_time
+    db = kv()
+    cache = db.get(DNS_CACHE_KEY) or {}
+    key = '{}:{}'.format(kind, name)
+    now = time.time()
+    entry = cache.get(key)
+    if entry and entry['expires'] > now:
+        log('Using cached {} for {}: {}'.format(kind, name, entry['value']),
+            level=DEBUG)
+        return entry['value']
+    if key in _dns_timed_out:
+        return _dns_timed_out[key]
+
+    dns = _dns_resolver()
+    try:
+        value = resolver(name) or None
+    except dns.exception.Timeout:
+        log('Name resolution of {} timed out after {}s'.format(
+            name, DNS_TIMEOUT), level=WARNING)
+        value = entry['value'] if entry else None
+        _dns_timed_out[key] = value
+        return value
+    except Exception as e:
+        log('Name resolution of {} failed: {}'.format(name, e),
+            level=WARNING)
+        value = None
+    finally:
+        _dns_blocked_time += time.time() - now
+    ttl = DNS_POSITIVE_TTL if value else DNS_NEGATIVE_TTL
+    if not value and entry and entry['value']:
+        log('Using last known {} for {}: {}'.format(kind, name,
+                                                    entry['value']),
+            level=WARNING)
+        value = entry['value']
+    cache[key] = {'value': value, 'expires': now + ttl}
+    db.set(DNS_CACHE_KEY, cache)
+    db.flush()
+    return value
+
+
+def resolve_host_ip(hostname, fallback=None):
+    '''
+    Resolve the IP address of hostname without blocking the hook on slow
+    or unreachable resolvers; IP addresses are returned unchanged.
+
+    @returns str: IP address, or fallback if hostname does not resolve
+    '''
+    if is_ip(hostname):
+        return hostname
+    return _cached_resolve('ip', hostname, get_host_ip) or fallback
+
+
+def resolve_fqdn(address):
+    '''
+    Resolve the FQDN of address through NSS, as socket.getfqdn() does, so
+    that /etc/hosts takes precedence over DNS.
+
+    @returns str: FQDN, or None if address does not resolve
+    '''
+    def _get_fqdn(address):
+        fqdn = socket.getfqdn(address)
+        # NOTE: getfqdn() returns its argument when it does not resolve
+        if fqdn != address:
+            return fqdn
+
+    return _cached_resolve('fqdn', address, _get_fqdn)
+
+
+SYS_CLASS_NET = '/sys/class/net'
+MAC_REGEX = re.compile(r'([0-9A-F]{2}[:-]){5}([0-9A-F]{2})', re.I)
+
+
+def _interface_addresses(interface):
+    '''
+    List the global IPv4 and IPv6 addresses of interface in CIDR notation.
+    '''
+    try:
+        ifaddresses = netifaces.ifaddresses(interface)
+    except ValueError:
+        # interface was removed after it was listed
+        return []
+    addresses = []
+    for addr in ifaddresses.get(netifaces.AF_INET, []):
+        if addr.get('netmask'):
+            addresses.append('{}/{}'.format(addr['addr'], addr['netmask']))
+    for addr in ifaddresses.get(netifaces.AF_INET6, []):
+        address = addr['addr'].split('%')[0]
+        if address.startswith('fe80') or address == '::1':
+            continue
+        addresses.append('{}/{}'.format(
+            address, addr.get('netmask', '128').split('/')[-1]))
+    return [str(netaddr.IPNetwork(a)) for a in addresses]
+
+
+@cached
+def interface_index():
+    '''
+    Snapshot of the network interfaces of the unit, built once per hook
+    execution from sysfs and netifaces and shared by all port resolvers.
+
+    @returns dict: interface name -> dict with keys:
+        hwaddr: MAC address
+        addresses: list of global IPv4 and IPv6 addresses in CIDR notation
+        physical: True if the interface is not a virtual device
+        bond_master: name of the bond the interface is enslaved to or None
+        bridge_member: True if the interface is a linux bridge port
+    '''
+    index = {}
+    if not os.path.isdir(SYS_CLASS_NET):
+        return index
+    for interface in sorted(os.listdir(SYS_CLASS_NET)):
+        path = os.path.join(SYS_CLASS_NET, interface)
+        physical = '/virtual/' not in os.path.realpath(path)
+        bond_master = None
+        master = os.path.join(path, 'master')
+        if physical and os.path.exists(master):
+            master = os.path.realpath(master)
+            if os.path.exists(os.path.join(master, 'bonding')):
+                bond_master = os.path.basename(master)
+        index[interface] = {
+            'hwaddr': read_sysfs(os.path.join(path, 'address')),
+            'addresses': _interface_addresses(interface),
+            'physical': physical,
+            'bond_master': bond_master,
+            'bridge_member': os.path.exists(os.path.join(path, 'brport')),
+        }
+    return index
+
+
+def get_address_in_network(network, fallback=None):
+    '''
+    Get an address within network from the interfaces of the unit.
+
+    @param network: space-delimited list of networks in CIDR notation
+    @param fallback: address to return if none is found
+    @returns str: address in the first matching network or fallback
+    '''
+    if not network:
+        return fallback
+    for cidr in network.split():
+        cidr = netaddr.IPNetwork(cidr)
+        for info in interface_index().values():
+            for address in info['addresses']:
+                address = netaddr.IPNetwork(address)
+                if address.version == cidr.version and address in cidr:
+                    return str(address.ip)
+    return fallback
+
+
+def tunnel_local_ip():
+    '''
+    Address of the unit used as the endpoint of overlay network tunnels:
+    the DPDK tunnel endpoint address if configured, otherwise the address
+    in os-data-network or bound to the data space.
+    '''
+    try:
+        tunnel_endpoint = dpdk_tunnel_endpoint()
+    except ValueError as e:
+        log('Ignoring DPDK tunnel endpoint: {}'.format(e), level=WARNING)
+        tunnel_endpoint = None
+    if tunnel_endpoint:
+        # NOTE: overlay traffic terminates in the OVS userspace datapath
+        return str(tunnel_endpoint.address.ip)
+
+    fallback = resolve_host_ip(unit_get('private-address'))
+    if config('os-data-network'):
+        # NOTE: prefer any existing use of config based networking
+        return get_address_in_network(config('os-data-network'), fallback)
+    # NOTE: test out network-spaces support, then fallback
+    try:
+        return resolve_host_ip(network_get_primary_address('data'))
+    except NotImplementedError:
+        return fallback
+
+
+# Encapsulation overhead of overlay network types on top of the outer IP
+# header, as accounted for by neutron
+OVERLAY_OVERHEAD = {
+    'gre': 22,
+    'vxlan': 30,
+    'geneve': 30,
+}
+IP_HEADER_LENGTH = {
+    4: 20,
+    6: 40,
+}
+
+
+def interface_mtu(address):
+    '''
+    MTU of the network interface holding address.
+
+    @return int: MTU or None if no interface holds address
+    '''
+    address = netaddr.IPAddress(address)
+    for interface, info in interface_index().items():
+        if any(netaddr.IPNetwork(a).ip == address
+               for a in info['addresses']):
+            mtu = read_sysfs(os.path.join(SYS_CLASS_NET, interface, 'mtu'))
+            return int(mtu) if mtu and mtu.isdigit() else None
+    return None
+
+
+def auto_mtus():
+    '''
+    Compute the MTUs of physical and overlay networks from the MTU of the
+    interface carrying the overlay network tunnels, for auto-mtu.
+
+    The overlay MTU leaves room for the largest encapsulation overhead of
+    the overlay_network_type provided by neutron-api.
+
+    @return tuple: physical and overlay network MTUs, or None, None if the
+                   tunnel interface is not found
+    '''
+    local_ip = tunnel_local_ip()
+    try:
+        physical_mtu = interface_mtu(local_ip)
+    except (netaddr.AddrFormatError, TypeError, ValueError):
+        physical_mtu = None
+    if not physical_mtu:
+        log('Unable to find the MTU of the tunnel interface of {}, not '
+            'computing MTUs'.format(local_ip), level=WARNING)
+        return None, None
+    overlay_types = (NeutronAPIContext()()['overlay_network_type'] or
+                     '').split()
+    overhead = max([OVERLAY_OVERHEAD.get(t, 0) for t in overlay_types] or
+                   [0])
+    overhead += IP_HEADER_LENGTH[netaddr.IPAddress(local_ip).version]
+    return physical_mtu, physical_mtu - overhead
+
+
+class IndexedPortContext(context.NeutronPortContext):
+    '''
+    Resolve ports against interface_index() rather than inspecting each
+    interface of the unit with a separate ip invocation.
+    '''
+
+    def resolve_ports(self, ports):
+        """Resolve NICs not yet bound to bridge(s)
+
+        If hwaddress provided then returns resolved hwaddress otherwise NIC.
+        """
+        if not ports:
+            return None
+
+        index = interface_index()
+        hwaddr_to_nic = {}
+        hwaddr_to_ip = {}
+        for nic, info in index.items():
+            # Ignore virtual interfaces (bond masters will be identified from
+            # their slaves)
+            if not info['physical']:
+                continue
+
+            if info['bond_master']:
+                log("Replacing iface '%s' with bond master '%s'" %
+                    (nic, info['bond_master']), level=DEBUG)
+                nic = info['bond_master']
+                info = index.get(nic, info)
+
+            hwaddr_to_nic[info['hwaddr']] = nic
+            hwaddr_to_ip[info['hwaddr']] = info['addresses']
+
+        resolved = []
+        for entry in ports:
+            if re.match(MAC_REGEX, entry):
+                # NIC is in known NICs and does NOT have an IP address
+                if entry in hwaddr_to_nic and not hwaddr_to_ip[entry]:
+                    # If the nic is part of a bridge then don't use it
+                    nic = hwaddr_to_nic[entry]
+                    if index.get(nic, {}).get('bridge_member'):
+                        continue
+
+                    resolved.append(nic)
+            elif entry in index:
+                resolved.append(entry)
+
+        # Ensure no duplicates
+        return list(set(resolved))
+
+
+class ExternalPortContext(IndexedPortContext, context.ExternalPortContext):
+
+    def __call__(self):
+        ctxt = super(ExternalPortContext, self).__call__()
+        if ctxt and config('auto-mtu'):
+            # NOTE: external networks are not encapsulated, the port gets
+            #       the MTU of the physical network
+            physical_mtu = auto_mtus()[0]
+            if physical_mtu:
+                ctxt['ext_port_mtu'] = physical_mtu
+        return ctxt
+
+
+class DataPortContext(IndexedPortContext, context.DataPortContext):
+
+    def __call__(self):
+        ports = config('data-port')
+        if ports:
+            # Map of {bridge:port/mac}
+            portmap = parse_data_port_mappings(ports)
+            ports = portmap.keys()
+            # Resolve provided ports or mac addresses and filter out those
+            # already attached to a bridge.
+            resolved = self.resolve_ports(ports)
+            # Rebuild port index using resolved and filtered ports.
+            index = interface_index()
+            normalized = {index[port]['hwaddr']: port for port in resolved
+                          if port not in ports and port in index}
+            normalized.update({port: port for port in resolved
+                               if port in ports})
+            if resolved:
+                return {normalized[port]: bridge for port, bridge in
+                        six.iteritems(portmap) if port in normalized.keys()}
+
+        return None
+
+
+class PhyNICMTUContext(DataPortContext):
+
+    def __call__(self):
+        ctxt = {}
+        mappings = super(PhyNICMTUContext, self).__call__()
+        if mappings and mappings.keys():
+            # NOTE: the MTU of the data ports is the MTU neutron-api sets
+            #       for the physical network of their bridge, applied by
+            #       configure_ovs() through the mtu_request of their OVS
+            #       interface. If any of the ports is a vlan device, its
+            #       underlying device must carry that MTU too.
+            bridge_mtus = resolve_bridge_mtus(provided_only=True)
+            lower_ports = set()
+            mtus = []
+            for port, bridge in sorted(mappings.items()):
+                if bridge not in bridge_mtus:
+                    continue
+                for lport in glob.glob("/sys/class/net/%s/lower_*" % port):
+                    lport = os.path.basename(lport)
+                    lower_ports.add(lport.split('_')[1])
+                    mtus.append(bridge_mtus[bridge])
+
+            if lower_ports:
+                ctxt["devs"] = '\\n'.join(sorted(lower_ports))
+                ctxt['mtu'] = max(mtus)
+
+        return ctxt
+
 
 def _get_firewall_driver(ovs_ctxt):
     '''
@@ -171,20 +596,7 @@ class OVSPluginContext(context.NeutronContext):
 
         conf = config()
 
-        fallback = get_host_ip(unit_get('private-address'))
-        if config('os-data-network'):
-            # NOTE: prefer any existing use of config based networking
-            ovs_ctxt['local_ip'] = \
-                get_address_in_network(config('os-data-network'),
-                                       fallback)
-        else:
-            # NOTE: test out network-spaces support, then fallback
-            try:
-                ovs_ctxt['local_ip'] = get_host_ip(
-                    network_get_primary_address('data')
-                )
-            except NotImplementedError:
-                ovs_ctxt['local_ip'] = fallback
+        ovs_ctxt['local_ip'] = tunnel_local_ip()
 
         neutron_api_settings = NeutronAPIContext()()
         ovs_ctxt['neutron_security_groups'] = self.neutron_security_groups
@@ -205,8 +617,12 @@ class OVSPluginContext(context.NeutronContext):
         ovs_ctxt['debug'] = conf['debug']
         ovs_ctxt['prevent_arp_spoofing'] = conf['prevent-arp-spoofing']
         ovs_ctxt['enable_dpdk'] = conf['enable-dpdk']
+        if config('enable-afxdp') and not conf['enable-dpdk']:
+            ovs_ctxt['enable_afxdp'] = True
 
         net_dev_mtu = neutron_api_settings.get('network_device_mtu')
+        if config('auto-mtu'):
+            net_dev_mtu = auto_mtus()[1] or net_dev_mtu
         if net_dev_mtu:
             # neutron.conf
             ovs_ctxt['network_device_mtu'] = net_dev_mtu
@@ -313,6 +729,8 @@ class DHCPAgentContext(ZoneContext):
             ctxt['dns_domain'] = neutron_api_settings.get('dns_domain')
 
         ctxt['instance_mtu'] = config('instance-mtu')
+        if config('auto-mtu'):
+            ctxt['instance_mtu'] = auto_mtus()[1] or ctxt['instance_mtu']
 
         return ctxt
 
@@ -375,62 +793,355 @@ class L3AgentContext(OSContextGenerator):
         return ctxt
 
 
-def resolve_dpdk_bridges():
+# devargs identifying one of the ports sharing a PCI function by its mac
+DPDK_MAC_DEVARGS = 'class=eth,mac='
+
+
+def dpdk_device_pci(device):
     '''
-    Resolve local PCI devices from configured mac addresses
-    using the data-port configuration option
+    PCI address of a DPDK device id; the PCI address of ports identified
+    by their mac is the one recorded when the device was resolved.
+    '''
+    if device.startswith(DPDK_MAC_DEVARGS):
+        return kv().get(device[len(DPDK_MAC_DEVARGS):])
+    return device
 
-    @return: OrderDict indexed by PCI device address.
+
+@cached
+def _dpdk_pci_macs():
+    '''
+    Map the PCI addresses of the local devices configured in data-port and
+    dpdk-bond-mappings to their mac addresses.
+
+    The PCI devices are scanned once per hook execution; the mac->pci
+    allocation is stored in the unit kv store, under the lower case mac
+    address, as devices bound to DPDK disappear from the scan.
+
+    @return: defaultdict of sets of mac addresses indexed by PCI address.
     '''
-    ports = config('data-port')
     devices = PCINetDevices()
-    resolved_devices = collections.OrderedDict()
     db = kv()
-    if ports:
-        # NOTE: ordered dict of format {[mac]: bridge}
-        portmap = parse_data_port_mappings(ports)
-        for mac, bridge in portmap.items():
+    pci_macs = collections.defaultdict(set)
+    for mapping in ('data-port', 'dpdk-bond-mappings'):
+        # NOTE: ordered dict of format {[mac]: name}
+        portmap = parse_data_port_mappings(config(mapping) or '')
+        for mac in portmap:
+            if not MAC_REGEX.match(mac):
+                continue
             pcidev = devices.get_device_from_mac(mac)
-            if pcidev:
-                # NOTE: store mac->pci allocation as post binding
-                #       to dpdk, it disappears from PCIDevices.
-                db.set(mac, pcidev.pci_address)
-                db.flush()
-
-            pci_address = db.get(mac)
+            # NOTE: allocations used to be stored in the case of the config
+            pci_address = (pcidev.pci_address if pcidev else
+                           db.get(mac.lower()) or db.get(mac))
             if pci_address:
-                resolved_devices[pci_address] = bridge
+                db.set(mac.lower(), pci_address)
+                pci_macs[pci_address].add(mac.lower())
+    db.flush()
+    return pci_macs
+
+
+@cached
+def _resolve_dpdk_devices(option):
+    '''
+    Resolve local PCI devices from the mac addresses configured in option
+
+    Ports sharing a PCI function, as on multi-port cards, are identified
+    by class=eth,mac= devargs rather than by their PCI address.
+
+    The result is cached for the hook execution and must not be modified.
 
+    @return: OrderDict of the names mapped in option indexed by device id.
+    '''
+    resolved_devices = collections.OrderedDict()
+    db = kv()
+    pci_macs = _dpdk_pci_macs()
+    portmap = parse_data_port_mappings(config(option) or '')
+    for mac, name in portmap.items():
+        pci_address = db.get(mac.lower())
+        if not pci_address:
+            continue
+        if len(pci_macs[pci_address]) > 1:
+            resolved_devices[DPDK_MAC_DEVARGS + mac.lower()] = name
+        else:
+            resolved_devices[pci_address] = name
     return resolved_devices
 
 
+def resolve_dpdk_bridges():
+    '''
+    Resolve local PCI devices from configured mac addresses
+    using the data-port configuration option
+
+    @return: OrderDict indexed by device id, see _resolve_dpdk_devices().
+    '''
+    return _resolve_dpdk_devices('data-port')
+
+
 def resolve_dpdk_bonds():
     '''
     Resolve local PCI devices from configured mac addresses
     using the dpdk-bond-mappings configuration option
 
-    @return: OrderDict indexed by PCI device address.
+    @return: OrderDict indexed by device id, see _resolve_dpdk_devices().
     '''
-    bonds = config('dpdk-bond-mappings')
-    devices = PCINetDevices()
-    resolved_devices = collections.OrderedDict()
-    db = kv()
-    if bonds:
-        # NOTE: ordered dict of format {[mac]: bond}
-        bondmap = parse_data_port_mappings(bonds)
-        for mac, bond in bondmap.items():
-            pcidev = devices.get_device_from_mac(mac)
-            if pcidev:
-                # NOTE: store mac->pci allocation as post binding
-                #       to dpdk, it disappears from PCIDevices.
-                db.set(mac, pcidev.pci_address)
-                db.flush()
+    return _resolve_dpdk_devices('dpdk-bond-mappings')
 
-            pci_address = db.get(mac)
-            if pci_address:
-                resolved_devices[pci_address] = bond
 
-    return resolved_devices
+def resolve_dpdk_devices():
+    '''
+    Resolve local PCI devices of both DPDK bridge ports and DPDK bonds
+
+    @return: OrderDict of bridge and bond names indexed by device id.
+    '''
+    devices = collections.OrderedDict(resolve_dpdk_bridges())
+    devices.update(resolve_dpdk_bonds())
+    return devices
+
+
+def resolve_kernel_bridges():
+    '''
+    Resolve the kernel network interfaces configured by name in the
+    data-port configuration option when DPDK is enabled. Mac addresses
+    identify DPDK devices and bond names DPDK bonds, so both are skipped.
+
+    @return: OrderDict of bridges indexed by interface name.
+    '''
+    ports = config('data-port')
+    resolved_interfaces = collections.OrderedDict()
+    if ports:
+        dpdk_bonds = set(parse_data_port_mappings(
+            config('dpdk-bond-mappings') or '').values())
+        index = interface_index()
+        portmap = parse_data_port_mappings(ports)
+        for port, bridge in portmap.items():
+            if MAC_REGEX.match(port) or port in dpdk_bonds:
+                continue
+            if port in index:
+                resolved_interfaces[port] = bridge
+            else:
+                log('Kernel data port {} not found'.format(port),
+                    level=WARNING)
+    return resolved_interfaces
+
+
+def resolve_kernel_bonds():
+    '''
+    Resolve the kernel network interfaces configured by mac address or
+    name in the bond-mappings configuration option. Interfaces holding an
+    IP address are not used as bond members.
+
+    @return: OrderDict of bonds indexed by interface name.
+    '''
+    resolved_interfaces = collections.OrderedDict()
+    bonds = config('bond-mappings')
+    if not bonds:
+        return resolved_interfaces
+    index = interface_index()
+    hwaddr_to_nic = {info['hwaddr']: nic for nic, info in index.items()
+                     if info['physical'] and info['hwaddr']}
+    for port, bond in parse_data_port_mappings(bonds).items():
+        if MAC_REGEX.match(port):
+            interface = hwaddr_to_nic.get(port.lower())
+        else:
+            interface = port if port in index else None
+        if not interface:
+            log('Bond {} member {} not found'.format(bond, port),
+                level=WARNING)
+        elif index[interface]['addresses']:
+            log('Bond {} member {} has an IP address, not using it'
+                .format(bond, interface), level=WARNING)
+        else:
+            resolved_interfaces[interface] = bond
+    return resolved_interfaces
+
+
+AFXDP_MODES = ('best-effort', 'native-with-zerocopy', 'native', 'generic')
+
+
+def resolve_afxdp_bridges():
+    '''
+    Resolve local network interfaces from the mac addresses or interface
+    names configured in the data-port configuration option. Unlike DPDK
+    devices, AF_XDP interfaces stay bound to their kernel driver.
+
+    @return: OrderDict of bridges indexed by interface name.
+    '''
+    ports = config('data-port')
+    resolved_interfaces = collections.OrderedDict()
+    if ports:
+        index = interface_index()
+        macs = {info['hwaddr']: interface
+                for interface, info in index.items()
+                if info['physical'] and info['hwaddr']}
+        # NOTE: ordered dict of format {[mac]: bridge}
+        portmap = parse_data_port_mappings(ports)
+        for port, bridge in portmap.items():
+            if port in index:
+                resolved_interfaces[port] = bridge
+            elif port.lower() in macs:
+                resolved_interfaces[macs[port.lower()]] = bridge
+    return resolved_interfaces
+
+
+def validate_afxdp_config():
+    '''
+    Check the AF_XDP options of the charm configuration
+
+    @raises ValueError if an option is invalid
+    '''
+    if config('enable-dpdk'):
+        raise ValueError('enable-afxdp and enable-dpdk are mutually '
+                         'exclusive')
+    if config('afxdp-mode') not in AFXDP_MODES:
+        raise ValueError('Invalid afxdp-mode: {} (valid: {})'
+                         .format(config('afxdp-mode'),
+                                 ', '.join(AFXDP_MODES)))
+    if (config('afxdp-n-rxq') or 0) < 1:
+        raise ValueError('Invalid afxdp-n-rxq: {}'
+                         .format(config('afxdp-n-rxq')))
+
+
+HW_OFFLOAD_TC_POLICIES = ('none', 'skip_sw', 'skip_hw')
+
+
+def validate_hw_offload_config():
+    '''
+    Check the hardware offload options of the charm configuration
+
+    @raises ValueError if an option is invalid
+    '''
+    if config('enable-dpdk') or config('enable-afxdp'):
+        raise ValueError('enable-hardware-offload requires the kernel '
+                         'datapath, disable enable-dpdk and enable-afxdp')
+    if config('hw-offload-tc-policy') not in HW_OFFLOAD_TC_POLICIES:
+        raise ValueError('Invalid hw-offload-tc-policy: {} (valid: {})'
+                         .format(config('hw-offload-tc-policy'),
+                                 ', '.join(HW_OFFLOAD_TC_POLICIES)))
+    mappings = (config('sriov-device-mappings') or '').split()
+    if not mappings:
+        raise ValueError('enable-hardware-offload requires '
+                         'sriov-device-mappings')
+    for mapping in mappings:
+        if len(mapping.split(':')) != 2:
+            raise ValueError('Invalid sriov-device-mappings entry: {}'
+                             .format(mapping))
+
+
+def _neutron_api_provides(key):
+    '''Whether a neutron-api unit has set key on the neutron-plugin-api
+    relation'''
+    for rid in relation_ids('neutron-plugin-api'):
+        for unit in related_units(rid):
+            if relation_get(key, rid=rid, unit=unit) is not None:
+                return True
+    return False
+
+
+def resolve_bridge_mtus(provided_only=False):
+    '''
+    Resolve the MTU of the bridges in bridge-mappings from the
+    physical_network_mtus provided by neutron-api, a space or comma
+    delimited list of physnet:mtu.
+
+    @param provided_only: only resolve MTUs set by neutron-api, leaving
+                          out the global_physnet_mtu default used until
+                          neutron-api provides one.
+    @return: defaultdict of MTUs indexed by bridge name, defaulting to
+             global_physnet_mtu for bridges of physnets without an MTU;
+             with provided_only, a dict of the bridges with an MTU.
+    '''
+    neutron_api_settings = NeutronAPIContext()()
+    global_mtu = neutron_api_settings['global_physnet_mtu']
+    physnet_mtus = {}
+    for entry in (neutron_api_settings.get('physical_network_mtus') or
+                  '').replace(',', ' ').split():
+        physnet, _, mtu = entry.partition(':')
+        if not mtu.isdigit():
+            log('Ignoring invalid physical network MTU {}'.format(entry),
+                level=WARNING)
+            continue
+        physnet_mtus[physnet] = int(mtu)
+    bridge_mappings = parse_bridge_mappings(config('bridge-mappings') or '')
+    if provided_only:
+        bridge_mtus = {}
+        if _neutron_api_provides('global-physnet-mtu'):
+            bridge_mtus = {bridge: global_mtu
+                           for bridge in bridge_mappings.values()}
+    else:
+        bridge_mtus = collections.defaultdict(lambda: global_mtu)
+    for physnet, bridge in bridge_mappings.items():
+        if physnet in physnet_mtus:
+            bridge_mtus[bridge] = physnet_mtus[physnet]
+    return bridge_mtus
+
+
+def dpdk_bridges():
+    '''
+    Names of the bridges with resolved DPDK ports or bonds
+
+    @return: set of bridge names
+    '''
+    bridges = set(resolve_dpdk_bridges().values())
+    portmap = parse_data_port_mappings(config('data-port'))
+    for bond in resolve_dpdk_bonds().values():
+        if bond in portmap:
+            bridges.add(portmap[bond])
+    return bridges
+
+
+TunnelEndpoint = collections.namedtuple(
+    'TunnelEndpoint', ['bridge', 'address', 'routes', 'neighbours'])
+
+
+def _parse_mac(mac):
+    if not MAC_REGEX.match(mac) or len(mac) != 17:
+        raise ValueError(mac)
+    return mac.lower()
+
+
+def _parse_tunnel_pairs(option, parse_key, parse_value):
+    '''Parse a space-delimited list of key=value pairs of option'''
+    pairs = collections.OrderedDict()
+    for entry in (config(option) or '').split():
+        key, _, value = entry.partition('=')
+        try:
+            pairs[parse_key(key)] = parse_value(value)
+        except (netaddr.AddrFormatError, ValueError):
+            raise ValueError('Invalid {} entry: {}'.format(option, entry))
+    return pairs
+
+
+def dpdk_tunnel_endpoint():
+    '''
+    Userspace tunnel endpoint configured on the internal port of the
+    dpdk-tunnel-bridge DPDK bridge
+
+    @return: TunnelEndpoint with the bridge name, the netaddr.IPNetwork
+             address, an OrderedDict of netaddr.IPNetwork destinations to
+             netaddr.IPAddress gateways and an OrderedDict of
+             netaddr.IPAddress neighbours to MAC addresses; or None if not
+             configured
+    @raises ValueError if the configuration is invalid
+    '''
+    bridge = config('dpdk-tunnel-bridge')
+    if not config('enable-dpdk') or not bridge:
+        return None
+    if bridge not in dpdk_bridges():
+        raise ValueError('dpdk-tunnel-bridge {} is not a DPDK bridge'
+                         .format(bridge))
+    address = config('dpdk-tunnel-address') or ''
+    try:
+        if '/' not in address:
+            raise ValueError(address)
+        address = netaddr.IPNetwork(address)
+    except (netaddr.AddrFormatError, ValueError):
+        raise ValueError('Invalid dpdk-tunnel-address: {} (expected an '
+                         'address with prefix length)'.format(address))
+    return TunnelEndpoint(
+        bridge, address,
+        _parse_tunnel_pairs('dpdk-tunnel-routes', netaddr.IPNetwork,
+                            netaddr.IPAddress),
+        _parse_tunnel_pairs('dpdk-tunnel-neighbours', netaddr.IPAddress,
+                            _parse_mac))
 
 
 def parse_cpu_list(cpulist):
@@ -462,53 +1173,469 @@ def numa_node_cores():
     return nodes
 
 
+# Drivers of NICs which DPDK drives alongside the kernel driver
+BIFURCATED_DRIVERS = ('mlx4_core', 'mlx5_core')
+# dpdk-driver-overrides value for devices left bound to the kernel driver
+NO_REBIND_DRIVER = 'none'
+
+
+def parse_dpdk_driver_overrides(overrides):
+    '''
+    Parse dpdk-driver-overrides, a space-delimited list of mac=driver
+
+    @return dict of drivers indexed by lower case mac address
+    @raises ValueError if an entry is invalid
+    '''
+    parsed = {}
+    for entry in (overrides or '').split():
+        mac, _, driver = entry.partition('=')
+        if not MAC_REGEX.match(mac) or len(mac) != 17 or not driver:
+            raise ValueError('Invalid dpdk-driver-overrides entry: {}'
+                             .format(entry))
+        parsed[mac.lower()] = driver
+    return parsed
+
+
+def dpdk_device_drivers():
+    '''
+    Userspace driver to bind each DPDK PCI device to: config:dpdk-driver
+    unless overridden for one of the mac addresses of the device in
+    config:dpdk-driver-overrides. Devices overridden with 'none' or bound
+    to a bifurcated kernel driver keep their kernel driver and are left
+    out.
+
+    @return: OrderedDict of drivers indexed by PCI address.
+    '''
+    try:
+        overrides = parse_dpdk_driver_overrides(
+            config('dpdk-driver-overrides'))
+    except ValueError as e:
+        log('Ignoring DPDK driver overrides: {}'.format(e), level=WARNING)
+        overrides = {}
+    devices = resolve_dpdk_devices()
+    db = kv()
+    pci_overrides = {db.get(mac.lower()): driver
+                     for mac, driver in overrides.items()}
+    drivers = collections.OrderedDict()
+    for device in devices:
+        pci_address = dpdk_device_pci(device)
+        driver = pci_overrides.get(pci_address, config('dpdk-driver'))
+        if (not driver or driver == NO_REBIND_DRIVER or
+                get_pci_driver(pci_address) in BIFURCATED_DRIVERS):
+            continue
+        drivers[pci_address] = driver
+    return drivers
+
+
 class DPDKDeviceContext(OSContextGenerator):
 
     def __call__(self):
-        driver = config('dpdk-driver')
-        if driver is None:
-            return {}
         # Resolve PCI devices for both directly used devices (_bridges)
         # and devices for use in dpdk bonds (_bonds)
-        pci_devices = resolve_dpdk_bridges()
-        pci_devices.update(resolve_dpdk_bonds())
-        return {'devices': pci_devices,
-                'driver': driver}
+        devices = dpdk_device_drivers()
+        if not devices:
+            return {}
+        return {'devices': devices}
+
+
+def cpu_thread_siblings(cpu):
+    '''
+    Hardware threads sharing the physical core of cpu (SMT siblings)
+
+    @return list of cpus including cpu
+    '''
+    try:
+        with open('/sys/devices/system/cpu/cpu{}/topology/'
+                  'thread_siblings_list'.format(cpu)) as siblings:
+            return parse_cpu_list(siblings.read().strip())
+    except (IOError, OSError, ValueError):
+        return [cpu]
+
+
+def physical_cores():
+    '''
+    Dict of numa node -> list of physical cores, each a sorted list of
+    the hardware threads of the core, ordered by their first thread.
+    '''
+    nodes = {}
+    for node, cpus in numa_node_cores().items():
+        cores = set()
+        for cpu in cpus:
+            siblings = set(cpu_thread_siblings(cpu)) & set(cpus)
+            cores.add(tuple(sorted(siblings | {cpu})))
+        nodes[node] = sorted(list(core) for core in cores)
+    return nodes
+
+
+def allocate_dpdk_cpus(lcores, pmd_cores, pmd_nodes=()):
+    '''
+    Allocate cpus to the DPDK lcore and PMD threads of every NUMA node.
+
+    The physical core of CPU 0 is left to the operating system unless it
+    is the only core of its node. lcores are allocated first, from the
+    lowest numbered hardware threads, so that the lcore mask does not
+    depend on device placement. PMDs are allocated whole physical cores
+    not used by lcores, one thread per core, leaving the SMT siblings
+    idle so that no two PMDs share a core. The result only depends on
+    the topology of the unit.
+
+    @param lcores: number of lcore threads per node
+    @param pmd_cores: number of PMD cores per node in pmd_nodes
+    @param pmd_nodes: nodes to allocate PMD cores on
+    @return tuple of sorted lists of lcore and PMD cpus
+    '''
+    lcore_cpus = []
+    pmd_cpus = []
+    for node, cores in sorted(physical_cores().items(),
+                              key=lambda n: int(n[0])):
+        available = [core for core in cores if 0 not in core] or cores
+        threads = [cpu for core in available for cpu in core]
+        node_lcores = threads[:lcores]
+        lcore_cpus.extend(node_lcores)
+        if node in pmd_nodes:
+            free = [core for core in available
+                    if not set(core) & set(node_lcores)]
+            if len(free) < pmd_cores:
+                log('Only {} of {} PMD cores available on NUMA node {}'
+                    .format(len(free), pmd_cores, node), level=WARNING)
+            pmd_cpus.extend(core[0] for core in free[:pmd_cores])
+    return sorted(lcore_cpus), sorted(pmd_cpus)
+
+
+def format_cpu_mask(cpus):
+    '''Hex formatted CPU mask of a list of cpus'''
+    mask = 0
+    for cpu in cpus:
+        mask = mask | 1 << cpu
+    return format(mask, '#04x')
+
+
+def record_legacy_cpu_mask():
+    '''
+    Record the lcore mask of charm releases which used the first
+    config:dpdk-socket-cores cpus of each NUMA node, CPU 0 included.
+
+    Called on upgrade of units with DPDK enabled so that they keep the
+    mask ovs-vswitchd is running with, instead of restarting it to move
+    the lcores off CPU 0, until config:dpdk-socket-cores is changed.
+    Units already running this release have a mask recorded which is
+    left as is.
+    '''
+    db = kv()
+    if db.get(LCORE_MASK_KEY) is not None:
+        return
+    num_cores = config('dpdk-socket-cores')
+    lcores = []
+    for cores in numa_node_cores().values():
+        lcores.extend(cores[:num_cores])
+    db.set(LCORE_MASK_KEY, {'socket-cores': num_cores,
+                            'mask': format_cpu_mask(lcores)})
+    db.flush()
+
+
+HUGEPAGES_NODE_PATH = '/sys/devices/system/node/node{node}/hugepages'
+HUGEPAGE_SIZES = {
+    '2M': 2048,
+    '1G': 1048576,
+}
+
+
+def node_hugepages():
+    '''
+    Dict of numa node -> hugepage size in kB -> dict of the 'total' and
+    'free' number of pages of that size on the node.
+    '''
+    pages = {}
+    for node in numa_node_cores():
+        path = HUGEPAGES_NODE_PATH.format(node=node)
+        sizes = {}
+        try:
+            entries = os.listdir(path)
+        except OSError:
+            entries = []
+        for entry in entries:
+            match = re.match(r'^hugepages-([0-9]+)kB$', entry)
+            if not match:
+                continue
+            sizes[int(match.group(1))] = {
+                'total': int(read_sysfs(
+                    os.path.join(path, entry, 'nr_hugepages')) or 0),
+                'free': int(read_sysfs(
+                    os.path.join(path, entry, 'free_hugepages')) or 0),
+            }
+        pages[node] = sizes
+    return pages
+
+
+def reserve_node_hugepages(node, size_kb, count):
+    '''
+    Set the number of hugepages of size_kb on a numa node.
+
+    The kernel may not be able to reserve all pages, in particular 1G
+    pages once memory is fragmented.
+
+    @return int number of pages reserved
+    '''
+    path = os.path.join(HUGEPAGES_NODE_PATH.format(node=node),
+                        'hugepages-{}kB'.format(size_kb), 'nr_hugepages')
+    with open(path, 'w') as nr_hugepages:
+        nr_hugepages.write(str(count))
+    return int(read_sysfs(path) or 0)
+
+
+def parse_hugepage_reservations(reservations):
+    '''
+    Parse a space-delimited list of [node:]size:count hugepage
+    reservations, e.g. '1G:8 0:2M:1024'.
+
+    @return dict of (node or None for all nodes, size in kB) -> count
+    @raises ValueError on invalid entries
+    '''
+    parsed = {}
+    for entry in (reservations or '').split():
+        fields = entry.split(':')
+        if len(fields) == 2:
+            fields.insert(0, None)
+        if len(fields) != 3 or fields[1].upper() not in HUGEPAGE_SIZES:
+            raise ValueError('Invalid hugepage reservation: {}'
+                             .format(entry))
+        node, size, count = fields
+        if node is not None and not node.isdigit():
+            raise ValueError('Invalid hugepage reservation: {}'
+                             .format(entry))
+        parsed[(node, HUGEPAGE_SIZES[size.upper()])] = int(count)
+    return parsed
+
+
+def pci_numa_node(pci_address):
+    '''
+    NUMA node a PCI device is attached to
+
+    @return str node index or None if the device does not report a node
+    '''
+    try:
+        with open('/sys/bus/pci/devices/{}/numa_node'
+                  .format(dpdk_device_pci(pci_address))) as numa_node:
+            node = int(numa_node.read().strip())
+    except (IOError, OSError, ValueError):
+        return None
+    if node < 0:
+        return None
+    return str(node)
+
+
+EDAC_MC_PATH = '/sys/devices/system/edac/mc'
+# Memory channels assumed by DPDK when none are detected or configured
+DEFAULT_MEMORY_CHANNELS = 4
+MAX_MEMORY_CHANNELS = 32
+IOVA_MODES = ('pa', 'va')
+
+
+def memory_channels():
+    '''
+    Number of populated memory channels per NUMA node, from the DIMM
+    locations reported by the EDAC driver
+
+    @return int number of channels or None if EDAC is not available
+    '''
+    channels = set()
+    for dimm in glob.glob(os.path.join(EDAC_MC_PATH, 'mc*', 'dimm*')):
+        location = re.search(r'channel\s*(\d+)',
+                             read_sysfs(os.path.join(dimm,
+                                                     'dimm_location')) or '')
+        size = read_sysfs(os.path.join(dimm, 'size'))
+        if not location or not size or not size.isdigit() or not int(size):
+            continue
+        channels.add((os.path.dirname(dimm), location.group(1)))
+    if not channels:
+        return None
+    return max(len(channels) // max(len(numa_node_cores()), 1), 1)
+
+
+def validate_eal_config():
+    '''
+    Check the DPDK EAL options of the charm configuration
+
+    @raises ValueError if an option is invalid
+    '''
+    channels = config('dpdk-memory-channels') or 0
+    if not 0 <= channels <= MAX_MEMORY_CHANNELS:
+        raise ValueError('Invalid dpdk-memory-channels: {} (0-{})'
+                         .format(channels, MAX_MEMORY_CHANNELS))
+    iova_mode = config('dpdk-iova-mode')
+    if iova_mode and iova_mode not in IOVA_MODES:
+        raise ValueError('Invalid dpdk-iova-mode: {} (valid: {})'
+                         .format(iova_mode, ', '.join(IOVA_MODES)))
+    huge_dir = config('dpdk-hugepage-dir')
+    if huge_dir and not os.path.isabs(huge_dir):
+        raise ValueError('Invalid dpdk-hugepage-dir: {} is not an absolute '
+                         'path'.format(huge_dir))
+    socket_limit = config('dpdk-socket-limit') or 0
+    if socket_limit and socket_limit < config('dpdk-socket-memory'):
+        raise ValueError('Invalid dpdk-socket-limit: {} is lower than '
+                         'dpdk-socket-memory'.format(socket_limit))
 
 
 class OVSDPDKDeviceContext(OSContextGenerator):
 
     def cpu_mask(self):
         '''
-        Hex formatted CPU mask based on using the first
+        Hex formatted CPU mask based on using
         config:dpdk-socket-cores cores of each NUMA node
-        in the unit.
+        in the unit, as allocated by allocate_dpdk_cpus().
+
+        The mask is recorded in the unit kv store and only reallocated
+        when config:dpdk-socket-cores changes, as ovs-vswitchd only reads
+        it on startup, see record_legacy_cpu_mask().
         '''
         num_cores = config('dpdk-socket-cores')
-        mask = 0
-        for cores in numa_node_cores().values():
-            for core in cores[:num_cores]:
-                mask = mask | 1 << core
-        return format(mask, '#04x')
+        db = kv()
+        recorded = db.get(LCORE_MASK_KEY)
+        if not recorded or recorded['socket-cores'] != num_cores:
+            lcores, _ = allocate_dpdk_cpus(num_cores, 0)
+            recorded = {'socket-cores': num_cores,
+                        'mask': format_cpu_mask(lcores)}
+            db.set(LCORE_MASK_KEY, recorded)
+            db.flush()
+        return recorded['mask']
+
+    def device_numa_nodes(self):
+        '''
+        Sorted list of the NUMA nodes the DPDK devices are attached to;
+        devices which do not report a node are assumed to be local to the
+        first node of the unit.
+        '''
+        device_nodes = set()
+        for device in self.devices():
+            node = self.device_numa_node(device)
+            if node is not None:
+                device_nodes.add(node)
+        return sorted(device_nodes, key=int)
+
+    def device_numa_node(self, pci_address):
+        '''
+        NUMA node of a DPDK device, the first node of the unit if the
+        device does not report one or None if the unit has no NUMA nodes.
+        '''
+        nodes = numa_node_cores()
+        node = pci_numa_node(pci_address)
+        if node not in nodes:
+            node = min(nodes, key=int) if nodes else None
+        return node
+
+    def local_pmd_cores(self, pci_address):
+        '''
+        Number of PMD cores allocated on the NUMA node of a DPDK device
+        '''
+        pmd_cpu_mask = self.pmd_cpu_mask()
+        node = self.device_numa_node(pci_address)
+        if not pmd_cpu_mask or node is None:
+            return 0
+        pmd_cpus = int(pmd_cpu_mask, 16)
+        return len([core for core in numa_node_cores()[node]
+                    if pmd_cpus & 1 << core])
+
+    def pmd_cpu_mask(self):
+        '''
+        Hex formatted CPU mask for the PMD threads using
+        config:dpdk-pmd-cores physical cores on each NUMA node with a
+        DPDK device, as allocated by allocate_dpdk_cpus().
+
+        @return str mask or None if no PMD cores are to be allocated
+        '''
+        num_cores = config('dpdk-pmd-cores')
+        if not num_cores:
+            return None
+        _, pmds = allocate_dpdk_cpus(config('dpdk-socket-cores'),
+                                     num_cores,
+                                     self.device_numa_nodes())
+        if not pmds:
+            return None
+        return format_cpu_mask(pmds)
+
+    def dpdk_numa_nodes(self):
+        '''
+        Sorted list of the NUMA nodes with DPDK devices or PMD cores
+        '''
+        nodes = set(self.device_numa_nodes())
+        pmd_cpu_mask = self.pmd_cpu_mask()
+        if pmd_cpu_mask:
+            pmd_cpus = int(pmd_cpu_mask, 16)
+            for node, cores in numa_node_cores().items():
+                if any(pmd_cpus & 1 << core for core in cores):
+                    nodes.add(node)
+        return sorted(nodes, key=int)
 
     def socket_memory(self):
         '''
         Formatted list of socket memory configuration for dpdk using
-        config:dpdk-socket-memory per NUMA node.
+        config:dpdk-socket-memory on NUMA nodes with DPDK devices or PMD
+        cores and config:dpdk-socket-memory-min on the other nodes.
+        All nodes get config:dpdk-socket-memory if no device is resolved.
         '''
         sm_size = config('dpdk-socket-memory')
-        node_regex = '/sys/devices/system/node/node*'
-        mem_list = [str(sm_size) for _ in glob.glob(node_regex)]
-        if mem_list:
-            return ','.join(mem_list)
-        else:
+        nodes = numa_node_cores()
+        if not nodes:
             return str(sm_size)
+        dpdk_nodes = self.dpdk_numa_nodes() or nodes.keys()
+        min_size = min(config('dpdk-socket-memory-min') or 0, sm_size)
+        mem_list = []
+        # NOTE: socket memory is positional, one entry per node index
+        for node in range(max(int(n) for n in nodes) + 1):
+            if str(node) in dpdk_nodes:
+                mem_list.append(str(sm_size))
+            else:
+                mem_list.append(str(min_size))
+        return ','.join(mem_list)
+
+    def memory_channels(self):
+        '''
+        config:dpdk-memory-channels, or the number of memory channels
+        detected by memory_channels(), or DEFAULT_MEMORY_CHANNELS
+        '''
+        return (config('dpdk-memory-channels') or memory_channels() or
+                DEFAULT_MEMORY_CHANNELS)
+
+    def socket_limit(self):
+        '''
+        Formatted list of the config:dpdk-socket-limit socket memory limit
+        of each NUMA node, or None if memory is not limited
+        '''
+        limit = config('dpdk-socket-limit')
+        if not limit:
+            return None
+        nodes = numa_node_cores()
+        if not nodes:
+            return str(limit)
+        return ','.join([str(limit)] * (max(int(n) for n in nodes) + 1))
+
+    def eal_args(self):
+        '''
+        EAL arguments for the memory channels, IOVA mode, hugepage
+        directory and socket memory limit, rendered alike into DPDK_OPTS
+        and other_config:dpdk-extra. Only the memory channels are passed
+        if the options are invalid, see validate_eal_config().
+
+        :rtype: str
+        '''
+        try:
+            validate_eal_config()
+        except ValueError as e:
+            log('Ignoring DPDK EAL options: {}'.format(e), level=WARNING)
+            return '-n {}'.format(DEFAULT_MEMORY_CHANNELS)
+        args = ['-n {}'.format(self.memory_channels())]
+        if config('dpdk-iova-mode'):
+            args.append('--iova-mode {}'.format(config('dpdk-iova-mode')))
+        if config('dpdk-hugepage-dir'):
+            args.append('--huge-dir {}'.format(config('dpdk-hugepage-dir')))
+        socket_limit = self.socket_limit()
+        if socket_limit:
+            args.append('--socket-limit {}'.format(socket_limit))
+        return ' '.join(args)
 
     def devices(self):
         '''List of PCI devices for use by DPDK'''
-        pci_devices = resolve_dpdk_bridges()
-        pci_devices.update(resolve_dpdk_bonds())
-        return pci_devices
+        return resolve_dpdk_devices()
 
     def _formatted_whitelist(self, flag):
         '''Flag formatted list of devices to whitelist
@@ -518,7 +1645,9 @@ class OVSDPDKDeviceContext(OSContextGenerator):
         :rtype: str
         '''
         whitelist = []
-        for device in self.devices():
+        # NOTE: ports sharing a PCI function are probed once
+        for device in collections.OrderedDict.fromkeys(
+                dpdk_device_pci(device) for device in self.devices()):
             whitelist.append(flag.format(device=device))
         return ' '.join(whitelist)
 
@@ -548,6 +1677,7 @@ class OVSDPDKDeviceContext(OSContextGenerator):
             ctxt['device_whitelist'] = self.device_whitelist()
             ctxt['socket_memory'] = self.socket_memory()
             ctxt['cpu_mask'] = self.cpu_mask()
+            ctxt['eal_args'] = self.eal_args()
         return ctxt
 
 
@@ -641,15 +1771,25 @@ class HostIPContext(context.OSContextGenerator):
         #
         # We do want to migrate to using FQDNs so we enable this for new
         # installations.
+        #
+        # The first FQDN found is recorded in the unit kv store and used
+        # from then on, so a later lookup failure or change in DNS never
+        # removes or changes it.
         db = kv()
         if (db.get('neutron-ovs-charm-use-fqdn', False) and
-                cmp_release >= 'stein' and
-                host_ip):
-            fqdn = socket.getfqdn(host_ip)
-            if '.' in fqdn:
-                # only populate the value if getfqdn() is able to find an
-                # actual FQDN for this host.  If not, we revert back to
-                # not setting the configuration option and use Neutron's
-                # default behaviour.
+                cmp_release >= 'stein'):
+            fqdn = db.get(HOST_FQDN_KEY)
+            if not fqdn and host_ip:
+                fqdn = resolve_fqdn(host_ip)
+                if fqdn and '.' in fqdn:
+                    # only populate the value if getfqdn() is able to find
+                    # an actual FQDN for this host.  If not, we revert back
+                    # to not setting the configuration option and use
+                    # Neutron's default behaviour.
+                    db.set(HOST_FQDN_KEY, fqdn)
+                    db.flush()
+                else:
+                    fqdn = None
+            if fqdn:
                 ctxt['host'] = fqdn
         return ctxt
@@ -31,10 +31,14 @@ from charmhelpers.contrib.openstack.utils import (
 from charmhelpers.core.hookenv import (
     Hooks,
     UnregisteredHookError,
+    atexit,
     config,
+    hook_name,
     log,
     relation_set,
     relation_ids,
+    relation_id as current_relation_id,
+    DEBUG,
 )
 
 from charmhelpers.core.sysctl import create as create_sysctl
@@ -51,6 +55,14 @@ from neutron_ovs_utils import (
     L3HA_PACKAGES,
     METADATA_PACKAGES,
     OVS_DEFAULT,
+    RECONCILE_PACKAGES,
+    RECONCILE_SYSCTL,
+    RECONCILE_OVS,
+    RECONCILE_DPDK,
+    RECONCILE_SRIOV,
+    RECONCILE_TEMPLATES,
+    RECONCILE_RELATIONS,
+    RECONCILE_SUBSYSTEMS,
     configure_ovs,
     configure_sriov,
     get_shared_secret,
@@ -70,13 +82,75 @@ from neutron_ovs_utils import (
     determine_purge_packages,
     install_sriov_systemd_files,
     enable_sriov,
+    use_dpdk,
+    enable_ovs_dpdk,
+    determine_reconcile_subsystems,
+    determine_relation_subsystems,
+    request_full_reconcile,
+    request_full_reconcile_after_reboot,
+    clear_full_reconcile,
 )
 
 import neutron_ovs_context
+from neutron_ovs_profiling import profile_hook
 
 hooks = Hooks()
 CONFIGS = register_configs()
 
+PUBLISHED_RELATION_DATA_KEY = 'neutron-ovs-published-relation-data'
+HOOK_PROFILE_KEY = 'neutron-ovs-hook-profile'
+
+
+def relation_set_if_changed(relation_id=None, **settings):
+    '''Set relation data only if it differs from the data last published
+
+    Every relation_set fires a relation-changed hook on the remote units,
+    so unchanged settings are not published again.
+
+    The published data is recorded in the unit kv store, which is flushed
+    on successful completion of the hook only, as Juju discards the
+    relation data set by a failed hook; a failed hook publishes again on
+    retry. The record is cleared when the relation is broken, see
+    clear_published_relation_data().
+
+    :param relation_id: relation to publish on, defaults to the relation
+                        of the current hook
+    :type relation_id: Optional[str]
+    :param settings: relation settings to publish
+    '''
+    rid = relation_id or current_relation_id()
+    db = kv()
+    published = db.get(PUBLISHED_RELATION_DATA_KEY) or {}
+    previous = published.get(rid) or {}
+    if all(k in previous and previous[k] == v for k, v in settings.items()):
+        log('Relation data for {} unchanged, not publishing'.format(rid),
+            level=DEBUG)
+        return
+    relation_set(relation_id=relation_id, **settings)
+    previous.update(settings)
+    published[rid] = previous
+    db.set(PUBLISHED_RELATION_DATA_KEY, published)
+    atexit(db.flush)
+
+
+def clear_published_relation_data(relation_id=None):
+    '''Forget the data published on a relation
+
+    Relation ids may be reused when a relation is established again, which
+    must publish its data.
+
+    :param relation_id: relation to forget, defaults to the relation of the
+                        current hook
+    :type relation_id: Optional[str]
+    '''
+    rid = relation_id or current_relation_id()
+    db = kv()
+    published = db.get(PUBLISHED_RELATION_DATA_KEY) or {}
+    if published.pop(rid, None) is None:
+        return
+    db.set(PUBLISHED_RELATION_DATA_KEY, published)
+    db.flush()
+
 
 @hooks.hook('install.real')
 def install():
@@ -118,43 +192,99 @@ def upgrade_charm():
     # happens
     if enable_sriov():
         install_sriov_systemd_files()
+    # Keep the DPDK lcore mask of the previous charm release as changing it
+    # requires a restart of ovs-vswitchd.
+    if use_dpdk():
+        neutron_ovs_context.record_legacy_cpu_mask()
+    # New charm code may manage subsystems differently so reconcile
+    # everything on the config-changed hook which follows.
+    request_full_reconcile()
 
 
-@hooks.hook('neutron-plugin-relation-changed')
 @hooks.hook('config-changed')
 @restart_on_change(restart_map())
 def config_changed():
+    # NOTE: juju runs config-changed after a reboot, which loses runtime
+    #       state that is only re-applied by a full reconciliation.
+    request_full_reconcile_after_reboot()
     # if we are paused, delay doing any config changed hooks.
     # It is forced on the resume.
     if is_unit_paused_set():
         log("Unit is pause or upgrading. Skipping config_changed", "WARN")
+        request_full_reconcile()
         return
 
-    install_packages()
-    install_tmpfilesd()
+    reconcile(determine_reconcile_subsystems())
+
+
+@hooks.hook('neutron-plugin-relation-changed')
+@restart_on_change(restart_map())
+def neutron_plugin_changed():
+    request_full_reconcile_after_reboot()
+    if is_unit_paused_set():
+        log("Unit is pause or upgrading. Skipping neutron_plugin_changed",
+            "WARN")
+        request_full_reconcile()
+        return
+
+    reconcile(determine_relation_subsystems('neutron-plugin'))
+
+
+@restart_on_change(restart_map())
+def full_reconcile():
+    '''Reconcile all subsystems regardless of changes'''
+    reconcile(determine_reconcile_subsystems(force=True))
+
+
+def reconcile(subsystems):
+    '''Bring the named subsystems in line with configuration and relations
+
+    :param subsystems: names of the RECONCILE_* subsystems to reconcile
+    :type subsystems: set
+    '''
+    if not subsystems:
+        log('No changes affecting managed subsystems, nothing to reconcile')
+        return
+    log('Reconciling subsystems: {}'.format(', '.join(sorted(subsystems))))
 
-    # NOTE(jamespage): purge any packages as a result of py3 switch
-    #                  at rocky.
-    packages_to_purge = determine_purge_packages()
     request_nova_compute_restart = False
-    if packages_to_purge:
-        purge_packages(packages_to_purge)
-        request_nova_compute_restart = True
+    if RECONCILE_PACKAGES in subsystems:
+        install_packages()
+        install_tmpfilesd()
+
+        # NOTE(jamespage): purge any packages as a result of py3 switch
+        #                  at rocky.
+        packages_to_purge = determine_purge_packages()
+        if packages_to_purge:
+            purge_packages(packages_to_purge)
+            request_nova_compute_restart = True
+    elif RECONCILE_DPDK in subsystems and use_dpdk():
+        # NOTE: install_packages() also enables DPDK in openvswitch
+        enable_ovs_dpdk()
 
     sysctl_settings = config('sysctl')
-    if not is_container() and sysctl_settings:
+    if (RECONCILE_SYSCTL in subsystems and
+            not is_container() and sysctl_settings):
         create_sysctl(sysctl_settings,
                       '/etc/sysctl.d/50-openvswitch.conf')
 
-    configure_ovs()
-    CONFIGS.write_all()
+    if subsystems & {RECONCILE_OVS, RECONCILE_DPDK}:
+        configure_ovs()
+    if RECONCILE_TEMPLATES in subsystems:
+        CONFIGS.write_all()
     # NOTE(fnordahl): configure_sriov must be run after CONFIGS.write_all()
     # to allow us to enable boot time execution of init script
-    configure_sriov()
-    for rid in relation_ids('neutron-plugin'):
-        neutron_plugin_joined(
-            relation_id=rid,
-            request_restart=request_nova_compute_restart)
+    if RECONCILE_SRIOV in subsystems:
+        configure_sriov()
+    if RECONCILE_RELATIONS in subsystems or request_nova_compute_restart:
+        for rid in relation_ids('neutron-plugin'):
+            neutron_plugin_joined(
+                relation_id=rid,
+                request_restart=request_nova_compute_restart)
+    # NOTE: a pending full reconciliation is only satisfied once every
+    #       subsystem has been reconciled.
+    if subsystems >= set(RECONCILE_SUBSYSTEMS):
+        clear_full_reconcile()
 
 
 @hooks.hook('neutron-plugin-api-relation-changed')
@@ -206,16 +336,18 @@ def neutron_plugin_joined(relation_id=None, request_restart=False):
     host = neutron_ovs_context.HostIPContext()().get('host')
     if host:
         rel_data.update({'host': host})
+    # NOTE: restart-nonce is volatile and only published when a restart of
+    #       the principal is actually required.
     if request_restart:
         rel_data['restart-nonce'] = str(uuid.uuid4())
-    relation_set(relation_id=relation_id, **rel_data)
+    relation_set_if_changed(relation_id=relation_id, **rel_data)
 
 
 @hooks.hook('amqp-relation-joined')
 def amqp_joined(relation_id=None):
-    relation_set(relation_id=relation_id,
-                 username=config('rabbit-user'),
-                 vhost=config('rabbit-vhost'))
+    relation_set_if_changed(relation_id=relation_id,
+                            username=config('rabbit-user'),
+                            vhost=config('rabbit-vhost'))
 
 
 @hooks.hook('amqp-relation-changed')
@@ -228,6 +360,12 @@ def amqp_changed():
     CONFIGS.write_all()
 
 
+@hooks.hook('amqp-relation-broken')
+@hooks.hook('neutron-plugin-relation-broken')
+def relation_broken():
+    clear_published_relation_data()
+
+
 @hooks.hook('neutron-control-relation-changed')
 @restart_on_change(restart_map(), stopstart=True)
 def restart_check():
@@ -246,6 +384,7 @@ def post_series_upgrade():
     log("Running complete series upgrade hook", "INFO")
     series_upgrade_complete(
         resume_unit_helper, CONFIGS)
+    request_full_reconcile()
 
 
 @hooks.hook('update-status')
@@ -254,12 +393,32 @@ def dummy_update_status():
     pass
 
 
+def record_hook_profile():
+    '''Record counters gathered during the hook execution in the unit kv
+
+    :returns: the recorded counters
+    :rtype: dict
+    '''
+    profile = {
+        'hook': hook_name(),
+        'dns-blocked-seconds': round(
+            neutron_ovs_context.dns_blocked_time(), 3),
+    }
+    log('Hook profile: {}'.format(profile), level=DEBUG)
+    db = kv()
+    db.set(HOOK_PROFILE_KEY, profile)
+    db.flush()
+    return profile
+
+
 def main():
-    try:
-        hooks.execute(sys.argv)
-    except UnregisteredHookError as e:
-        log('Unknown hook {} - skipping.'.format(e))
-    assess_status(CONFIGS)
+    with profile_hook(hook_name()) as summary:
+        try:
+            hooks.execute(sys.argv)
+        except UnregisteredHookError as e:
+            log('Unknown hook {} - skipping.'.format(e))
+        assess_status(CONFIGS)
+        summary.update(record_hook_profile())
 
 
 if __name__ == '__main__':
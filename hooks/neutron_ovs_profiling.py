@@ -0,0 +1,184 @@
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextlib
+import cProfile
+import gzip
+import json
+import marshal
+import os
+import re
+import time
+import tracemalloc
+
+from charmhelpers.core.hookenv import (
+    config,
+    log,
+    DEBUG,
+    WARNING,
+)
+
+# Directory holding the captured hook profiles
+PROFILE_DIR = '/var/lib/neutron-openvswitch-charm/profiles'
+# Environment flag enabling capture regardless of the profile-hooks option
+PROFILE_ENV = 'NEUTRON_OVS_PROFILE_HOOKS'
+# Number of allocation sites recorded in the profile summary
+TRACEMALLOC_TOP = 25
+
+PROFILE_SUFFIX = '.prof.gz'
+SUMMARY_SUFFIX = '.json'
+PROFILE_NAME_REGEX = re.compile(r'^[0-9]+\.[0-9]{6}-[A-Za-z0-9_.-]+$')
+
+
+def profiling_enabled():
+    '''Determine whether hook executions should be profiled
+
+    :returns: True if enabled by the environment flag or the profile-hooks
+              config option
+    :rtype: bool
+    '''
+    if os.environ.get(PROFILE_ENV, '').lower() in ('1', 'true', 'yes'):
+        return True
+    try:
+        return bool(config('profile-hooks'))
+    except Exception:
+        # config-get is not available outside of a hook context
+        return False
+
+
+def profile_retention():
+    '''Number of profiles kept in the on-disk ring buffer'''
+    try:
+        return max(int(config('profile-hooks-retention') or 0), 1)
+    except Exception:
+        return 1
+
+
+@contextlib.contextmanager
+def profile_hook(hook):
+    '''Capture a cProfile and tracemalloc profile of the enclosed block
+
+    The profile is saved in PROFILE_DIR as a gzip compressed pstats dump
+    (gunzip and load with pstats, snakeviz or flameprof), together with a
+    JSON summary holding the wall time, peak traced memory, the top
+    allocation sites and any counters added by the caller to the yielded
+    dict. Only the newest profile-hooks-retention profiles are kept.
+
+    Nothing is captured unless profiling_enabled() is True.
+
+    :param hook: name of the hook being executed
+    :type hook: str
+    :yields: dict of counters to store in the summary
+    '''
+    summary = {}
+    if not profiling_enabled():
+        yield summary
+        return
+
+    profiler = cProfile.Profile()
+    started_tracemalloc = not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start()
+    start = time.time()
+    profiler.enable()
+    try:
+        yield summary
+    finally:
+        profiler.disable()
+        summary['hook'] = hook
+        summary['started'] = start
+        summary['wall-seconds'] = round(time.time() - start, 3)
+        summary['traced-memory'] = dict(zip(
+            ('current', 'peak'), tracemalloc.get_traced_memory()))
+        summary['top-allocations'] = [
+            str(stat) for stat in
+            tracemalloc.take_snapshot().statistics(
+                'lineno')[:TRACEMALLOC_TOP]]
+        if started_tracemalloc:
+            tracemalloc.stop()
+        try:
+            save_profile(hook, start, profiler, summary)
+            prune_profiles(profile_retention())
+        except (IOError, OSError) as e:
+            log('Unable to save hook profile: {}'.format(e), level=WARNING)
+
+
+def save_profile(hook, start, profiler, summary):
+    '''Write profile and summary of a hook execution to PROFILE_DIR
+
+    :returns: name of the saved profile
+    :rtype: str
+    '''
+    name = '{:.6f}-{}'.format(start, re.sub(r'[^A-Za-z0-9_.-]', '_', hook))
+    if not os.path.isdir(PROFILE_DIR):
+        os.makedirs(PROFILE_DIR, 0o700)
+    profiler.create_stats()
+    with gzip.open(os.path.join(PROFILE_DIR, name + PROFILE_SUFFIX),
+                   'wb') as f:
+        f.write(marshal.dumps(profiler.stats))
+    with open(os.path.join(PROFILE_DIR, name + SUMMARY_SUFFIX), 'w') as f:
+        json.dump(summary, f, sort_keys=True)
+    log('Saved hook profile {}'.format(name), level=DEBUG)
+    return name
+
+
+def _profile_names():
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    return sorted(f[:-len(PROFILE_SUFFIX)] for f in os.listdir(PROFILE_DIR)
+                  if f.endswith(PROFILE_SUFFIX))
+
+
+def prune_profiles(keep):
+    '''Remove all but the newest keep profiles from PROFILE_DIR'''
+    names = _profile_names()
+    for name in names[:max(len(names) - keep, 0)]:
+        for suffix in (PROFILE_SUFFIX, SUMMARY_SUFFIX):
+            path = os.path.join(PROFILE_DIR, name + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def list_profiles():
+    '''List the saved profiles, oldest first
+
+    :returns: summaries of the saved profiles, with the profile name and
+              compressed size added
+    :rtype: List[dict]
+    '''
+    profiles = []
+    for name in _profile_names():
+        try:
+            with open(os.path.join(PROFILE_DIR,
+                                   name + SUMMARY_SUFFIX)) as f:
+                summary = json.load(f)
+        except (IOError, OSError, ValueError):
+            summary = {}
+        summary['name'] = name
+        summary['size'] = os.path.getsize(
+            os.path.join(PROFILE_DIR, name + PROFILE_SUFFIX))
+        summary.pop('top-allocations', None)
+        profiles.append(summary)
+    return profiles
+
+
+def profile_path(name):
+    '''Path of the compressed profile called name
+
+    :raises: ValueError if there is no such profile
+    '''
+    if not PROFILE_NAME_REGEX.match(name or '') or \
+            name not in _profile_names():
+        raise ValueError('No such hook profile: {}'.format(name))
+    return os.path.join(PROFILE_DIR, name + PROFILE_SUFFIX)
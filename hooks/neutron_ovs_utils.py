@@ -15,9 +15,12 @@
 import hashlib
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from itertools import chain
+import multiprocessing
 import shutil
 import subprocess
+import time
 
 from charmhelpers.contrib.openstack.neutron import neutron_plugin_attribute
 from copy import deepcopy
@@ -32,9 +35,14 @@ from charmhelpers.contrib.openstack.utils import (
     remote_restart,
     CompareOpenStackReleases,
     os_release,
+    workload_state_compare,
 )
 from collections import OrderedDict
 import neutron_ovs_context
+from neutron_ovs_context import (
+    ExternalPortContext,
+    DataPortContext,
+)
 from charmhelpers.contrib.network.ovs import (
     add_bridge,
     add_bridge_port,
@@ -48,7 +56,13 @@ from charmhelpers.core.hookenv import (
     config,
     status_set,
     log,
+    relation_get,
+    relation_ids,
+    related_units,
     DEBUG,
+    ERROR,
+    INFO,
+    WARNING,
 )
 from charmhelpers.contrib.openstack.neutron import (
     parse_bridge_mappings,
@@ -56,15 +70,15 @@ from charmhelpers.contrib.openstack.neutron import (
     headers_package,
 )
 from charmhelpers.contrib.openstack.context import (
-    ExternalPortContext,
-    DataPortContext,
     WorkerConfigContext,
     parse_data_port_mappings,
 )
 from charmhelpers.core.host import (
     lsb_release,
     service,
+    service_pause,
     service_restart,
+    service_resume,
     service_running,
     CompareHostReleases,
     init_is_systemd,
@@ -75,6 +89,7 @@ from charmhelpers.core.host import (
 from charmhelpers.core.kernel import (
     modprobe,
 )
+from charmhelpers.core.unitdata import kv
 
 from charmhelpers.fetch import (
     apt_install,
@@ -86,7 +101,14 @@ from charmhelpers.fetch import (
     get_upstream_version
 )
 
-from pci import PCINetDevices
+from pci import (
+    PCINetDevices,
+    bind_pci_devices,
+    get_vf_pci_addresses,
+    get_vf_representors,
+    probe_pci_device,
+    unbind_pci_device,
+)
 
 
 # The interface is said to be satisfied if anyone of the interfaces in the
@@ -187,7 +209,7 @@ BASE_RESOURCE_MAP = OrderedDict([
     }),
     (PHY_NIC_MTU_CONF, {
         'services': ['os-charm-phy-nic-mtu'],
-        'contexts': [context.PhyNICMTUContext()],
+        'contexts': [neutron_ovs_context.PhyNICMTUContext()],
     }),
 ])
 METADATA_RESOURCE_MAP = OrderedDict([
@@ -219,7 +241,7 @@ DVR_RESOURCE_MAP = OrderedDict([
     }),
     (EXT_PORT_CONF, {
         'services': ['neutron-l3-agent'],
-        'contexts': [context.ExternalPortContext()],
+        'contexts': [neutron_ovs_context.ExternalPortContext()],
     }),
 ])
 SRIOV_RESOURCE_MAP = OrderedDict([
@@ -242,6 +264,110 @@ INT_BRIDGE = "br-int"
 EXT_BRIDGE = "br-ex"
 DATA_BRIDGE = 'br-data'
 
+# Subsystems reconciled by the config-changed and neutron-plugin hooks
+RECONCILE_PACKAGES = 'packages'
+RECONCILE_SYSCTL = 'sysctl'
+RECONCILE_OVS = 'ovs'
+RECONCILE_DPDK = 'dpdk'
+RECONCILE_SRIOV = 'sriov'
+RECONCILE_TEMPLATES = 'templates'
+RECONCILE_RELATIONS = 'relations'
+RECONCILE_SUBSYSTEMS = (
+    RECONCILE_PACKAGES,
+    RECONCILE_SYSCTL,
+    RECONCILE_OVS,
+    RECONCILE_DPDK,
+    RECONCILE_SRIOV,
+    RECONCILE_TEMPLATES,
+    RECONCILE_RELATIONS,
+)
+RECONCILE_FORCE_KEY = 'neutron-ovs-reconcile-force'
+BOOT_ID_KEY = 'neutron-ovs-boot-id'
+BOOT_ID_FILE = '/proc/sys/kernel/random/boot_id'
+
+# Subsystems affected by a change of each configuration option; options
+# not listed here only require the configuration files to be re-rendered.
+CONFIG_SUBSYSTEMS = {
+    'enable-dpdk': (RECONCILE_PACKAGES, RECONCILE_OVS, RECONCILE_DPDK,
+                    RECONCILE_TEMPLATES),
+    'enable-sriov': (RECONCILE_PACKAGES, RECONCILE_SRIOV,
+                     RECONCILE_TEMPLATES),
+    'enable-local-dhcp-and-metadata': (RECONCILE_PACKAGES,
+                                       RECONCILE_TEMPLATES,
+                                       RECONCILE_RELATIONS),
+    'firewall-driver': (RECONCILE_PACKAGES, RECONCILE_TEMPLATES),
+    'sysctl': (RECONCILE_SYSCTL,),
+    'data-port': (RECONCILE_OVS, RECONCILE_DPDK, RECONCILE_TEMPLATES),
+    'bridge-mappings': (RECONCILE_OVS, RECONCILE_TEMPLATES),
+    'ext-port': (RECONCILE_OVS, RECONCILE_TEMPLATES),
+    'ipfix-target': (RECONCILE_OVS,),
+    'enable-hardware-offload': (RECONCILE_OVS,),
+    'hw-offload-tc-policy': (RECONCILE_OVS,),
+    'auto-mtu': (RECONCILE_TEMPLATES,),
+    'bond-mappings': (RECONCILE_OVS,),
+    'bond-config': (RECONCILE_OVS,),
+    'dpdk-bond-mappings': (RECONCILE_OVS, RECONCILE_DPDK,
+                           RECONCILE_TEMPLATES),
+    'dpdk-bond-config': (RECONCILE_OVS,),
+    'dpdk-port-queues': (RECONCILE_OVS,),
+    'dpdk-pmd-rxq-affinity': (RECONCILE_OVS,),
+    'dpdk-emc-insert-inv-prob': (RECONCILE_OVS,),
+    'dpdk-smc-enable': (RECONCILE_OVS,),
+    'dpdk-tx-flush-interval': (RECONCILE_OVS,),
+    'ovs-max-idle': (RECONCILE_OVS,),
+    'ovs-flow-limit': (RECONCILE_OVS,),
+    'ovs-n-handler-threads': (RECONCILE_OVS,),
+    'ovs-n-revalidator-threads': (RECONCILE_OVS,),
+    'dpdk-pmd-rxq-assign': (RECONCILE_DPDK,),
+    'dpdk-pmd-auto-lb': (RECONCILE_DPDK,),
+    'dpdk-pmd-auto-lb-load-threshold': (RECONCILE_DPDK,),
+    'dpdk-pmd-auto-lb-improvement-threshold': (RECONCILE_DPDK,),
+    'dpdk-pmd-auto-lb-rebal-interval': (RECONCILE_DPDK,),
+    'dpdk-socket-memory': (RECONCILE_DPDK, RECONCILE_TEMPLATES),
+    'dpdk-socket-memory-min': (RECONCILE_DPDK, RECONCILE_TEMPLATES),
+    'dpdk-memory-channels': (RECONCILE_DPDK, RECONCILE_TEMPLATES),
+    'dpdk-iova-mode': (RECONCILE_DPDK, RECONCILE_TEMPLATES),
+    'dpdk-hugepage-dir': (RECONCILE_DPDK, RECONCILE_TEMPLATES),
+    'dpdk-socket-limit': (RECONCILE_DPDK, RECONCILE_TEMPLATES),
+    'dpdk-per-port-memory': (RECONCILE_DPDK,),
+    'dpdk-userspace-tso': (RECONCILE_DPDK,),
+    'enable-afxdp': (RECONCILE_OVS, RECONCILE_TEMPLATES),
+    'afxdp-mode': (RECONCILE_OVS,),
+    'afxdp-n-rxq': (RECONCILE_OVS,),
+    'dpdk-tunnel-bridge': (RECONCILE_OVS, RECONCILE_TEMPLATES),
+    'dpdk-tunnel-address': (RECONCILE_OVS, RECONCILE_TEMPLATES),
+    'dpdk-tunnel-routes': (RECONCILE_OVS,),
+    'dpdk-tunnel-neighbours': (RECONCILE_OVS,),
+    'dpdk-socket-cores': (RECONCILE_DPDK, RECONCILE_TEMPLATES),
+    'dpdk-pmd-cores': (RECONCILE_DPDK, RECONCILE_TEMPLATES),
+    'dpdk-hugepages': (RECONCILE_DPDK,),
+    # NOTE: only used by assess_status, which runs at the end of every hook
+    'dpdk-guest-hugepage-memory': (),
+    'dpdk-driver': (RECONCILE_DPDK, RECONCILE_TEMPLATES),
+    'dpdk-driver-overrides': (RECONCILE_DPDK, RECONCILE_TEMPLATES),
+    'sriov-device-mappings': (RECONCILE_OVS, RECONCILE_SRIOV,
+                              RECONCILE_TEMPLATES),
+    'sriov-numvfs': (RECONCILE_OVS, RECONCILE_SRIOV, RECONCILE_TEMPLATES),
+    'profile-hooks': (),
+    'profile-hooks-retention': (),
+}
+
+# Subsystems affected by a change of remote unit data on each relation,
+# keyed by relation data key prefix; other keys are ignored.
+RELATION_SUBSYSTEMS = {
+    'neutron-plugin': {
+        'restart-trigger': (RECONCILE_TEMPLATES,),
+        'default_availability_zone': (RECONCILE_TEMPLATES,),
+    },
+}
+
+# Services started before and stopped after all other services on pause
+# and resume; the remaining services are independent of each other.
+BASE_SERVICES = ('openvswitch-switch',)
+# Maximum time in seconds to wait for a service to stop or start
+SERVICE_READY_TIMEOUT = 60
+SERVICE_READY_INTERVAL = 0.5
+
 
 def install_packages():
     apt_update()
@@ -389,10 +515,14 @@ def resource_map():
         if not use_dpdk():
             drop_config.append(DPDK_INTERFACES)
             drop_config.append(OVS_DEFAULT)
-        elif ovs_has_late_dpdk_init():
-            drop_config.append(OVS_DEFAULT)
     else:
         drop_config.extend([OVS_CONF, DPDK_INTERFACES])
+    # NOTE: with late DPDK init the startup-only DPDK settings live in the
+    #       Open_vSwitch table and their restart is deferred by
+    #       enable_ovs_dpdk(); rendering DPDK_OPTS as well would restart
+    #       openvswitch-switch through the restart map.
+    if use_dpdk() and ovs_has_late_dpdk_init():
+        drop_config.append(OVS_DEFAULT)
 
     if enable_sriov():
         sriov_agent_name = 'neutron-sriov-agent'
@@ -441,6 +571,116 @@ def services():
     return list(s_set)
 
 
+def request_full_reconcile():
+    '''Force reconciliation of all subsystems on the next change hook'''
+    db = kv()
+    db.set(RECONCILE_FORCE_KEY, True)
+    db.flush()
+
+
+def clear_full_reconcile():
+    '''Clear any pending request for a full reconciliation'''
+    db = kv()
+    db.set(RECONCILE_FORCE_KEY, False)
+    db.flush()
+
+
+def request_full_reconcile_after_reboot():
+    '''Request a full reconciliation if the unit rebooted since the last call
+
+    Runtime state such as DPDK tunnel endpoints, switchdev modes and
+    hugepage reservations is lost on reboot and only re-applied when the
+    subsystems managing it are reconciled.
+
+    :returns: whether a full reconciliation was requested
+    :rtype: bool
+    '''
+    try:
+        with open(BOOT_ID_FILE) as f:
+            boot_id = f.read().strip()
+    except (IOError, OSError):
+        return False
+    db = kv()
+    previous = db.get(BOOT_ID_KEY)
+    if previous == boot_id:
+        return False
+    if previous is not None:
+        log('Unit rebooted since the last hook, reconciling all subsystems')
+    db.set(BOOT_ID_KEY, boot_id)
+    db.set(RECONCILE_FORCE_KEY, True)
+    db.flush()
+    return True
+
+
+def determine_reconcile_subsystems(force=False):
+    '''
+    Determine the subsystems affected by changes to charm configuration
+    since the last successful hook execution.
+
+    All subsystems are returned until a reconciliation has completed once,
+    when forced by the caller or when a full reconciliation has been
+    requested using request_full_reconcile().
+
+    :param force: reconcile all subsystems regardless of changes
+    :type force: bool
+    :returns: names of the RECONCILE_* subsystems to reconcile
+    :rtype: set
+    '''
+    if force or kv().get(RECONCILE_FORCE_KEY, True):
+        return set(RECONCILE_SUBSYSTEMS)
+    charm_config = config()
+    subsystems = set()
+    for key in charm_config.keys():
+        if charm_config.changed(key):
+            log('Configuration option {} changed'.format(key), level=DEBUG)
+            subsystems.update(
+                CONFIG_SUBSYSTEMS.get(key, (RECONCILE_TEMPLATES,)))
+    return subsystems
+
+
+def determine_relation_subsystems(relation_name):
+    '''
+    Determine the subsystems affected by changes to remote unit data on
+    the named relation since the last hook execution.
+
+    The relation data is recorded in the unit kv store so that the next
+    call only reports subsequent changes. All subsystems are returned while
+    a full reconciliation is pending, so that a relation change does not
+    discard a request made by request_full_reconcile().
+
+    :param relation_name: name of the relation to check
+    :type relation_name: str
+    :returns: names of the RECONCILE_* subsystems to reconcile
+    :rtype: set
+    '''
+    key_subsystems = RELATION_SUBSYSTEMS.get(relation_name, {})
+    relation_data = {}
+    for rid in relation_ids(relation_name):
+        for unit in related_units(rid):
+            for key, value in (relation_get(rid=rid, unit=unit) or
+                               {}).items():
+                if any(key.startswith(k) for k in key_subsystems):
+                    relation_data['{}/{}/{}'.format(rid, unit, key)] = value
+
+    db = kv()
+    prefix = 'reconcile.{}.'.format(relation_name)
+    delta = db.delta(relation_data, prefix)
+    subsystems = set()
+    for changed in delta.keys():
+        key = changed.split('/')[-1]
+        log('Relation data {} changed'.format(changed), level=DEBUG)
+        for key_prefix, affected in key_subsystems.items():
+            if key.startswith(key_prefix):
+                subsystems.update(affected)
+    if delta:
+        db.unsetrange(prefix=prefix)
+        db.update(relation_data, prefix=prefix)
+        db.flush()
+    if db.get(RECONCILE_FORCE_KEY, True):
+        return set(RECONCILE_SUBSYSTEMS)
+    return subsystems
+
+
 def determine_ports():
     """Assemble a list of API ports for services the charm is managing
 
@@ -458,6 +698,31 @@ OVS_DEFAULT_BIN = '/usr/lib/openvswitch-switch/ovs-vswitchd'
 
 
 # TODO(jamespage): rework back to charmhelpers
+def get_Open_vSwitch_column_value(column):
+    """
+    Calls ovs-vsctl and gets the value of column in the Open_vSwitch table.
+
+    :param column: column name, or column:key for map columns
+    :type str
+    :returns: the value of the column or None if it is not set
+    """
+    try:
+        value = subprocess.check_output(
+            ['ovs-vsctl', '--if-exists', 'get', 'Open_vSwitch', '.', column]
+        ).decode('UTF-8').strip()
+    except subprocess.CalledProcessError:
+        return None
+    # NOTE: --if-exists prints nothing for a missing map key
+    if not value:
+        return None
+    # NOTE: ovs-vsctl only quotes strings which are not plain identifiers,
+    #       e.g. "1,2" but cycles or group.
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
 def set_Open_vSwitch_column_value(column, value):
     """
     Calls ovs-vsctl and sets the 'column=value' in the Open_vSwitch table.
@@ -470,13 +735,7 @@ def set_Open_vSwitch_column_value(column, value):
     :returns bool: indicating if a column value was changed
     :raises CalledProcessException: possibly ovsdb-server is not running
     """
-    current_value = None
-    try:
-        current_value = json.loads(subprocess.check_output(
-            ['ovs-vsctl', 'get', 'Open_vSwitch', '.', column]
-        ))
-    except subprocess.CalledProcessError:
-        pass
+    current_value = get_Open_vSwitch_column_value(column)
 
     if current_value != value:
         log('Setting {}:{} in the Open_vSwitch table'.format(column, value))
@@ -487,37 +746,381 @@ def set_Open_vSwitch_column_value(column, value):
     return False
 
 
+def configure_hugepages():
+    '''Reserve the hugepages configured with dpdk-hugepages on each node'''
+    try:
+        reservations = neutron_ovs_context.parse_hugepage_reservations(
+            config('dpdk-hugepages'))
+    except ValueError as e:
+        # NOTE: reported as blocked status by assess_hugepages
+        log(str(e), level=WARNING)
+        return
+    nodes = sorted(neutron_ovs_context.numa_node_cores(), key=int)
+    for (node, size_kb), count in reservations.items():
+        # NOTE: node specific reservations override the global ones
+        if node is None:
+            targets = [n for n in nodes if (n, size_kb) not in reservations]
+        else:
+            targets = [node] if node in nodes else []
+        for target in targets:
+            reserved = neutron_ovs_context.reserve_node_hugepages(
+                target, size_kb, count)
+            if reserved < count:
+                log('Only {} of {} {}kB hugepages reserved on NUMA node {}'
+                    .format(reserved, count, size_kb, target),
+                    level=WARNING)
+
+
+def assess_hugepages(configs):
+    '''Check the hugepages of each NUMA node fit the DPDK socket memory
+    and the expected vhost-user guests memory
+
+    :param configs: a templating.OSConfigRenderer() object
+    :returns: state and message for the workload status, or None, None
+    :rtype: Tuple[Optional[str], Optional[str]]
+    '''
+    if not use_dpdk():
+        return None, None
+    try:
+        neutron_ovs_context.parse_hugepage_reservations(
+            config('dpdk-hugepages'))
+    except ValueError as e:
+        return 'blocked', str(e)
+    socket_memory = neutron_ovs_context.OVSDPDKDeviceContext().socket_memory()
+    guest_memory = config('dpdk-guest-hugepage-memory') or 0
+    hugepages = neutron_ovs_context.node_hugepages()
+    shortfalls = []
+    for node, memory in enumerate(socket_memory.split(',')):
+        if str(node) not in hugepages:
+            continue
+        required = int(memory) + guest_memory
+        available = sum(size_kb * pages['total'] for size_kb, pages in
+                        hugepages[str(node)].items()) // 1024
+        if required > available:
+            shortfalls.append(
+                'node{} needs {}MB ({}MB socket memory + {}MB guests), '
+                'has {}MB'.format(node, required, memory, guest_memory,
+                                  available))
+    if shortfalls:
+        return 'blocked', 'Insufficient hugepages: {}'.format(
+            '; '.join(shortfalls))
+    return None, None
+
+
 def enable_ovs_dpdk():
-    '''Enables the DPDK variant of ovs-vswitchd and restarts it'''
+    '''Enables the DPDK variant of ovs-vswitchd
+
+    ovs-vswitchd is only restarted when DPDK is first initialised; later
+    changes to settings requiring a restart are deferred, see
+    defer_ovs_restart().
+    '''
     subprocess.check_call(UPDATE_ALTERNATIVES + [OVS_DPDK_BIN])
-    values_changed = []
+    configure_hugepages()
+    restart_keys = []
+    dpdk_initialized = False
     if ovs_has_late_dpdk_init():
+        dpdk_initialized = get_Open_vSwitch_column_value(
+            'other_config:dpdk-init') == 'true'
         dpdk_context = neutron_ovs_context.OVSDPDKDeviceContext()
         other_config = OrderedDict([
             ('dpdk-lcore-mask', dpdk_context.cpu_mask()),
             ('dpdk-socket-mem', dpdk_context.socket_memory()),
             ('dpdk-init', 'true'),
         ])
+        dpdk_extra = [dpdk_context.eal_args()]
         if not ovs_vhostuser_client():
-            other_config['dpdk-extra'] = (
-                '--vhost-owner libvirt-qemu:kvm --vhost-perm 0660 ' +
-                dpdk_context.pci_whitelist()
-            )
-        else:
-            other_config['dpdk-extra'] = (
-                dpdk_context.pci_whitelist()
-            )
+            dpdk_extra.append(
+                '--vhost-owner libvirt-qemu:kvm --vhost-perm 0660')
+        dpdk_extra.append(dpdk_context.pci_whitelist())
+        other_config['dpdk-extra'] = ' '.join(filter(None, dpdk_extra))
         other_config['dpdk-init'] = 'true'
-        for column, value in other_config.items():
-            values_changed.append(
-                set_Open_vSwitch_column_value(
-                    'other_config:{}'.format(column),
-                    value
-                )
-            )
-    if ((values_changed and any(values_changed)) and
-            not is_unit_paused_set()):
-        service_restart('openvswitch-switch')
+        other_config['per-port-memory'] = (
+            'true' if config('dpdk-per-port-memory') else None)
+        other_config['userspace-tso-enable'] = (
+            'true' if config('dpdk-userspace-tso') else None)
+        restart_keys = set_ovs_other_config(other_config)
+    pmd_cpu_mask = neutron_ovs_context.OVSDPDKDeviceContext().pmd_cpu_mask()
+    if pmd_cpu_mask:
+        set_ovs_other_config({'pmd-cpu-mask': pmd_cpu_mask})
+    configure_pmd_rxq_scheduling()
+    if restart_keys and not is_unit_paused_set():
+        if dpdk_initialized:
+            defer_ovs_restart(restart_keys)
+        else:
+            # NOTE: no DPDK traffic to interrupt yet
+            service_restart('openvswitch-switch')
+
+
+# other_config keys of the Open_vSwitch table only read by ovs-vswitchd
+# on startup (DPDK EAL and memory initialisation, flow offload); all other
+# keys set by the charm are applied at runtime.
+OVS_RESTART_REQUIRED_KEYS = (
+    'hw-offload',
+    'tc-policy',
+    'dpdk-init',
+    'dpdk-lcore-mask',
+    'dpdk-socket-mem',
+    'dpdk-socket-limit',
+    'dpdk-extra',
+    'dpdk-hugepage-dir',
+    'per-port-memory',
+    'userspace-tso-enable',
+    'vhost-iommu-support',
+)
+OVS_RESTART_PENDING_KEY = 'neutron-ovs-restart-pending'
+
+
+def set_ovs_other_config(values):
+    '''Set other_config keys of the Open_vSwitch table
+
+    :param values: keys and values to set, keys with a None value are
+                   removed
+    :type values: Dict[str, Optional[str]]
+    :returns: changed keys which require an ovs-vswitchd restart
+    :rtype: List[str]
+    '''
+    restart_keys = []
+    for key, value in values.items():
+        column = 'other_config:{}'.format(key)
+        if value is None:
+            changed = get_Open_vSwitch_column_value(column) is not None
+            if changed:
+                remove_Open_vSwitch_column_key('other_config', key)
+        else:
+            changed = set_Open_vSwitch_column_value(column, value)
+        if changed and key in OVS_RESTART_REQUIRED_KEYS:
+            restart_keys.append(key)
+    return restart_keys
+
+
+def defer_ovs_restart(keys):
+    '''Record that ovs-vswitchd must be restarted to apply keys
+
+    The restart drops all traffic on the unit, so it is left to the
+    operator: the unit status reports it until restart_openvswitch() is
+    run by the restart-openvswitch action or the unit is resumed.
+    '''
+    db = kv()
+    pending = set(db.get(OVS_RESTART_PENDING_KEY) or [])
+    pending.update(keys)
+    db.set(OVS_RESTART_PENDING_KEY, sorted(pending))
+    db.flush()
+    log('Deferred openvswitch-switch restart to apply {}'
+        .format(', '.join(sorted(pending))), level=WARNING)
+
+
+def clear_ovs_restart():
+    '''Clear any deferred ovs-vswitchd restart'''
+    db = kv()
+    db.unset(OVS_RESTART_PENDING_KEY)
+    db.flush()
+
+
+def restart_openvswitch():
+    '''Restart ovs-vswitchd to apply deferred settings'''
+    service_restart('openvswitch-switch')
+    clear_ovs_restart()
+    # NOTE: the DPDK tunnel endpoint only lives in the running ovs-vswitchd
+    configure_dpdk_tunnel_endpoint()
+
+
+def assess_ovs_restart(configs):
+    '''Report a deferred ovs-vswitchd restart
+
+    :param configs: a templating.OSConfigRenderer() object
+    :returns: state and message for the workload status, or None, None
+    :rtype: Tuple[Optional[str], Optional[str]]
+    '''
+    pending = kv().get(OVS_RESTART_PENDING_KEY)
+    if pending:
+        return 'blocked', ('openvswitch-switch restart required to apply {}, '
+                           'run the restart-openvswitch action'
+                           .format(', '.join(pending)))
+    return None, None
+
+
+def assess_dpdk_config(configs):
+    '''Check the DPDK options are valid and the devices are bound
+
+    :param configs: a templating.OSConfigRenderer() object
+    :returns: state and message for the workload status, or None, None
+    :rtype: Tuple[Optional[str], Optional[str]]
+    '''
+    if not use_dpdk():
+        return None, None
+    try:
+        neutron_ovs_context.validate_eal_config()
+        neutron_ovs_context.dpdk_tunnel_endpoint()
+        neutron_ovs_context.parse_dpdk_driver_overrides(
+            config('dpdk-driver-overrides'))
+        validate_pmd_rxq_assign()
+    except ValueError as e:
+        return 'blocked', str(e)
+    failures = kv().get(DPDK_BIND_FAILURES_KEY)
+    if failures:
+        return 'blocked', 'DPDK devices not bound: {}'.format(', '.join(
+            '{} ({})'.format(pci_address, reason)
+            for pci_address, reason in sorted(failures.items())))
+    return None, None
+
+
+def assess_afxdp_config(configs):
+    '''Check the AF_XDP options are valid
+
+    :param configs: a templating.OSConfigRenderer() object
+    :returns: state and message for the workload status, or None, None
+    :rtype: Tuple[Optional[str], Optional[str]]
+    '''
+    if not config('enable-afxdp'):
+        return None, None
+    try:
+        neutron_ovs_context.validate_afxdp_config()
+    except ValueError as e:
+        return 'blocked', str(e)
+    return None, None
+
+
+def assess_hw_offload_config(configs):
+    '''Check the hardware offload options are valid
+
+    :param configs: a templating.OSConfigRenderer() object
+    :returns: state and message for the workload status, or None, None
+    :rtype: Tuple[Optional[str], Optional[str]]
+    '''
+    if not config('enable-hardware-offload'):
+        return None, None
+    try:
+        neutron_ovs_context.validate_hw_offload_config()
+    except ValueError as e:
+        return 'blocked', str(e)
+    return None, None
+
+
+def assess_charm_status(configs):
+    '''Charm specific checks of the workload status
+
+    :param configs: a templating.OSConfigRenderer() object
+    :returns: state and message for the workload status, or None, None
+    :rtype: Tuple[Optional[str], Optional[str]]
+    '''
+    state, messages = None, []
+    for check in (assess_hugepages, assess_dpdk_config, assess_afxdp_config,
+                  assess_hw_offload_config, assess_ovs_restart):
+        check_state, check_message = check(configs)
+        if check_state:
+            state = workload_state_compare(state or 'active', check_state)
+            messages.append(check_message)
+    return state, '; '.join(messages) or None
+
+
+PMD_RXQ_ASSIGN_MODES = ('cycles', 'roundrobin', 'group')
+
+
+def validate_pmd_rxq_assign():
+    '''Check dpdk-pmd-rxq-assign is a valid PMD rxq assignment mode
+
+    :raises: ValueError if it is not
+    '''
+    rxq_assign = config('dpdk-pmd-rxq-assign')
+    if rxq_assign and rxq_assign not in PMD_RXQ_ASSIGN_MODES:
+        raise ValueError('Invalid dpdk-pmd-rxq-assign: {} (valid: {})'
+                         .format(rxq_assign, ', '.join(PMD_RXQ_ASSIGN_MODES)))
+
+
+def configure_pmd_rxq_scheduling():
+    '''Configure the PMD rx queue assignment policy and automatic load
+    balancing; both are applied by ovs-vswitchd at runtime. Keys of unset
+    options are removed so that the OVS defaults apply again.'''
+    settings = OrderedDict()
+    try:
+        validate_pmd_rxq_assign()
+        settings['pmd-rxq-assign'] = config('dpdk-pmd-rxq-assign') or None
+    except ValueError as e:
+        # NOTE: reported as blocked status by assess_dpdk_config
+        log('Not configuring PMD rxq assignment: {}'.format(e), level=ERROR)
+    auto_lb = config('dpdk-pmd-auto-lb')
+    settings['pmd-auto-lb'] = 'true' if auto_lb else None
+    for key, option in (
+            ('pmd-auto-lb-load-threshold',
+             'dpdk-pmd-auto-lb-load-threshold'),
+            ('pmd-auto-lb-improvement-threshold',
+             'dpdk-pmd-auto-lb-improvement-threshold'),
+            ('pmd-auto-lb-rebal-interval',
+             'dpdk-pmd-auto-lb-rebal-interval')):
+        settings[key] = str(config(option)) if auto_lb else None
+    set_ovs_other_config(settings)
+
+
+# other_config keys of the Open_vSwitch table managed by
+# configure_datapath_tuning(), mapped to the charm options setting them
+DPDK_DATAPATH_TUNING = OrderedDict([
+    ('emc-insert-inv-prob', 'dpdk-emc-insert-inv-prob'),
+    ('smc-enable', 'dpdk-smc-enable'),
+    ('tx-flush-interval', 'dpdk-tx-flush-interval'),
+])
+DATAPATH_TUNING = OrderedDict([
+    ('max-idle', 'ovs-max-idle'),
+    ('flow-limit', 'ovs-flow-limit'),
+    ('n-handler-threads', 'ovs-n-handler-threads'),
+    ('n-revalidator-threads', 'ovs-n-revalidator-threads'),
+])
+
+
+def datapath_tuning():
+    '''Datapath flow cache and batching settings for the Open_vSwitch table
+
+    Handler and revalidator threads default to the OVS formula applied to
+    the cpus not used by PMD threads: one handler per cpu and one
+    revalidator per 4 cpus plus one.
+
+    :returns: other_config key to value, None for keys left to OVS
+    :rtype: OrderedDict
+    '''
+    settings = OrderedDict()
+    if use_dpdk():
+        for key, option in DPDK_DATAPATH_TUNING.items():
+            value = config(option)
+            if isinstance(value, bool):
+                value = 'true' if value else 'false'
+            settings[key] = None if value is None else str(value)
+    for key, option in DATAPATH_TUNING.items():
+        value = config(option)
+        settings[key] = None if value is None else str(value)
+
+    cpus = sum(len(cores) for cores in
+               neutron_ovs_context.numa_node_cores().values())
+    if not cpus:
+        cpus = multiprocessing.cpu_count()
+    if use_dpdk():
+        pmd_cpu_mask = (neutron_ovs_context.OVSDPDKDeviceContext()
+                        .pmd_cpu_mask())
+        if pmd_cpu_mask:
+            cpus -= bin(int(pmd_cpu_mask, 16)).count('1')
+    cpus = max(cpus, 1)
+    if not settings['n-handler-threads']:
+        settings['n-handler-threads'] = str(cpus)
+    if not settings['n-revalidator-threads']:
+        settings['n-revalidator-threads'] = str(cpus // 4 + 1)
+    return settings
+
+
+def remove_Open_vSwitch_column_key(column, key):
+    '''
+    Remove a key from a map column of the Open_vSwitch table; removing an
+    absent key is a no-op.
+    '''
+    subprocess.check_call(['ovs-vsctl', 'remove', 'Open_vSwitch', '.',
+                           column, key])
+
+
+def configure_datapath_tuning():
+    '''Apply datapath_tuning() to the Open_vSwitch table at runtime'''
+    for key, value in datapath_tuning().items():
+        if value is None:
+            remove_Open_vSwitch_column_key('other_config', key)
+        else:
+            set_Open_vSwitch_column_value('other_config:{}'.format(key),
+                                          value)
 
 
 def install_tmpfilesd():
@@ -557,7 +1160,29 @@ def configure_ovs():
     modern_ovs = ovs_has_late_dpdk_init()
 
     bridgemaps = None
-    if not use_dpdk():
+    if use_afxdp():
+        log('Configuring bridges with AF_XDP', level=DEBUG)
+        bridge_mtus = neutron_ovs_context.resolve_bridge_mtus()
+        bridgemaps = neutron_ovs_context.resolve_afxdp_bridges()
+        log('bridgemaps: {}'.format(bridgemaps), level=DEBUG)
+        try:
+            neutron_ovs_context.validate_afxdp_config()
+        except ValueError as e:
+            # NOTE: reported as blocked status by assess_afxdp_config
+            log('Not adding AF_XDP ports: {}'.format(e), level=ERROR)
+            bridgemaps = {}
+        for interface, br in bridgemaps.items():
+            log('Adding AF_XDP bridge: {}:{}'.format(br, datapath_type),
+                level=DEBUG)
+            add_bridge(br, datapath_type)
+            afxdp_add_bridge_port(br, interface, config('afxdp-mode'),
+                                  config('afxdp-n-rxq'))
+            dpdk_set_mtu_request(interface, bridge_mtus[br])
+    elif not use_dpdk():
+        # NOTE: kernel NICs keep the MTU they were deployed with unless
+        #       neutron-api sets one for their physical network.
+        bridge_mtus = neutron_ovs_context.resolve_bridge_mtus(
+            provided_only=True)
         portmaps = DataPortContext()()
         bridgemaps = parse_bridge_mappings(config('bridge-mappings'))
         for br in bridgemaps.values():
@@ -569,18 +1194,51 @@ def configure_ovs():
                 if _br == br:
                     if not is_linuxbridge_interface(port):
                         add_bridge_port(br, port, promisc=True)
+                        if br in bridge_mtus:
+                            dpdk_set_mtu_request(port, bridge_mtus[br])
                     else:
                         add_ovsbridge_linuxbridge(br, port)
+
+        configure_hardware_offload()
+
+        bondmaps = neutron_ovs_context.resolve_kernel_bonds()
+        log('bondmaps: {}'.format(bondmaps), level=DEBUG)
+        if bondmaps:
+            portmap = parse_data_port_mappings(config('data-port'))
+            bond_configs = DPDKBondsConfig('bond-config')
+            bonds = OrderedDict()
+            for port, bond in bondmaps.items():
+                bonds.setdefault(bond, []).append(port)
+            for bond, ports in bonds.items():
+                if bond not in portmap:
+                    log('Bond {} is not mapped to a bridge in data-port'
+                        .format(bond), level=WARNING)
+                    continue
+                log('Adding bond: {}:{}:{}'.format(portmap[bond], bond,
+                                                   ports),
+                    level=DEBUG)
+                add_bridge(portmap[bond], datapath_type)
+                add_bridge_bond(portmap[bond], bond, ports)
+                if portmap[bond] in bridge_mtus:
+                    dpdk_set_interfaces_mtu(bridge_mtus[portmap[bond]],
+                                            ports)
+                set_bond_config(bond, bond_configs.get_bond_config(bond))
     else:
         log('Configuring bridges with DPDK', level=DEBUG)
-        global_mtu = (
-            neutron_ovs_context.NeutronAPIContext()()['global_physnet_mtu'])
+        bridge_mtus = neutron_ovs_context.resolve_bridge_mtus()
+        queues_config = DPDKPortQueuesConfig()
+        affinity_config = DPDKRxqAffinityConfig()
         # NOTE: when in dpdk mode, add based on pci bus order
         #       with type 'dpdk'
         bridgemaps = neutron_ovs_context.resolve_dpdk_bridges()
         log('bridgemaps: {}'.format(bridgemaps), level=DEBUG)
+        unbound = bind_dpdk_devices()
         device_index = 0
         for pci_address, br in bridgemaps.items():
+            if neutron_ovs_context.dpdk_device_pci(pci_address) in unbound:
+                log('Not adding DPDK port for unbound device {}'
+                    .format(pci_address), level=ERROR)
+                continue
             log('Adding DPDK bridge: {}:{}'.format(br, datapath_type),
                 level=DEBUG)
             add_bridge(br, datapath_type)
@@ -596,10 +1254,10 @@ def configure_ovs():
                 level=DEBUG)
             dpdk_add_bridge_port(br, portname,
                                  pci_address)
-            # TODO(sahid): We should also take into account the
-            # "physical-network-mtus" in case different MTUs are
-            # configured based on physical networks.
-            dpdk_set_mtu_request(portname, global_mtu)
+            dpdk_set_mtu_request(portname, bridge_mtus[br])
+            if modern_ovs:
+                _set_port_queue_options(portname, pci_address,
+                                        queues_config, affinity_config)
             device_index += 1
 
         if modern_ovs:
@@ -611,6 +1269,10 @@ def configure_ovs():
             portmap = parse_data_port_mappings(config('data-port'))
             log('portmap: {}'.format(portmap), level=DEBUG)
             for pci_address, bond in bondmaps.items():
+                if neutron_ovs_context.dpdk_device_pci(pci_address) in unbound:
+                    log('Not adding DPDK bond port for unbound device {}'
+                        .format(pci_address), level=ERROR)
+                    continue
                 if bond in portmap:
                     log('Adding DPDK bridge: {}:{}'.format(portmap[bond],
                                                            datapath_type),
@@ -633,8 +1295,12 @@ def configure_ovs():
                         level=DEBUG)
                     dpdk_add_bridge_bond(br, bond, port_map)
                     dpdk_set_interfaces_mtu(
-                        global_mtu,
+                        bridge_mtus[br],
                         port_map.keys())
+                    for portname, pci_address in port_map.items():
+                        _set_port_queue_options(portname, pci_address,
+                                                queues_config,
+                                                affinity_config)
                     log('Configuring DPDK bond: {}:{}'.format(
                         bond,
                         bond_configs.get_bond_config(bond)),
@@ -644,10 +1310,33 @@ def configure_ovs():
                         bond_configs.get_bond_config(bond)
                     )
 
+        # NOTE: kernel NICs share the netdev datapath of the DPDK bridges
+        #       as br-int is only patched to bridges of its own datapath
+        #       type; ovs-vswitchd serves them in userspace through the
+        #       netdev-linux provider rather than the kernel datapath.
+        kernel_bridges = neutron_ovs_context.resolve_kernel_bridges()
+        log('kernel bridges: {}'.format(kernel_bridges), level=DEBUG)
+        kernel_mtus = neutron_ovs_context.resolve_bridge_mtus(
+            provided_only=True)
+        for br in parse_bridge_mappings(config('bridge-mappings')).values():
+            add_bridge(br, datapath_type)
+        for port, br in kernel_bridges.items():
+            add_bridge(br, datapath_type)
+            if not is_linuxbridge_interface(port):
+                add_bridge_port(br, port, promisc=True)
+            else:
+                add_ovsbridge_linuxbridge(br, port)
+            if br in kernel_mtus:
+                dpdk_set_mtu_request(port, kernel_mtus[br])
+        bridgemaps = OrderedDict(bridgemaps)
+        bridgemaps.update(kernel_bridges)
+
+        configure_dpdk_tunnel_endpoint()
+
     target = config('ipfix-target')
     bridges = [INT_BRIDGE, EXT_BRIDGE]
     if bridgemaps:
-        bridges.extend(bridgemaps.values())
+        bridges.extend(OrderedDict.fromkeys(bridgemaps.values()))
 
     if target:
         for bridge in bridges:
@@ -659,6 +1348,8 @@ def configure_ovs():
         for bridge in bridges:
             disable_ipfix(bridge)
 
+    configure_datapath_tuning()
+
     # Ensure this runs so that mtu is applied to data-port interfaces if
     # provided.
     # NOTE(ajkavanagh) for pause/resume we don't gate this as it's not a
@@ -666,6 +1357,122 @@ def configure_ovs():
     service_restart('os-charm-phy-nic-mtu')
 
 
+DPDK_BIND_FAILURES_KEY = 'neutron-ovs-dpdk-bind-failures'
+
+
+def bind_dpdk_devices():
+    '''Bind the DPDK devices to their userspace drivers
+
+    Failures are recorded for assess_dpdk_config to report.
+
+    :returns: reason each device failed to bind indexed by PCI address
+    :rtype: Dict[str, str]
+    '''
+    drivers = neutron_ovs_context.dpdk_device_drivers()
+    failures = bind_pci_devices(drivers)
+    for pci_address, driver in drivers.items():
+        if pci_address in failures:
+            log('Unable to bind DPDK device {} to {}: {}'.format(
+                pci_address, driver, failures[pci_address]), level=ERROR)
+        else:
+            log('DPDK device {} bound to {}'.format(pci_address, driver),
+                level=DEBUG)
+    db = kv()
+    db.set(DPDK_BIND_FAILURES_KEY, failures)
+    db.flush()
+    return failures
+
+
+def _set_port_queue_options(portname, pci_address, queues_config,
+                            affinity_config):
+    # NOTE: queue options and affinity no longer configured for the port
+    #       are removed so that the OVS defaults apply again.
+    configured = dpdk_port_queue_options(pci_address, queues_config)
+    if configured:
+        log('Setting DPDK port queues: {}:{}'.format(portname,
+                                                     dict(configured)),
+            level=DEBUG)
+    dpdk_set_interface_options(portname, OrderedDict(
+        (key, configured.get(key)) for key in DPDKPortQueuesConfig.KEYS))
+    affinity = affinity_config.get_port_affinity(pci_address)
+    if affinity:
+        log('Setting DPDK port rxq affinity: {}:{}'.format(portname,
+                                                           affinity),
+            level=DEBUG)
+    dpdk_set_interface_other_config(portname, 'pmd-rxq-affinity',
+                                    affinity or None)
+
+
+DPDK_TUNNEL_ADDRESS_KEY = 'neutron-ovs-dpdk-tunnel-address'
+DPDK_TUNNEL_ROUTES_KEY = 'neutron-ovs-dpdk-tunnel-routes'
+DPDK_TUNNEL_NEIGHBOURS_KEY = 'neutron-ovs-dpdk-tunnel-neighbours'
+
+
+def configure_dpdk_tunnel_endpoint():
+    '''Configure the userspace tunnel endpoint on a DPDK bridge
+
+    The dpdk-tunnel-address is assigned to the internal port of the
+    dpdk-tunnel-bridge, so overlay traffic is encapsulated by the userspace
+    datapath, and the routes and neighbours used by the OVS userspace
+    tunnel stack are installed with ovs-appctl.
+
+    The address, routes and neighbours installed are recorded in the unit
+    kv store so that those no longer configured are removed again.
+    '''
+    try:
+        endpoint = neutron_ovs_context.dpdk_tunnel_endpoint()
+    except ValueError as e:
+        # NOTE: reported as blocked status by assess_dpdk_config
+        log('Not configuring DPDK tunnel endpoint: {}'.format(e),
+            level=ERROR)
+        return
+    address = None
+    routes = []
+    neighbours = []
+    if endpoint:
+        address = [endpoint.bridge, str(endpoint.address)]
+        routes.append([str(endpoint.address.cidr), endpoint.bridge])
+        routes.extend([str(destination), endpoint.bridge, str(gateway)]
+                      for destination, gateway in endpoint.routes.items())
+        neighbours.extend([endpoint.bridge, str(neighbour), mac]
+                          for neighbour, mac in endpoint.neighbours.items())
+
+    db = kv()
+    previous = db.get(DPDK_TUNNEL_ADDRESS_KEY)
+    if previous and previous != address:
+        log('Removing DPDK tunnel endpoint {1} from {0}'.format(*previous),
+            level=DEBUG)
+        subprocess.call(['ip', 'addr', 'del', previous[1],
+                         'dev', previous[0]])
+    for route in db.get(DPDK_TUNNEL_ROUTES_KEY) or []:
+        if route not in routes:
+            log('Removing DPDK tunnel route {}'.format(' '.join(route)),
+                level=DEBUG)
+            subprocess.call(['ovs-appctl', 'ovs/route/del', route[0]])
+    if any(neighbour not in neighbours
+           for neighbour in db.get(DPDK_TUNNEL_NEIGHBOURS_KEY) or []):
+        # NOTE: the tunnel neighbour cache can only be flushed as a whole,
+        #       the configured neighbours are set again below.
+        log('Flushing DPDK tunnel neighbours', level=DEBUG)
+        subprocess.call(['ovs-appctl', 'tnl/neigh/flush'])
+    db.set(DPDK_TUNNEL_ADDRESS_KEY, address)
+    db.set(DPDK_TUNNEL_ROUTES_KEY, routes)
+    db.set(DPDK_TUNNEL_NEIGHBOURS_KEY, neighbours)
+    db.flush()
+    if not endpoint:
+        return
+
+    log('Configuring DPDK tunnel endpoint {} on {}'.format(
+        endpoint.address, endpoint.bridge), level=DEBUG)
+    subprocess.check_call(['ip', 'addr', 'replace', str(endpoint.address),
+                           'dev', endpoint.bridge])
+    subprocess.check_call(['ip', 'link', 'set', 'dev', endpoint.bridge, 'up'])
+    for route in routes:
+        subprocess.check_call(['ovs-appctl', 'ovs/route/add'] + route)
+    for neighbour in neighbours:
+        subprocess.check_call(['ovs-appctl', 'tnl/neigh/set'] + neighbour)
+
+
 def _get_interfaces_from_mappings(sriov_mappings):
     """Returns list of interfaces based on sriov-device-mappings"""
     interfaces = []
@@ -677,23 +1484,13 @@ def _get_interfaces_from_mappings(sriov_mappings):
     return interfaces
 
 
-def configure_sriov():
-    '''Configure SR-IOV devices based on provided configuration options
-
-    NOTE(fnordahl): Boot time configuration is done by init script
-    intalled by this charm.
+def configure_sriov_vfs(devices):
+    '''Create the Virtual Functions of SR-IOV devices as set in sriov-numvfs
 
-    This function only does runtime configuration!
+    :param devices: the PCI network devices of the unit
+    :type devices: PCINetDevices
     '''
     charm_config = config()
-    if not enable_sriov():
-        return
-
-    install_sriov_systemd_files()
-    # make sure that boot time execution is enabled
-    service('enable', 'neutron-openvswitch-networking-sriov')
-
-    devices = PCINetDevices()
     sriov_numvfs = charm_config.get('sriov-numvfs')
 
     # automatic configuration of all SR-IOV devices
@@ -750,6 +1547,24 @@ def configure_sriov():
                         "VF's".format(device.interface_name, numvfs))
                     device.set_sriov_numvfs(int(numvfs))
 
+
+def configure_sriov():
+    '''Configure SR-IOV devices based on provided configuration options
+
+    NOTE(fnordahl): Boot time configuration is done by init script
+    intalled by this charm.
+
+    This function only does runtime configuration!
+    '''
+    if not enable_sriov():
+        return
+
+    install_sriov_systemd_files()
+    # make sure that boot time execution is enabled
+    service('enable', 'neutron-openvswitch-networking-sriov')
+
+    configure_sriov_vfs(PCINetDevices())
+
     # Trigger remote restart in parent application
     remote_restart('neutron-plugin', 'nova-compute')
 
@@ -763,6 +1578,147 @@ def configure_sriov():
         service_restart('neutron-plugin-sriov-agent')
 
 
+HW_OFFLOAD_SWITCHDEV_KEY = 'neutron-ovs-hw-offload-switchdev'
+
+
+def get_eswitch_mode(pci_address):
+    '''Get the devlink eswitch mode of a PF
+
+    :returns: legacy, switchdev or None if the device has no eswitch
+    :rtype: Optional[str]
+    '''
+    device = 'pci/{}'.format(pci_address)
+    try:
+        output = subprocess.check_output(
+            ['devlink', '-j', 'dev', 'eswitch', 'show', device],
+            stderr=subprocess.STDOUT).decode('UTF-8')
+        return json.loads(output)['dev'][device]['mode']
+    except (subprocess.CalledProcessError, ValueError, KeyError):
+        return None
+
+
+def set_eswitch_mode(pci_address, mode):
+    '''Set the devlink eswitch mode of a PF'''
+    subprocess.check_call(['devlink', 'dev', 'eswitch', 'set',
+                           'pci/{}'.format(pci_address), 'mode', mode])
+
+
+def _change_eswitch_mode(pci_address, mode):
+    '''Change the eswitch mode of a PF with its VFs unbound
+
+    The VFs are unbound while the mode is changed, as required by the
+    drivers, and probed again afterwards.
+    '''
+    vfs = get_vf_pci_addresses(pci_address)
+    for vf in vfs:
+        unbind_pci_device(vf)
+    try:
+        set_eswitch_mode(pci_address, mode)
+    finally:
+        for vf in vfs:
+            probe_pci_device(vf)
+
+
+def enable_switchdev(pci_address):
+    '''Put the eswitch of a PF in switchdev mode
+
+    :returns: whether the mode was changed
+    :rtype: bool
+    '''
+    if get_eswitch_mode(pci_address) == 'switchdev':
+        return False
+    _change_eswitch_mode(pci_address, 'switchdev')
+    return True
+
+
+def disable_switchdev(pci_address):
+    '''Put the eswitch of a PF in switchdev mode back in legacy mode
+
+    :returns: whether the mode was changed
+    :rtype: bool
+    '''
+    if get_eswitch_mode(pci_address) != 'switchdev':
+        return False
+    _change_eswitch_mode(pci_address, 'legacy')
+    return True
+
+
+def _restore_legacy_eswitch(pci_addresses):
+    '''Put PFs the charm put in switchdev mode back in legacy mode'''
+    for pci_address in pci_addresses:
+        if disable_switchdev(pci_address):
+            log('Restored legacy eswitch mode on {}'.format(pci_address),
+                level=INFO)
+
+
+def configure_hardware_offload():
+    '''Offload the flows of the kernel datapath to switchdev capable NICs
+
+    The VFs of the SR-IOV devices in sriov-device-mappings are created and
+    their eswitch put in switchdev mode. The PFs, which become uplink
+    representors, are attached to the bridge of their physical network.
+    VF representors are brought up and plugged into br-int by os-vif when
+    a VF is bound to an instance port. Enabling or disabling hw-offload
+    only takes effect once openvswitch-switch is restarted.
+
+    The PFs put in switchdev mode are recorded in the unit kv store, and
+    put back in legacy mode when they are no longer offloaded. The mode is
+    lost on reboot and applied again by the full reconciliation which
+    follows it.
+    '''
+    db = kv()
+    previous = db.get(HW_OFFLOAD_SWITCHDEV_KEY) or []
+    if not use_hw_offload():
+        _restore_legacy_eswitch(previous)
+        db.set(HW_OFFLOAD_SWITCHDEV_KEY, [])
+        db.flush()
+        restart_keys = set_ovs_other_config(OrderedDict([
+            ('hw-offload', None),
+            ('tc-policy', None),
+        ]))
+        if restart_keys:
+            defer_ovs_restart(restart_keys)
+        return
+    try:
+        neutron_ovs_context.validate_hw_offload_config()
+    except ValueError as e:
+        # NOTE: reported as blocked status by assess_hw_offload_config
+        log('Not configuring hardware offload: {}'.format(e), level=ERROR)
+        return
+
+    devices = PCINetDevices()
+    configure_sriov_vfs(devices)
+    bridges = parse_bridge_mappings(config('bridge-mappings'))
+    switchdev = []
+    for token in config('sriov-device-mappings').split():
+        physnet, interface = token.split(':')
+        device = devices.get_device_from_interface_name(interface)
+        if not device or not device.sriov:
+            log('Not offloading {}: not an SR-IOV device'.format(interface),
+                level=WARNING)
+            continue
+        if enable_switchdev(device.pci_address):
+            log('Enabled switchdev mode on {}'.format(interface), level=INFO)
+        switchdev.append(device.pci_address)
+        if physnet in bridges:
+            add_bridge(bridges[physnet], determine_datapath_type())
+            add_bridge_port(bridges[physnet], interface, promisc=True)
+        for representor in get_vf_representors(interface).values():
+            subprocess.check_call(['ip', 'link', 'set', representor, 'up'])
+    _restore_legacy_eswitch(
+        [pci_address for pci_address in previous
+         if pci_address not in switchdev])
+    db.set(HW_OFFLOAD_SWITCHDEV_KEY, switchdev)
+    db.flush()
+
+    restart_keys = set_ovs_other_config(OrderedDict([
+        ('hw-offload', 'true'),
+        ('tc-policy', config('hw-offload-tc-policy')),
+    ]))
+    if restart_keys:
+        defer_ovs_restart(restart_keys)
+
+
 def get_shared_secret():
     ctxt = neutron_ovs_context.SharedSecretContext()()
     if 'shared_secret' in ctxt:
@@ -783,7 +1739,7 @@ def determine_datapath_type():
 
     @returns string containing the datapath type
     '''
-    if use_dpdk():
+    if use_dpdk() or use_afxdp():
         return 'netdev'
     return 'system'
 
@@ -795,6 +1751,22 @@ def use_dpdk():
     return (cmp_release >= 'mitaka' and config('enable-dpdk'))
 
 
+def use_hw_offload():
+    '''Determine whether OVS hardware offload should be used'''
+    cmp_release = CompareOpenStackReleases(
+        os_release('neutron-common', base='icehouse'))
+    return (cmp_release >= 'queens' and config('enable-hardware-offload')
+            and not use_dpdk() and not use_afxdp())
+
+
+def use_afxdp():
+    '''Determine whether the AF_XDP userspace datapath should be used'''
+    cmp_release = CompareOpenStackReleases(
+        os_release('neutron-common', base='icehouse'))
+    return (cmp_release >= 'mitaka' and config('enable-afxdp') and
+            not config('enable-dpdk'))
+
+
 def ovs_has_late_dpdk_init():
     ''' OVS 2.6.0 introduces late initialization '''
     import apt_pkg
@@ -821,6 +1793,16 @@ def enable_sriov():
 
 
 # TODO: update into charm-helpers to add port_type parameter
+def afxdp_add_bridge_port(name, port, xdp_mode, n_rxq):
+    ''' Add an AF_XDP port to the named openvswitch bridge '''
+    cmd = ["ovs-vsctl", "--",
+           "--may-exist", "add-port", name, port,
+           "--", "set", "Interface", port, "type=afxdp",
+           "options:xdp-mode={}".format(xdp_mode),
+           "options:n_rxq={}".format(n_rxq)]
+    subprocess.check_call(cmd)
+
+
 def dpdk_add_bridge_port(name, port, pci_address=None):
     ''' Add a port to the named openvswitch bridge '''
     # log('Adding port {} to bridge {}'.format(port, name))
@@ -853,21 +1835,105 @@ def dpdk_add_bridge_bond(bridge_name, bond_name, port_map):
     subprocess.check_call(cmd)
 
 
+def add_bridge_bond(bridge_name, bond_name, ports):
+    '''Add kernel network interfaces to a bond attached to the named
+    openvswitch bridge
+
+    Members are brought up in promiscuous mode, as are single data ports.
+    '''
+    subprocess.check_call(["ovs-vsctl", "--may-exist", "add-bond",
+                           bridge_name, bond_name] + list(ports))
+    for port in ports:
+        subprocess.check_call(["ip", "link", "set", port, "up"])
+        subprocess.check_call(["ip", "link", "set", port, "promisc", "on"])
+
+
 def dpdk_set_bond_config(bond_name, config):
     if not ovs_has_late_dpdk_init():
         raise Exception("Bonds are not supported for OVS pre-2.6.0")
+    set_bond_config(bond_name, config)
+
 
+def set_bond_config(bond_name, config):
+    '''Apply a configuration parsed by DPDKBondsConfig to a bond'''
     cmd = ["ovs-vsctl",
            "--", "set", "port", bond_name,
            "bond_mode={}".format(config['mode']),
            "--", "set", "port", bond_name,
            "lacp={}".format(config['lacp']),
            "--", "set", "port", bond_name,
-           "other_config:lacp-time=={}".format(config['lacp-time']),
+           "other_config:lacp-time={}".format(config['lacp-time']),
            ]
+    # NOTE: options left out of dpdk-bond-config are reset so that
+    #       removing them from the config reverts to the OVS defaults.
+    for option, column in DPDKBondsConfig.BOND_COLUMNS.items():
+        cmd.extend(["--", "set", "port", bond_name,
+                    "{}={}".format(column, config.get(option, 0))])
+    for option, key in DPDKBondsConfig.BOND_OTHER_CONFIG.items():
+        if option in config:
+            cmd.extend(["--", "set", "port", bond_name,
+                        "other_config:{}={}".format(key, config[option])])
+        else:
+            cmd.extend(["--", "remove", "port", bond_name,
+                        "other_config", key])
+    subprocess.check_call(cmd)
+
+
+def dpdk_set_interface_options(port, options):
+    '''Set options of a DPDK interface
+
+    :param port: name of the interface
+    :type port: str
+    :param options: option names and values, options with a None value
+                    are removed
+    :type options: Dict[str, Optional[Union[str, int]]]
+    '''
+    cmd = ["ovs-vsctl"]
+    values = ["options:{}={}".format(option, value)
+              for option, value in options.items() if value is not None]
+    if values:
+        cmd.extend(["--", "set", "Interface", port] + values)
+    for option, value in options.items():
+        if value is None:
+            cmd.extend(["--", "remove", "Interface", port, "options",
+                        option])
     subprocess.check_call(cmd)
 
 
+def dpdk_set_interface_other_config(port, key, value):
+    '''Set an other_config key of a DPDK interface, or remove it if value
+    is None'''
+    if value is None:
+        cmd = ["ovs-vsctl", "remove", "Interface", port, "other_config",
+               key]
+    else:
+        cmd = ["ovs-vsctl", "set", "Interface", port,
+               'other_config:{}="{}"'.format(key, value)]
+    subprocess.check_call(cmd)
+
+
+def dpdk_port_queue_options(pci_address, queues_config):
+    '''Interface options for the rx and tx queues of a DPDK device
+
+    :param pci_address: PCI address of the device
+    :type pci_address: str
+    :param queues_config: the parsed dpdk-port-queues option
+    :type queues_config: DPDKPortQueuesConfig
+    :returns: options to set on the interface
+    :rtype: OrderedDict
+    '''
+    port_config = queues_config.get_port_config(pci_address)
+    options = OrderedDict()
+    for key in DPDKPortQueuesConfig.KEYS:
+        value = port_config.get(key)
+        if value == DPDKPortQueuesConfig.AUTO:
+            value = (neutron_ovs_context.OVSDPDKDeviceContext()
+                     .local_pmd_cores(pci_address))
+        if value:
+            options[key] = value
+    return options
+
+
 def dpdk_set_mtu_request(port, mtu):
     cmd = ["ovs-vsctl", "set", "Interface", port,
            "mtu_request={}".format(mtu)]
@@ -930,41 +1996,129 @@ def assess_status_func(configs):
         required_interfaces['neutron-plugin-api'] = ['neutron-plugin-api']
     return make_assess_status_func(
         configs, required_interfaces,
+        charm_func=assess_charm_status,
         services=services(), ports=None)
 
 
-def pause_unit_helper(configs):
+def pause_unit_helper(configs, timings=None):
     """Helper function to pause a unit, and then call assess_status(...) in
     effect, so that the status is correctly updated.
     Uses charmhelpers.contrib.openstack.utils.pause_unit() to do the work.
     @param configs: a templating.OSConfigRenderer() object
+    @param timings: OPTIONAL dict updated with the seconds taken to stop
+                    each service
     @returns None - this function is executed for its side-effect
     """
-    _pause_resume_helper(pause_unit, configs)
+    _pause_resume_helper(pause_unit, configs, 'pause', timings)
 
 
-def resume_unit_helper(configs):
+def resume_unit_helper(configs, timings=None):
     """Helper function to resume a unit, and then call assess_status(...) in
     effect, so that the status is correctly updated.
     Uses charmhelpers.contrib.openstack.utils.resume_unit() to do the work.
     @param configs: a templating.OSConfigRenderer() object
+    @param timings: OPTIONAL dict updated with the seconds taken to start
+                    each service
     @returns None - this function is executed for its side-effect
     """
-    _pause_resume_helper(resume_unit, configs)
+    _pause_resume_helper(resume_unit, configs, 'resume', timings)
 
 
-def _pause_resume_helper(f, configs):
+def _pause_resume_helper(f, configs, action, timings=None):
     """Helper function that uses the make_assess_status_func(...) from
     charmhelpers.contrib.openstack.utils to create an assess_status(...)
     function that can be used with the pause/resume of the unit
     @param f: the function to be used with the assess_status(...) function
+    @param action: 'pause' or 'resume', applied to the services of the unit
+                   by manage_services_parallel()
+    @param timings: OPTIONAL dict updated with the per service timings
     @returns None - this function is executed for its side-effect
     """
+    if timings is None:
+        timings = {}
+
+    def _charm_func():
+        message = manage_services_parallel(action, services(), timings)
+        # NOTE: openvswitch-switch has been started with the current
+        #       settings, any deferred restart is cleared before the status
+        #       of the unit is assessed, and the DPDK tunnel endpoint lost
+        #       when ovs-vswitchd stopped is configured again.
+        if action == 'resume' and service_running('openvswitch-switch'):
+            clear_ovs_restart()
+            configure_dpdk_tunnel_endpoint()
+        return message
+
     # TODO(ajkavanagh) - ports= has been left off because of the race hazard
     # that exists due to service_start()
+    # NOTE: services are handed to charm_func rather than services= so
+    #       that they are stopped and started concurrently.
     f(assess_status_func(configs),
-      services=services(),
-      ports=None)
+      services=None,
+      ports=None,
+      charm_func=_charm_func)
+
+
+def wait_for_service(service_name, running, timeout=None):
+    """Wait for a service to reach the wanted state
+    @param service_name: name of the service
+    @param running: True to wait for the service to run, False to wait for
+                    it to stop
+    @param timeout: maximum seconds to wait, defaults to
+                    SERVICE_READY_TIMEOUT
+    @returns True if the service reached the wanted state in time
+    """
+    if timeout is None:
+        timeout = SERVICE_READY_TIMEOUT
+    deadline = time.time() + timeout
+    while service_running(service_name) != running:
+        if time.time() >= deadline:
+            return False
+        time.sleep(SERVICE_READY_INTERVAL)
+    return True
+
+
+def _manage_service(action, service_name):
+    start = time.time()
+    if action == 'pause':
+        ok = service_pause(service_name)
+    else:
+        ok = service_resume(service_name)
+    ok = wait_for_service(service_name, action == 'resume') and ok
+    return ok, time.time() - start
+
+
+def manage_services_parallel(action, service_names, timings=None):
+    """Pause or resume services concurrently
+    BASE_SERVICES are resumed before and paused after the other services,
+    which are handled concurrently. Each service is waited for until it
+    has reached the wanted state or SERVICE_READY_TIMEOUT has expired.
+    @param action: 'pause' or 'resume'
+    @param service_names: list of services to act on
+    @param timings: OPTIONAL dict updated with the seconds taken by each
+                    service
+    @returns None on success, else a message listing the failed services,
+             as expected of a pause_unit/resume_unit charm_func
+    """
+    if timings is None:
+        timings = {}
+    base = [s for s in service_names if s in BASE_SERVICES]
+    others = [s for s in service_names if s not in BASE_SERVICES]
+    stages = [base, others] if action == 'resume' else [others, base]
+    messages = []
+    for stage in stages:
+        if not stage:
+            continue
+        with ThreadPoolExecutor(max_workers=len(stage)) as executor:
+            results = list(executor.map(
+                lambda s: _manage_service(action, s), stage))
+        for service_name, (ok, seconds) in zip(stage, results):
+            timings[service_name] = round(seconds, 2)
+            if not ok:
+                messages.append("{} didn't {} cleanly.".format(service_name,
+                                                               action))
+    log('Service {} timings: {}'.format(action, timings), level=INFO)
+    if messages:
+        return " ".join(messages)
 
 
 class DPDKBridgeBondMap():
@@ -983,12 +2137,124 @@ class DPDKBridgeBondMap():
         return list(self.map.items())
 
 
-class DPDKBondsConfig():
+class DPDKPortQueuesConfig():
     '''
-    A class to parse dpdk-bond-config into a dictionary and
+    A class to parse dpdk-port-queues into a dictionary and
     provide a convenient config get interface.
     '''
 
+    ALL_PORTS = 'ALL_PORTS'
+    AUTO = 'auto'
+    KEYS = ('n_rxq', 'n_rxq_desc', 'n_txq_desc')
+    MAX_DESCRIPTORS = 4096
+
+    def __init__(self):
+
+        self.queue_config = {}
+
+        queue_config = config('dpdk-port-queues')
+        if queue_config:
+            for entry in queue_config.split():
+                port, _, entry = entry.rpartition('=')
+                if not port:
+                    port = self.ALL_PORTS
+
+                values = entry.split(':')
+                assert len(values) <= len(self.KEYS), \
+                    "Port queues {} are invalid".format(entry)
+
+                settings = {}
+                for key, value in zip(self.KEYS, values):
+                    if not value:
+                        continue
+                    if key == 'n_rxq' and value == self.AUTO:
+                        settings[key] = value
+                        continue
+                    assert value.isdigit() and int(value) > 0, \
+                        "Port {} {} is invalid".format(key, value)
+                    value = int(value)
+                    if key != 'n_rxq':
+                        assert (value & (value - 1) == 0 and
+                                value <= self.MAX_DESCRIPTORS), \
+                            "Port {} {} is not a power of 2 up to {}".format(
+                                key, value, self.MAX_DESCRIPTORS)
+                    settings[key] = value
+
+                self.queue_config[port.lower()] = settings
+
+    def get_port_config(self, pci_address):
+        '''
+        Get the queue configuration of a DPDK device
+
+        :param pci_address: the PCI address of the device
+        :return: a dictionary with the n_rxq, n_rxq_desc and n_txq_desc
+                 settings of the device, n_rxq may be 'auto'
+        '''
+        port_config = dict(self.queue_config.get(self.ALL_PORTS.lower(), {}))
+        for port, settings in self.queue_config.items():
+            if dpdk_port_matches(port, pci_address):
+                port_config.update(settings)
+        return port_config
+
+
+class DPDKRxqAffinityConfig():
+    '''
+    A class to parse dpdk-pmd-rxq-affinity into a dictionary and
+    provide a convenient config get interface.
+    '''
+
+    def __init__(self):
+
+        self.affinity_config = {}
+
+        affinity_config = config('dpdk-pmd-rxq-affinity')
+        if affinity_config:
+            pmd_cpu_mask = (neutron_ovs_context.OVSDPDKDeviceContext()
+                            .pmd_cpu_mask())
+            for entry in affinity_config.split():
+                port, _, affinity = entry.rpartition('=')
+                assert port, \
+                    "Port rxq affinity {} has no port".format(entry)
+                for pinning in affinity.split(','):
+                    queue, _, core = pinning.partition(':')
+                    assert queue.isdigit() and core.isdigit(), \
+                        "Port rxq affinity {} is invalid".format(affinity)
+                    if pmd_cpu_mask and not int(pmd_cpu_mask, 16) & \
+                            1 << int(core):
+                        log('Core {} pinned for port {} is not a PMD core'
+                            .format(core, port), level=WARNING)
+                self.affinity_config[port.lower()] = affinity
+
+    def get_port_affinity(self, pci_address):
+        '''
+        Get the rxq affinity of a DPDK device
+
+        :param pci_address: the PCI address of the device
+        :return: the pmd-rxq-affinity of the device or None
+        '''
+        for port, affinity in self.affinity_config.items():
+            if dpdk_port_matches(port, pci_address):
+                return affinity
+        return None
+
+
+def dpdk_port_matches(port, pci_address):
+    '''Whether a port identifier used in charm config refers to a device
+
+    Ports are identified by the mac address configured in data-port or
+    dpdk-bond-mappings, or by PCI address.
+    '''
+    pci_address = neutron_ovs_context.dpdk_device_pci(pci_address)
+    return (port.lower() == pci_address.lower() or
+            kv().get(port.lower()) == pci_address)
+
+
+class DPDKBondsConfig():
+    '''
+    A class to parse dpdk-bond-config, or bond-config for kernel datapath
+    bonds, into a dictionary and provide a convenient config get interface.
+    '''
+
     DEFAUL_LACP_CONFIG = {
         'mode': 'balance-tcp',
         'lacp': 'active',
@@ -999,14 +2265,30 @@ class DPDKBondsConfig():
     BOND_MODES = ['active-backup', 'balance-slb', 'balance-tcp']
     BOND_LACP = ['active', 'passive', 'off']
     BOND_LACP_TIME = ['fast', 'slow']
-
-    def __init__(self):
+    BOND_DETECT_MODES = ['carrier', 'miimon']
+    BOND_LB_OUTPUT_ACTION = ['true', 'false']
+    # Maximum bond-rebalance-interval accepted by OVS, in milliseconds
+    MAX_REBALANCE_INTERVAL = 10000
+
+    # Optional key=value bond settings and the port columns they set
+    BOND_COLUMNS = OrderedDict([
+        ('updelay', 'bond_updelay'),
+        ('downdelay', 'bond_downdelay'),
+    ])
+    BOND_OTHER_CONFIG = OrderedDict([
+        ('lb-output-action', 'lb-output-action'),
+        ('rebalance-interval', 'bond-rebalance-interval'),
+        ('detect-mode', 'bond-detect-mode'),
+        ('miimon-interval', 'bond-miimon-interval'),
+    ])
+
+    def __init__(self, option='dpdk-bond-config'):
 
         self.lacp_config = {
             self.ALL_BONDS: deepcopy(self.DEFAUL_LACP_CONFIG)
         }
 
-        lacp_config = config('dpdk-bond-config')
+        lacp_config = config(option)
         if lacp_config:
             lacp_config_map = lacp_config.split()
             for entry in lacp_config_map:
@@ -1037,6 +2319,48 @@ class DPDKBondsConfig():
                     'lacp': lacp,
                     'lacp-time': lacp_time
                 }
+                self.lacp_config[bond].update(
+                    self._parse_options(bond, mode, entry))
+
+    def _parse_options(self, bond, mode, entry):
+        '''
+        Parse and validate the colon delimited key=value options of a bond
+
+        :param bond: the bond name, used in error messages
+        :param mode: the bond mode
+        :param entry: the remainder of the dpdk-bond-config entry
+        :return: a dictionary of the bond options
+        '''
+        options = {}
+        while entry:
+            option, entry = self._partition_entry(entry)
+            key, _, value = option.partition('=')
+            assert (key in self.BOND_COLUMNS or
+                    key in self.BOND_OTHER_CONFIG) and value, \
+                "Bond {} option {} is invalid".format(bond, option)
+            if key == 'lb-output-action':
+                assert value in self.BOND_LB_OUTPUT_ACTION, \
+                    "Bond {} lb-output-action {} is invalid".format(
+                        bond, value)
+                assert value == 'false' or mode == 'balance-tcp', \
+                    "Bond {} lb-output-action requires balance-tcp".format(
+                        bond)
+            elif key == 'detect-mode':
+                assert value in self.BOND_DETECT_MODES, \
+                    "Bond {} detect-mode {} is invalid".format(bond, value)
+            else:
+                assert value.isdigit(), \
+                    "Bond {} {} {} is invalid".format(bond, key, value)
+                value = int(value)
+                assert (key != 'rebalance-interval' or
+                        value <= self.MAX_REBALANCE_INTERVAL), \
+                    "Bond {} rebalance-interval {} is invalid".format(
+                        bond, value)
+                assert key != 'miimon-interval' or value > 0, \
+                    "Bond {} miimon-interval {} is invalid".format(
+                        bond, value)
+            options[key] = value
+        return options
 
     def _partition_entry(self, entry):
         t = entry.partition(":")
@@ -16,8 +16,20 @@
 
 import os
 import glob
+import re
 import subprocess
 import shlex
+from collections import OrderedDict
+
+SYS_BUS_PCI = '/sys/bus/pci'
+SYS_CLASS_NET = '/sys/class/net'
+# phys_port_name of the representor of a VF in switchdev mode, pf0vf3 or 3
+# depending on the driver
+VF_REPRESENTOR_REGEX = re.compile(r'^(?:pf[0-9]+)?vf([0-9]+)$')
+# Userspace drivers that need the device isolated in its own IOMMU group
+VFIO_DRIVERS = ('vfio-pci',)
+# Kernel drivers that may share an IOMMU group with a device bound to VFIO
+VFIO_GROUP_SAFE_DRIVERS = VFIO_DRIVERS + ('pcieport', 'pci-stub')
 
 
 def format_pci_addr(pci_addr):
@@ -153,6 +165,9 @@ class PCINetDevice(object):
         self.pci_address = pci_address
         self.interface_name = None
         self.mac_address = None
+        # NOTE: multi-port cards may expose several interfaces on one PCI
+        #       function
+        self.mac_addresses = []
         self.state = None
         self.sriov = False
         self.sriov_totalvfs = None
@@ -164,10 +179,12 @@ class PCINetDevice(object):
 
     def update_interface_info(self):
         net_devices = get_sysnet_interfaces_and_macs()
+        self.mac_addresses = []
         for interface in net_devices:
             if self.pci_address == interface['pci_address']:
                 self.interface_name = interface['interface']
                 self.mac_address = interface['mac_address']
+                self.mac_addresses.append(interface['mac_address'])
                 self.state = interface['state']
                 self.sriov = interface['sriov']
                 if self.sriov:
@@ -227,7 +244,7 @@ class PCINetDevices(object):
 
     def get_device_from_mac(self, mac):
         for pcidev in self.pci_devices:
-            if pcidev.mac_address == mac:
+            if pcidev.mac_address == mac or mac in pcidev.mac_addresses:
                 return pcidev
         return None
 
@@ -242,3 +259,221 @@ class PCINetDevices(object):
             if pcidev.interface_name == interface_name:
                 return pcidev
         return None
+
+
+def _pci_device_path(pci_address, *path):
+    return os.path.join(SYS_BUS_PCI, 'devices', pci_address, *path)
+
+
+def read_sysfs(path):
+    '''Read a sysfs attribute
+
+    :path: string: path of the attribute
+
+    :returns: string: stripped value or None if it cannot be read
+    '''
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def _write_sysfs(path, value):
+    with open(path, 'w') as f:
+        f.write(value)
+
+
+def get_pci_driver(pci_address):
+    '''Kernel driver a PCI device is bound to
+
+    :pci_address: string: PCI address of the device
+
+    :returns: string: driver name or None if the device is not bound
+    '''
+    path = _pci_device_path(pci_address, 'driver')
+    if not os.path.islink(path):
+        return None
+    return os.path.basename(os.readlink(path))
+
+
+def get_iommu_group_devices(pci_address):
+    '''List the PCI devices sharing the IOMMU group of a device
+
+    :pci_address: string: PCI address of the device
+
+    :returns: list: PCI addresses of the devices in the group, or None if
+                    the device is not in an IOMMU group
+    '''
+    group = _pci_device_path(pci_address, 'iommu_group')
+    if not os.path.islink(group):
+        return None
+    return sorted(os.listdir(os.path.join(group, 'devices')))
+
+
+def check_vfio_iommu_group(pci_address, bind_addresses=()):
+    '''Check a device can be bound to VFIO
+
+    VFIO only hands a device to userspace once every device in its IOMMU
+    group is bound to VFIO, a PCI bridge or no driver at all.
+
+    :pci_address: string: PCI address of the device
+    :bind_addresses: list: PCI addresses being bound to VFIO together with
+                           the device
+
+    :raises: ValueError if the device is not isolated
+    '''
+    devices = get_iommu_group_devices(pci_address)
+    if devices is None:
+        raise ValueError('no IOMMU group, check intel_iommu=on or '
+                         'amd_iommu=on is set on the kernel command line')
+    for device in devices:
+        if device == pci_address or device in bind_addresses:
+            continue
+        driver = get_pci_driver(device)
+        if driver and driver not in VFIO_GROUP_SAFE_DRIVERS:
+            raise ValueError('IOMMU group shared with {} bound to {}'
+                             .format(device, driver))
+
+
+def ensure_pci_driver_loaded(driver):
+    '''Load the kernel module of a PCI driver if it is not registered
+
+    :driver: string: name of the PCI driver
+
+    :returns: boolean: whether the driver is registered with the PCI bus
+    '''
+    path = os.path.join(SYS_BUS_PCI, 'drivers', driver)
+    if not os.path.isdir(path):
+        subprocess.call(['modprobe', driver.replace('-', '_')])
+    return os.path.isdir(path)
+
+
+def bind_pci_device(pci_address, driver):
+    '''Bind a PCI device to a driver through sysfs
+
+    The driver_override of the device is set before unbinding it from its
+    current driver and asking the PCI bus to probe it again, so that the
+    device cannot be grabbed back by its kernel driver in between.
+    Devices already bound to the driver are left untouched.
+
+    :pci_address: string: PCI address of the device
+    :driver: string: name of the PCI driver
+
+    :returns: boolean: True if the device was rebound, False if it was
+                       already bound to the driver
+    :raises: ValueError if the device could not be bound
+    '''
+    if not os.path.isdir(_pci_device_path(pci_address)):
+        raise ValueError('no such PCI device')
+    current = get_pci_driver(pci_address)
+    if current == driver:
+        return False
+    try:
+        _write_sysfs(_pci_device_path(pci_address, 'driver_override'),
+                     driver)
+        if current:
+            _write_sysfs(_pci_device_path(pci_address, 'driver', 'unbind'),
+                         pci_address)
+        _write_sysfs(os.path.join(SYS_BUS_PCI, 'drivers_probe'),
+                     pci_address)
+    except (IOError, OSError) as e:
+        raise ValueError('sysfs write failed: {}'.format(e))
+    bound = get_pci_driver(pci_address)
+    if bound != driver:
+        raise ValueError('bound to {} instead of {}'.format(bound, driver))
+    return True
+
+
+def bind_pci_devices(drivers):
+    '''Bind PCI devices to their drivers
+
+    Drivers are loaded once and the IOMMU groups of devices bound to VFIO
+    are checked before any device is rebound. Each device is bound
+    independently, a failure does not prevent binding the others.
+
+    :drivers: dict: driver names indexed by PCI address
+
+    :returns: OrderedDict: reason of each failure indexed by PCI address
+    '''
+    failures = OrderedDict()
+    loaded = {driver: ensure_pci_driver_loaded(driver)
+              for driver in set(drivers.values())}
+    vfio_addresses = [pci_address for pci_address, driver in drivers.items()
+                      if driver in VFIO_DRIVERS]
+    for pci_address, driver in drivers.items():
+        if not loaded[driver]:
+            failures[pci_address] = 'driver {} not available'.format(driver)
+            continue
+        try:
+            if driver in VFIO_DRIVERS:
+                check_vfio_iommu_group(pci_address, vfio_addresses)
+            bind_pci_device(pci_address, driver)
+        except ValueError as e:
+            failures[pci_address] = str(e)
+    return failures
+
+
+def get_vf_pci_addresses(pci_address):
+    '''List the PCI addresses of the Virtual Functions of a PF
+
+    :pci_address: string: PCI address of the Physical Function
+
+    :returns: list: PCI addresses of the VFs ordered by VF index
+    '''
+    vfs = []
+    for path in glob.glob(_pci_device_path(pci_address, 'virtfn*')):
+        index = os.path.basename(path)[len('virtfn'):]
+        if index.isdigit():
+            vfs.append((int(index), os.path.basename(os.readlink(path))))
+    return [vf for _, vf in sorted(vfs)]
+
+
+def unbind_pci_device(pci_address):
+    '''Unbind a PCI device from its driver
+
+    :pci_address: string: PCI address of the device
+
+    :returns: string: driver the device was bound to or None
+    '''
+    driver = get_pci_driver(pci_address)
+    if driver:
+        _write_sysfs(_pci_device_path(pci_address, 'driver', 'unbind'),
+                     pci_address)
+    return driver
+
+
+def probe_pci_device(pci_address):
+    '''Ask the PCI bus to bind a device to its default driver
+
+    :pci_address: string: PCI address of the device
+    '''
+    _write_sysfs(os.path.join(SYS_BUS_PCI, 'drivers_probe'), pci_address)
+
+
+def get_vf_representors(interface):
+    '''Find the representors of the VFs of a PF in switchdev mode
+
+    Representors are the network interfaces sharing the switch id of the
+    PF with a VF port name.
+
+    :interface: string: name of the PF network interface
+
+    :returns: OrderedDict: representor interface names indexed by VF index
+    '''
+    def _read(interface, name):
+        return read_sysfs(os.path.join(SYS_CLASS_NET, interface, name))
+
+    switch_id = _read(interface, 'phys_switch_id')
+    representors = []
+    if not switch_id:
+        return OrderedDict()
+    for path in glob.glob(os.path.join(SYS_CLASS_NET, '*')):
+        netdev = os.path.basename(path)
+        if netdev == interface or _read(netdev, 'phys_switch_id') != switch_id:
+            continue
+        match = VF_REPRESENTOR_REGEX.match(_read(netdev, 'phys_port_name') or
+                                           '')
+        if match:
+            representors.append((int(match.group(1)), netdev))
+    return OrderedDict(sorted(representors))
@@ -0,0 +1,44 @@
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+
+from test_utils import CharmTestCase
+
+import datapath_tuning as actions
+
+
+class ShowDatapathTuningTestCase(CharmTestCase):
+
+    def setUp(self):
+        super(ShowDatapathTuningTestCase, self).setUp(
+            actions, ["action_set", "datapath_tuning",
+                      "get_Open_vSwitch_column_value"])
+
+    def test_show_datapath_tuning(self):
+        self.datapath_tuning.return_value = OrderedDict([
+            ('flow-limit', None),
+            ('n-handler-threads', '16'),
+        ])
+        self.get_Open_vSwitch_column_value.side_effect = {
+            'other_config:flow-limit': None,
+            'other_config:n-handler-threads': '16',
+        }.get
+        actions.show_datapath_tuning([])
+        self.action_set.assert_called_once_with({
+            'flow-limit.charm': 'ovs-default',
+            'flow-limit.current': 'ovs-default',
+            'n-handler-threads.charm': '16',
+            'n-handler-threads.current': '16',
+        })
@@ -0,0 +1,61 @@
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import base64
+import json
+import os
+import tempfile
+
+from test_utils import CharmTestCase
+
+import hook_profiles as actions
+
+
+class ListHookProfilesTestCase(CharmTestCase):
+
+    def setUp(self):
+        super(ListHookProfilesTestCase, self).setUp(
+            actions, ["action_set", "list_profiles"])
+
+    def test_list_hook_profiles(self):
+        self.list_profiles.return_value = [{'name': '1000.000000-install'}]
+        actions.list_hook_profiles([])
+        self.action_set.assert_called_once_with(
+            {'profiles': json.dumps([{'name': '1000.000000-install'}])})
+
+
+class GetHookProfileTestCase(CharmTestCase):
+
+    def setUp(self):
+        super(GetHookProfileTestCase, self).setUp(
+            actions, ["action_get", "action_set", "profile_path"])
+        fd, self.path = tempfile.mkstemp()
+        os.write(fd, b'profile')
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+        self.profile_path.return_value = self.path
+        self.action_get.return_value = '1000.000000-install'
+
+    def test_get_hook_profile(self):
+        actions.get_hook_profile([])
+        self.profile_path.assert_called_once_with('1000.000000-install')
+        self.action_set.assert_called_once_with({
+            'path': self.path,
+            'data': base64.b64encode(b'profile').decode('ascii')})
+
+    def test_get_hook_profile_too_large(self):
+        actions.MAX_INLINE_SIZE, size = 1, actions.MAX_INLINE_SIZE
+        self.addCleanup(setattr, actions, 'MAX_INLINE_SIZE', size)
+        actions.get_hook_profile([])
+        self.action_set.assert_called_once_with({'path': self.path})
@@ -17,7 +17,12 @@ from test_utils import patch_open
 from mock import patch, Mock
 import neutron_ovs_context as context
 import charmhelpers
-import copy
+import charmhelpers.core.unitdata as unitdata
+import dns.exception
+import dns.resolver
+import os
+import shutil
+import tempfile
 
 _LSB_RELEASE_XENIAL = {
     'DISTRIB_CODENAME': 'xenial',
@@ -60,6 +65,11 @@ class OVSPluginContextTest(CharmTestCase):
         self.test_config.set('use-syslog', True)
         self.network_get_primary_address.side_effect = NotImplementedError
         self.lsb_release.return_value = _LSB_RELEASE_XENIAL
+        self.unit_get.return_value = 'juju-machine-0'
+        _kv = patch.object(context, 'kv')
+        self.kv = _kv.start()
+        self.addCleanup(_kv.stop)
+        self.kv.return_value = unitdata.Storage(':memory:')
 
     def tearDown(self):
         super(OVSPluginContextTest, self).tearDown()
@@ -194,6 +204,106 @@ class OVSPluginContextTest(CharmTestCase):
         }
         self.assertEqual(expect, napi_ctxt())
 
+    @patch.object(charmhelpers.contrib.openstack.utils,
+                  'get_os_codename_package')
+    @patch.object(charmhelpers.contrib.openstack.context, 'config',
+                  lambda *args: None)
+    @patch.object(charmhelpers.contrib.openstack.context, 'relation_get')
+    @patch.object(charmhelpers.contrib.openstack.context, 'relation_ids')
+    @patch.object(charmhelpers.contrib.openstack.context, 'related_units')
+    @patch.object(charmhelpers.contrib.openstack.context, 'config')
+    @patch.object(charmhelpers.contrib.openstack.context, 'unit_get')
+    @patch.object(charmhelpers.contrib.openstack.context, 'is_clustered')
+    @patch.object(charmhelpers.contrib.openstack.context, 'https')
+    @patch.object(context.OVSPluginContext, '_ensure_packages')
+    @patch.object(charmhelpers.contrib.openstack.context,
+                  'neutron_plugin_attribute')
+    @patch.object(charmhelpers.contrib.openstack.context, 'unit_private_ip')
+    @patch.object(context, 'dpdk_tunnel_endpoint')
+    def test_neutroncc_context_dpdk_tunnel_endpoint(
+            self, _dpdk_tunnel_endpoint, _unit_priv_ip, _npa, _ens_pkgs,
+            _https, _is_clus, _unit_get, _config, _runits, _rids, _rget,
+            _get_os_cdnm_pkg):
+        def mock_npa(plugin, section, manager):
+            if section == "driver":
+                return "neutron.randomdriver"
+            if section == "config":
+                return "neutron.randomconfig"
+
+        config = {'vlan-ranges': "physnet1:1000:1500 physnet2:2000:2500",
+                  'use-syslog': True,
+                  'verbose': True,
+                  'debug': True,
+                  'bridge-mappings': "physnet1:br-data physnet2:br-data",
+                  'flat-network-providers': 'physnet3 physnet4',
+                  'prevent-arp-spoofing': False,
+                  'enable-dpdk': False,
+                  'security-group-log-output-base': '/var/log/nsg.log',
+                  'security-group-log-rate-limit': None,
+                  'security-group-log-burst-limit': 25}
+
+        def mock_config(key=None):
+            if key:
+                return config.get(key)
+
+            return config
+
+        _get_os_cdnm_pkg.return_value = 'ocata'
+        self.maxDiff = None
+        self.config.side_effect = mock_config
+        _npa.side_effect = mock_npa
+        _unit_get.return_value = '127.0.0.13'
+        _unit_priv_ip.return_value = '127.0.0.14'
+        _is_clus.return_value = False
+        _runits.return_value = ['unit1']
+        _rids.return_value = ['rid2']
+        rdata = {
+            'neutron-security-groups': 'True',
+            'l2-population': 'True',
+            'enable-qos': 'True',
+            'network-device-mtu': 1500,
+            'overlay-network-type': 'gre',
+            'enable-dvr': 'True',
+        }
+        _rget.side_effect = lambda *args, **kwargs: rdata
+        self.get_host_ip.return_value = '127.0.0.15'
+        _dpdk_tunnel_endpoint.return_value = context.TunnelEndpoint(
+            'br-phynet1', context.netaddr.IPNetwork('192.168.100.10/24'),
+            {}, {})
+        napi_ctxt = context.OVSPluginContext()
+        expect = {
+            'neutron_security_groups': True,
+            'distributed_routing': True,
+            'verbose': True,
+            'extension_drivers': 'qos',
+            'local_ip': '192.168.100.10',
+            'network_device_mtu': 1500,
+            'veth_mtu': 1500,
+            'config': 'neutron.randomconfig',
+            'use_syslog': True,
+            'enable_dpdk': False,
+            'firewall_driver': 'iptables_hybrid',
+            'network_manager': 'neutron',
+            'debug': True,
+            'core_plugin': 'neutron.randomdriver',
+            'neutron_plugin': 'ovs',
+            'neutron_url': 'https://127.0.0.13:9696',
+            'l2_population': True,
+            'overlay_network_type': 'gre',
+            'polling_interval': 2,
+            'rpc_response_timeout': 60,
+            'report_interval': 30,
+            'network_providers': 'physnet3,physnet4',
+            'bridge_mappings': 'physnet1:br-data,physnet2:br-data',
+            'vlan_ranges': 'physnet1:1000:1500,physnet2:2000:2500',
+            'prevent_arp_spoofing': False,
+            'enable_nsg_logging': False,
+            'nsg_log_output_base': '/var/log/nsg.log',
+            'nsg_log_rate_limit': None,
+            'nsg_log_burst_limit': 25,
+        }
+        self.assertEqual(expect, napi_ctxt())
+
     @patch.object(charmhelpers.contrib.openstack.utils,
                   'get_os_codename_package')
     @patch.object(charmhelpers.contrib.openstack.context, 'relation_get')
@@ -755,6 +865,7 @@ class TestDPDKUtils(CharmTestCase):
     def setUp(self):
         super(TestDPDKUtils, self).setUp(context, TO_PATCH)
         self.config.side_effect = self.test_config.get
+        charmhelpers.core.hookenv.cache = {}
 
     def test_parse_cpu_list(self):
         self.assertEqual(context.parse_cpu_list(TEST_CPULIST_1),
@@ -765,6 +876,48 @@ class TestDPDKUtils(CharmTestCase):
         self.assertEqual(context.parse_cpu_list(TEST_CPULIST_3),
                          [0, 4, 8, 12, 16, 20, 24])
 
+    def test_cpu_thread_siblings(self):
+        with patch_open() as (_open, _file):
+            _file.read.return_value = '1,5\n'
+            self.assertEqual(context.cpu_thread_siblings(1), [1, 5])
+            _open.assert_called_with(
+                '/sys/devices/system/cpu/cpu1/topology/thread_siblings_list')
+            _open.side_effect = IOError
+            self.assertEqual(context.cpu_thread_siblings(1), [1])
+
+    def test_parse_hugepage_reservations(self):
+        self.assertEqual(context.parse_hugepage_reservations(None), {})
+        self.assertEqual(
+            context.parse_hugepage_reservations('2M:1024 1:1g:4'),
+            {(None, 2048): 1024, ('1', 1048576): 4})
+        for invalid in ('4M:10', 'a:2M:10', '2M', '0:2M:x'):
+            self.assertRaises(ValueError,
+                              context.parse_hugepage_reservations, invalid)
+
+    @patch.object(context, 'numa_node_cores')
+    def test_node_hugepages(self, _numa_node_cores):
+        _numa_node_cores.return_value = {'0': [0, 1]}
+        sysfs = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, sysfs)
+        for size, total, free in (('2048', '1024', '512'),
+                                  ('1048576', '0', '0')):
+            path = os.path.join(sysfs, 'node0', 'hugepages',
+                                'hugepages-{}kB'.format(size))
+            os.makedirs(path)
+            for name, value in (('nr_hugepages', total),
+                                ('free_hugepages', free)):
+                with open(os.path.join(path, name), 'w') as f:
+                    f.write(value + '\n')
+        with patch.object(context, 'HUGEPAGES_NODE_PATH',
+                          os.path.join(sysfs, 'node{node}', 'hugepages')):
+            self.assertEqual(context.node_hugepages(), {'0': {
+                2048: {'total': 1024, 'free': 512},
+                1048576: {'total': 0, 'free': 0}}})
+            self.assertEqual(
+                context.reserve_node_hugepages('0', 1048576, 4), 4)
+            self.assertEqual(context.node_hugepages()['0'][1048576],
+                             {'total': 4, 'free': 0})
+
     @patch.object(context, 'parse_cpu_list', wraps=context.parse_cpu_list)
     def test_numa_node_cores(self, _parse_cpu_list):
         self.glob.glob.return_value = [
@@ -786,6 +939,46 @@ class TestDPDKUtils(CharmTestCase):
                          {'0000:00:1c.0': 'br-phynet1',
                           '0000:00:1d.0': 'br-phynet3'})
 
+    def test_resolve_dpdk_bridges_shared_pci(self):
+        self.test_config.set('data-port', 'br-phynet1:fe:16:41:df:23:fd '
+                                          'br-phynet2:fe:16:41:df:23:ff')
+        self.test_config.set('dpdk-bond-mappings', BOND_MAPPINGS)
+        shared = MockPCIDevice('0000:00:1c.0')
+        _pci_devices = Mock()
+        _pci_devices.get_device_from_mac.side_effect = {
+            'fe:16:41:df:23:fd': shared,
+            'fe:16:41:df:23:ff': shared,
+        }.get
+        self.PCINetDevices.return_value = _pci_devices
+        self.assertEqual(
+            context.resolve_dpdk_bridges(),
+            {'class=eth,mac=fe:16:41:df:23:fd': 'br-phynet1',
+             'class=eth,mac=fe:16:41:df:23:ff': 'br-phynet2'})
+        self.assertEqual(
+            context.dpdk_device_pci('class=eth,mac=fe:16:41:df:23:ff'),
+            '0000:00:1c.0')
+        self.assertEqual(context.dpdk_device_pci('0000:00:1d.0'),
+                         '0000:00:1d.0')
+
+    @patch.object(context, 'kv')
+    def test_resolve_dpdk_bridges_mac_case(self, _kv):
+        db = unitdata.Storage(':memory:')
+        _kv.return_value = db
+        # allocation stored by an earlier release in the case of the config
+        db.set('FE:16:41:DF:23:FE', '0000:00:1d.0')
+        self.test_config.set('data-port', 'br-phynet1:FE:16:41:DF:23:FD '
+                                          'br-phynet3:FE:16:41:DF:23:FE')
+        _pci_devices = Mock()
+        _pci_devices.get_device_from_mac.side_effect = {
+            'FE:16:41:DF:23:FD': MockPCIDevice('0000:00:1c.0'),
+        }.get
+        self.PCINetDevices.return_value = _pci_devices
+        self.assertEqual(context.resolve_dpdk_bridges(),
+                         {'0000:00:1c.0': 'br-phynet1',
+                          '0000:00:1d.0': 'br-phynet3'})
+        self.assertEqual(db.get('fe:16:41:df:23:fd'), '0000:00:1c.0')
+        self.assertEqual(db.get('fe:16:41:df:23:fe'), '0000:00:1d.0')
+
     def test_resolve_dpdk_bonds(self):
         self.test_config.set('dpdk-bond-mappings', BOND_MAPPINGS)
         _pci_devices = Mock()
@@ -795,13 +988,29 @@ class TestDPDKUtils(CharmTestCase):
                          {'0000:00:1c.0': 'bond0',
                           '0000:00:1d.0': 'bond0'})
 
+    def test_resolve_dpdk_devices_cached(self):
+        self.test_config.set('data-port', DPDK_DATA_PORTS)
+        self.test_config.set('dpdk-bond-mappings', BOND_MAPPINGS)
+        _pci_devices = Mock()
+        _pci_devices.get_device_from_mac.side_effect = PCI_DEVICE_MAP.get
+        self.PCINetDevices.return_value = _pci_devices
+        devices = context.resolve_dpdk_devices()
+        self.assertEqual(devices, context.resolve_dpdk_devices())
+        self.assertEqual(context.resolve_dpdk_bridges(),
+                         {'0000:00:1c.0': 'br-phynet1',
+                          '0000:00:1d.0': 'br-phynet3'})
+        # PCI devices are scanned once per hook
+        self.PCINetDevices.assert_called_once_with()
+
 
 DPDK_PATCH = [
     'parse_cpu_list',
     'numa_node_cores',
+    'cpu_thread_siblings',
     'resolve_dpdk_bridges',
     'resolve_dpdk_bonds',
     'glob',
+    'kv',
 ]
 
 NUMA_CORES_SINGLE = {
@@ -820,6 +1029,8 @@ class TestOVSDPDKDeviceContext(CharmTestCase):
         super(TestOVSDPDKDeviceContext, self).setUp(context,
                                                     TO_PATCH + DPDK_PATCH)
         self.config.side_effect = self.test_config.get
+        self.cpu_thread_siblings.side_effect = lambda cpu: [cpu]
+        self.kv.return_value = unitdata.Storage(':memory:')
         self.test_context = context.OVSDPDKDeviceContext()
         self.test_config.set('enable-dpdk', True)
 
@@ -834,11 +1045,13 @@ class TestOVSDPDKDeviceContext(CharmTestCase):
 
     def test_socket_memory(self):
         '''Test socket memory configuration'''
-        self.glob.glob.return_value = ['a']
+        self.resolve_dpdk_bridges.return_value = {}
+        self.resolve_dpdk_bonds.return_value = {}
+        self.numa_node_cores.return_value = NUMA_CORES_SINGLE
         self.assertEqual(self.test_context.socket_memory(),
                          '1024')
 
-        self.glob.glob.return_value = ['a', 'b']
+        self.numa_node_cores.return_value = NUMA_CORES_MULTI
         self.assertEqual(self.test_context.socket_memory(),
                          '1024,1024')
 
@@ -846,16 +1059,154 @@ class TestOVSDPDKDeviceContext(CharmTestCase):
         self.assertEqual(self.test_context.socket_memory(),
                          '2048,2048')
 
+    @patch.object(context, 'pci_numa_node')
+    def test_socket_memory_dpdk_nodes(self, _pci_numa_node):
+        '''Test socket memory is only allocated on DPDK nodes'''
+        self.numa_node_cores.return_value = {
+            '0': [0, 1], '1': [2, 3], '2': [4, 5], '3': [6, 7]}
+        self.resolve_dpdk_bridges.return_value = {'0000:81:00.0': 'br-data'}
+        self.resolve_dpdk_bonds.return_value = {}
+        _pci_numa_node.return_value = '2'
+        self.test_config.set('dpdk-socket-memory', 4096)
+        self.assertEqual(self.test_context.socket_memory(),
+                         '1024,1024,4096,1024')
+
+        self.test_config.set('dpdk-socket-memory-min', 0)
+        self.assertEqual(self.test_context.socket_memory(),
+                         '0,0,4096,0')
+
+        # The minimum never exceeds the configured amount
+        self.test_config.set('dpdk-socket-memory-min', 8192)
+        self.assertEqual(self.test_context.socket_memory(),
+                         '4096,4096,4096,4096')
+
     def test_cpu_mask(self):
         '''Test generation of hex CPU masks'''
+        db = self.kv.return_value
+        self.numa_node_cores.return_value = NUMA_CORES_SINGLE
+        self.assertEqual(self.test_context.cpu_mask(), '0x02')
+
+        db.unset(context.LCORE_MASK_KEY)
+        self.numa_node_cores.return_value = NUMA_CORES_MULTI
+        self.assertEqual(self.test_context.cpu_mask(), '0x12')
+
+        self.test_config.set('dpdk-socket-cores', 2)
+        self.assertEqual(self.test_context.cpu_mask(), '0x36')
+
+        # CPU 0 is only used if it is the only core of its node
+        self.numa_node_cores.return_value = {'0': [0], '1': [1]}
+        self.test_config.set('dpdk-socket-cores', 1)
+        self.assertEqual(self.test_context.cpu_mask(), '0x03')
+
+    def test_cpu_mask_recorded(self):
+        '''Test the lcore mask is kept until dpdk-socket-cores changes'''
+        db = self.kv.return_value
+        self.numa_node_cores.return_value = NUMA_CORES_MULTI
+        self.assertEqual(self.test_context.cpu_mask(), '0x12')
+        self.assertEqual(db.get(context.LCORE_MASK_KEY),
+                         {'socket-cores': 1, 'mask': '0x12'})
         self.numa_node_cores.return_value = NUMA_CORES_SINGLE
-        self.assertEqual(self.test_context.cpu_mask(), '0x01')
+        self.assertEqual(self.test_context.cpu_mask(), '0x12')
+        self.test_config.set('dpdk-socket-cores', 2)
+        self.assertEqual(self.test_context.cpu_mask(), '0x06')
 
+    def test_record_legacy_cpu_mask(self):
+        '''Test upgraded units keep the lcore mask including CPU 0'''
+        db = self.kv.return_value
         self.numa_node_cores.return_value = NUMA_CORES_MULTI
+        context.record_legacy_cpu_mask()
         self.assertEqual(self.test_context.cpu_mask(), '0x11')
 
+        # A recorded mask is not replaced
         self.test_config.set('dpdk-socket-cores', 2)
-        self.assertEqual(self.test_context.cpu_mask(), '0x33')
+        self.assertEqual(self.test_context.cpu_mask(), '0x36')
+        context.record_legacy_cpu_mask()
+        self.assertEqual(db.get(context.LCORE_MASK_KEY),
+                         {'socket-cores': 2, 'mask': '0x36'})
+
+    def test_cpu_masks_smt(self):
+        '''Test CPU allocation with hyperthread siblings'''
+        self.numa_node_cores.return_value = {'0': list(range(8))}
+        self.cpu_thread_siblings.side_effect = \
+            lambda cpu: sorted([cpu % 4, cpu % 4 + 4])
+        self.resolve_dpdk_bridges.return_value = {'0000:00:1c.0': 'br-data'}
+        self.resolve_dpdk_bonds.return_value = {}
+        self.assertEqual(context.physical_cores(),
+                         {'0': [[0, 4], [1, 5], [2, 6], [3, 7]]})
+        with patch.object(context, 'pci_numa_node', return_value='0'):
+            self.test_config.set('dpdk-pmd-cores', 2)
+            self.assertEqual(self.test_context.cpu_mask(), '0x02')
+            self.assertEqual(self.test_context.pmd_cpu_mask(), '0x0c')
+
+            # lcores share a physical core before taking another one
+            self.test_config.set('dpdk-socket-cores', 2)
+            self.assertEqual(self.test_context.cpu_mask(), '0x22')
+            self.assertEqual(self.test_context.pmd_cpu_mask(), '0x0c')
+
+            # PMDs only get the cores left
+            self.test_config.set('dpdk-pmd-cores', 3)
+            self.assertEqual(self.test_context.pmd_cpu_mask(), '0x0c')
+
+    @patch.object(context, 'pci_numa_node')
+    def test_pmd_cpu_mask(self, _pci_numa_node):
+        '''Test generation of NUMA local PMD CPU masks'''
+        self.numa_node_cores.return_value = NUMA_CORES_MULTI
+        self.resolve_dpdk_bridges.return_value = {
+            '0000:00:1c.0': 'br-data',
+        }
+        self.resolve_dpdk_bonds.return_value = {
+            '0000:81:00.0': 'bond0',
+        }
+        numa_nodes = {'0000:00:1c.0': '1', '0000:81:00.0': '1'}
+        _pci_numa_node.side_effect = numa_nodes.get
+        self.assertEqual(self.test_context.device_numa_nodes(), ['1'])
+        # pmd-cpu-mask is unmanaged by default
+        self.assertEqual(self.test_context.pmd_cpu_mask(), None)
+        self.test_config.set('dpdk-pmd-cores', 1)
+        self.assertEqual(self.test_context.pmd_cpu_mask(), '0x20')
+
+        numa_nodes['0000:00:1c.0'] = '0'
+        self.test_config.set('dpdk-pmd-cores', 2)
+        self.assertEqual(self.test_context.pmd_cpu_mask(), '0x6c')
+
+        # Devices without a NUMA node are local to the first node
+        numa_nodes.clear()
+        self.assertEqual(self.test_context.pmd_cpu_mask(), '0x0c')
+
+        self.test_config.set('dpdk-pmd-cores', 0)
+        self.assertEqual(self.test_context.pmd_cpu_mask(), None)
+
+    @patch.object(context, 'pci_numa_node')
+    def test_local_pmd_cores(self, _pci_numa_node):
+        self.numa_node_cores.return_value = NUMA_CORES_MULTI
+        self.resolve_dpdk_bridges.return_value = {
+            '0000:00:1c.0': 'br-data',
+            '0000:81:00.0': 'br-data',
+        }
+        self.resolve_dpdk_bonds.return_value = {}
+        _pci_numa_node.side_effect = {'0000:00:1c.0': '0',
+                                      '0000:81:00.0': '1'}.get
+        self.test_config.set('dpdk-pmd-cores', 2)
+        self.assertEqual(
+            self.test_context.local_pmd_cores('0000:81:00.0'), 2)
+        self.test_config.set('dpdk-pmd-cores', 0)
+        self.assertEqual(
+            self.test_context.local_pmd_cores('0000:81:00.0'), 0)
+
+    def test_pmd_cpu_mask_no_devices(self):
+        self.numa_node_cores.return_value = NUMA_CORES_MULTI
+        self.resolve_dpdk_bridges.return_value = {}
+        self.resolve_dpdk_bonds.return_value = {}
+        self.assertEqual(self.test_context.pmd_cpu_mask(), None)
+
+    def test_pci_numa_node(self):
+        with patch_open() as (_open, _file):
+            _file.read.return_value = '1\n'
+            self.assertEqual(context.pci_numa_node('0000:00:1c.0'), '1')
+            _open.assert_called_with(
+                '/sys/bus/pci/devices/0000:00:1c.0/numa_node')
+            _file.read.return_value = '-1\n'
+            self.assertEqual(context.pci_numa_node('0000:00:1c.0'), None)
 
     def test_context_no_devices(self):
         '''Ensure that DPDK is disable when no devices detected'''
@@ -872,13 +1223,361 @@ class TestOVSDPDKDeviceContext(CharmTestCase):
         self.numa_node_cores.return_value = NUMA_CORES_SINGLE
         self.glob.glob.return_value = ['a']
         self.assertEqual(self.test_context(), {
-            'cpu_mask': '0x01',
+            'cpu_mask': '0x02',
             'device_whitelist': '-w 0000:00:1c.0 -w 0000:00:1d.0',
             'dpdk_enabled': True,
+            'eal_args': '-n 4',
             'socket_memory': '1024'
         })
 
 
+class TestDPDKEALOptions(CharmTestCase):
+
+    def setUp(self):
+        super(TestDPDKEALOptions, self).setUp(
+            context, ['config', 'log', 'numa_node_cores'])
+        self.config.side_effect = self.test_config.get
+        self.numa_node_cores.return_value = NUMA_CORES_MULTI
+        self.edac = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.edac)
+        patcher = patch.object(context, 'EDAC_MC_PATH', self.edac)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.test_context = context.OVSDPDKDeviceContext()
+
+    def _add_dimm(self, mc, dimm, channel, size):
+        path = os.path.join(self.edac, mc, dimm)
+        os.makedirs(path)
+        with open(os.path.join(path, 'dimm_location'), 'w') as f:
+            f.write('channel {} slot 0 \n'.format(channel))
+        with open(os.path.join(path, 'size'), 'w') as f:
+            f.write('{}\n'.format(size))
+
+    def test_memory_channels(self):
+        self.assertEqual(context.memory_channels(), None)
+        for mc in ('mc0', 'mc1'):
+            for channel in range(6):
+                self._add_dimm(mc, 'dimm{}'.format(channel), channel,
+                               16384 if channel < 4 else 0)
+        # 8 populated channels over 2 NUMA nodes
+        self.assertEqual(context.memory_channels(), 4)
+
+    def test_eal_args_default(self):
+        self.assertEqual(self.test_context.eal_args(), '-n 4')
+        self._add_dimm('mc0', 'dimm0', 0, 16384)
+        self._add_dimm('mc0', 'dimm1', 1, 16384)
+        self._add_dimm('mc1', 'dimm0', 0, 16384)
+        self._add_dimm('mc1', 'dimm1', 1, 16384)
+        self.assertEqual(self.test_context.eal_args(), '-n 2')
+
+    def test_eal_args(self):
+        self.test_config.set('dpdk-memory-channels', 6)
+        self.test_config.set('dpdk-iova-mode', 'va')
+        self.test_config.set('dpdk-hugepage-dir', '/dev/hugepages1G')
+        self.test_config.set('dpdk-socket-limit', 4096)
+        self.assertEqual(self.test_context.eal_args(),
+                         '-n 6 --iova-mode va --huge-dir /dev/hugepages1G '
+                         '--socket-limit 4096,4096')
+
+    def test_eal_args_invalid(self):
+        for option, value in (('dpdk-memory-channels', 64),
+                              ('dpdk-iova-mode', 'auto'),
+                              ('dpdk-hugepage-dir', 'hugepages'),
+                              ('dpdk-socket-limit', 512)):
+            default = self.test_config.get(option)
+            self.test_config.set(option, value)
+            self.assertRaises(ValueError, context.validate_eal_config)
+            self.assertEqual(self.test_context.eal_args(), '-n 4')
+            self.test_config.set(option, default)
+        context.validate_eal_config()
+
+
+class TestAFXDP(CharmTestCase):
+
+    def setUp(self):
+        super(TestAFXDP, self).setUp(context, ['config', 'interface_index'])
+        self.config.side_effect = self.test_config.get
+        self.interface_index.return_value = {
+            'ens1f0': {'hwaddr': 'fa:16:3e:00:00:01', 'physical': True},
+            'ens1f1': {'hwaddr': 'fa:16:3e:00:00:02', 'physical': True},
+            'bond0': {'hwaddr': 'fa:16:3e:00:00:02', 'physical': False},
+        }
+
+    def test_resolve_afxdp_bridges(self):
+        self.assertEqual(context.resolve_afxdp_bridges(), {})
+        self.test_config.set('data-port', 'br-phynet1:FA:16:3E:00:00:02 '
+                                          'br-phynet2:ens1f0 '
+                                          'br-phynet3:fa:16:3e:00:00:03')
+        self.assertEqual(context.resolve_afxdp_bridges(), {
+            'ens1f1': 'br-phynet1',
+            'ens1f0': 'br-phynet2',
+        })
+
+    def test_validate_afxdp_config(self):
+        context.validate_afxdp_config()
+        self.test_config.set('afxdp-n-rxq', 0)
+        self.assertRaises(ValueError, context.validate_afxdp_config)
+        self.test_config.set('afxdp-n-rxq', 1)
+        self.test_config.set('afxdp-mode', 'drv')
+        self.assertRaises(ValueError, context.validate_afxdp_config)
+        self.test_config.set('afxdp-mode', 'generic')
+        self.test_config.set('enable-dpdk', True)
+        self.assertRaises(ValueError, context.validate_afxdp_config)
+
+
+class TestKernelBridges(CharmTestCase):
+
+    def setUp(self):
+        super(TestKernelBridges, self).setUp(
+            context, ['config', 'interface_index', 'log'])
+        self.config.side_effect = self.test_config.get
+        self.interface_index.return_value = {
+            'eno1': {'hwaddr': 'fa:16:3e:00:00:01', 'physical': True},
+            'bond1': {'hwaddr': 'fa:16:3e:00:00:02', 'physical': False},
+        }
+
+    def test_resolve_kernel_bridges(self):
+        self.assertEqual(context.resolve_kernel_bridges(), {})
+        self.test_config.set('data-port', 'br-dpdk:fa:16:3e:00:00:03 '
+                                          'br-bond:dpdk-bond0 '
+                                          'br-mgmt:eno1 br-vlan:bond1 '
+                                          'br-absent:eno2')
+        self.test_config.set('dpdk-bond-mappings',
+                             'dpdk-bond0:fa:16:3e:00:00:04')
+        self.assertEqual(context.resolve_kernel_bridges(), {
+            'eno1': 'br-mgmt',
+            'bond1': 'br-vlan',
+        })
+        self.assertTrue(self.log.called)
+
+
+class TestHardwareOffloadConfig(CharmTestCase):
+
+    def setUp(self):
+        super(TestHardwareOffloadConfig, self).setUp(context, ['config'])
+        self.config.side_effect = self.test_config.get
+        self.test_config.set('enable-hardware-offload', True)
+        self.test_config.set('sriov-device-mappings', 'physnet1:enp59s0f0')
+
+    def test_validate_hw_offload_config(self):
+        context.validate_hw_offload_config()
+        for option, value, message in (
+                ('enable-dpdk', True, 'enable-hardware-offload requires the '
+                 'kernel datapath, disable enable-dpdk and enable-afxdp'),
+                ('hw-offload-tc-policy', 'skip', 'Invalid '
+                 'hw-offload-tc-policy: skip (valid: none, skip_sw, '
+                 'skip_hw)'),
+                ('sriov-device-mappings', '', 'enable-hardware-offload '
+                 'requires sriov-device-mappings'),
+                ('sriov-device-mappings', 'enp59s0f0', 'Invalid '
+                 'sriov-device-mappings entry: enp59s0f0')):
+            default = self.test_config.get(option)
+            self.test_config.set(option, value)
+            with self.assertRaises(ValueError) as cm:
+                context.validate_hw_offload_config()
+            self.assertEqual(str(cm.exception), message)
+            self.test_config.set(option, default)
+
+
+class TestBridgeMTUs(CharmTestCase):
+
+    def setUp(self):
+        super(TestBridgeMTUs, self).setUp(
+            context, ['config', 'NeutronAPIContext', 'log'])
+        self.config.side_effect = self.test_config.get
+        self.test_config.set('bridge-mappings', 'physnet1:br-data '
+                                                'storage:br-storage '
+                                                'mgmt:br-mgmt')
+
+    def test_resolve_bridge_mtus(self):
+        self.NeutronAPIContext.side_effect = fake_context({
+            'global_physnet_mtu': 1500,
+            'physical_network_mtus': 'storage:9000,mgmt:jumbo physnet2:1400'})
+        mtus = context.resolve_bridge_mtus()
+        self.assertEqual(mtus['br-storage'], 9000)
+        self.assertEqual(mtus['br-data'], 1500)
+        self.assertEqual(mtus['br-mgmt'], 1500)
+        self.assertEqual(mtus['br-ex'], 1500)
+        self.assertTrue(self.log.called)
+
+    def test_resolve_bridge_mtus_global(self):
+        self.NeutronAPIContext.side_effect = fake_context({
+            'global_physnet_mtu': 9000,
+            'physical_network_mtus': None})
+        mtus = context.resolve_bridge_mtus()
+        self.assertEqual(mtus['br-storage'], 9000)
+        self.assertEqual(mtus['br-data'], 9000)
+
+    @patch.object(context, 'relation_get')
+    @patch.object(context, 'related_units')
+    @patch.object(context, 'relation_ids')
+    def test_resolve_bridge_mtus_provided_only(self, _relation_ids,
+                                               _related_units,
+                                               _relation_get):
+        self.NeutronAPIContext.side_effect = fake_context({
+            'global_physnet_mtu': 1500,
+            'physical_network_mtus': 'storage:9000'})
+        _relation_ids.return_value = ['neutron-plugin-api:1']
+        _related_units.return_value = ['neutron-api/0']
+        _relation_get.return_value = None
+        # The global_physnet_mtu default is left out
+        self.assertEqual(context.resolve_bridge_mtus(provided_only=True),
+                         {'br-storage': 9000})
+        _relation_get.assert_called_once_with(
+            'global-physnet-mtu', rid='neutron-plugin-api:1',
+            unit='neutron-api/0')
+        _relation_get.return_value = '1500'
+        self.assertEqual(context.resolve_bridge_mtus(provided_only=True),
+                         {'br-storage': 9000, 'br-data': 1500,
+                          'br-mgmt': 1500})
+
+
+class TestAutoMTU(CharmTestCase):
+
+    def setUp(self):
+        super(TestAutoMTU, self).setUp(
+            context, ['config', 'NeutronAPIContext', 'interface_index',
+                      'tunnel_local_ip', 'log'])
+        self.config.side_effect = self.test_config.get
+        self.sysfs = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.sysfs)
+        patcher = patch.object(context, 'SYS_CLASS_NET', self.sysfs)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.interface_index.return_value = {
+            'eno1': {'addresses': ['10.5.0.10/24']},
+            'eno2': {'addresses': ['192.168.10.5/24', 'fd00::5/64']},
+        }
+        for interface, mtu in (('eno1', '1500'), ('eno2', '9000')):
+            os.makedirs(os.path.join(self.sysfs, interface))
+            with open(os.path.join(self.sysfs, interface, 'mtu'), 'w') as f:
+                f.write(mtu + '\n')
+        self.NeutronAPIContext.side_effect = fake_context({
+            'overlay_network_type': 'vxlan gre',
+            'network_device_mtu': 1400})
+
+    def test_interface_mtu(self):
+        self.assertEqual(context.interface_mtu('10.5.0.10'), 1500)
+        self.assertEqual(context.interface_mtu('fd00::5'), 9000)
+        self.assertEqual(context.interface_mtu('10.5.0.11'), None)
+
+    def test_auto_mtus(self):
+        self.tunnel_local_ip.return_value = '192.168.10.5'
+        self.assertEqual(context.auto_mtus(), (9000, 8950))
+        self.tunnel_local_ip.return_value = 'fd00::5'
+        self.assertEqual(context.auto_mtus(), (9000, 8930))
+        self.NeutronAPIContext.side_effect = fake_context({
+            'overlay_network_type': 'gre'})
+        self.tunnel_local_ip.return_value = '10.5.0.10'
+        self.assertEqual(context.auto_mtus(), (1500, 1458))
+        self.tunnel_local_ip.return_value = '10.5.0.11'
+        self.assertEqual(context.auto_mtus(), (None, None))
+        self.assertTrue(self.log.called)
+
+    @patch.object(charmhelpers.contrib.openstack.context, 'config')
+    @patch.object(context.ExternalPortContext, 'resolve_ports')
+    def test_external_port_context(self, _resolve_ports, _config):
+        _resolve_ports.return_value = ['eth1']
+        _config.side_effect = self.test_config.get
+        self.test_config.set('ext-port', 'eth1')
+        self.tunnel_local_ip.return_value = '192.168.10.5'
+        with patch.object(charmhelpers.contrib.openstack.context,
+                          'NeutronAPIContext', self.NeutronAPIContext):
+            self.assertEqual(context.ExternalPortContext()(),
+                             {'ext_port': 'eth1', 'ext_port_mtu': 1400})
+            self.test_config.set('auto-mtu', True)
+            self.assertEqual(context.ExternalPortContext()(),
+                             {'ext_port': 'eth1', 'ext_port_mtu': 9000})
+
+    @patch.object(context, 'relation_ids')
+    def test_dhcp_agent_context(self, _relation_ids):
+        _relation_ids.return_value = []
+        self.tunnel_local_ip.return_value = '192.168.10.5'
+        self.test_config.set('instance-mtu', 1400)
+        self.assertEqual(context.DHCPAgentContext()()['instance_mtu'], 1400)
+        self.test_config.set('auto-mtu', True)
+        self.assertEqual(context.DHCPAgentContext()()['instance_mtu'], 8950)
+
+
+class TestKernelBonds(CharmTestCase):
+
+    def setUp(self):
+        super(TestKernelBonds, self).setUp(
+            context, ['config', 'interface_index', 'log'])
+        self.config.side_effect = self.test_config.get
+        self.interface_index.return_value = {
+            'enp1s0f0': {'hwaddr': 'fa:16:3e:00:00:01', 'physical': True,
+                         'addresses': []},
+            'enp1s0f1': {'hwaddr': 'fa:16:3e:00:00:02', 'physical': True,
+                         'addresses': []},
+            'eno1': {'hwaddr': 'fa:16:3e:00:00:03', 'physical': True,
+                     'addresses': ['10.5.0.10/24']},
+        }
+
+    def test_resolve_kernel_bonds(self):
+        self.assertEqual(context.resolve_kernel_bonds(), {})
+        self.test_config.set('bond-mappings', 'bond0:FA:16:3E:00:00:01 '
+                                              'bond0:enp1s0f1 '
+                                              'bond1:eno1 '
+                                              'bond1:fa:16:3e:00:00:04')
+        self.assertEqual(context.resolve_kernel_bonds(), {
+            'enp1s0f0': 'bond0',
+            'enp1s0f1': 'bond0',
+        })
+        self.assertEqual(self.log.call_count, 2)
+
+
+class TestDPDKTunnelEndpoint(CharmTestCase):
+
+    def setUp(self):
+        super(TestDPDKTunnelEndpoint, self).setUp(
+            context, ['config', 'resolve_dpdk_bridges', 'resolve_dpdk_bonds'])
+        self.config.side_effect = self.test_config.get
+        self.test_config.set('enable-dpdk', True)
+        self.test_config.set('data-port', 'br-phynet1:aa:aa:aa:aa:aa:aa '
+                                          'br-phynet2:bond0')
+        self.resolve_dpdk_bridges.return_value = {
+            '0000:001c.01': 'br-phynet1'}
+        self.resolve_dpdk_bonds.return_value = {'0000:001c.02': 'bond0'}
+
+    def test_dpdk_bridges(self):
+        self.assertEqual(context.dpdk_bridges(),
+                         {'br-phynet1', 'br-phynet2'})
+
+    def test_dpdk_tunnel_endpoint(self):
+        self.assertEqual(context.dpdk_tunnel_endpoint(), None)
+        self.test_config.set('dpdk-tunnel-bridge', 'br-phynet2')
+        self.test_config.set('dpdk-tunnel-address', '192.168.100.10/24')
+        self.test_config.set('dpdk-tunnel-routes',
+                             '10.20.0.0/16=192.168.100.1')
+        self.test_config.set('dpdk-tunnel-neighbours',
+                             '192.168.100.1=FA:16:3E:00:00:01')
+        endpoint = context.dpdk_tunnel_endpoint()
+        self.assertEqual(endpoint.bridge, 'br-phynet2')
+        self.assertEqual(str(endpoint.address), '192.168.100.10/24')
+        self.assertEqual(
+            [(str(k), str(v)) for k, v in endpoint.routes.items()],
+            [('10.20.0.0/16', '192.168.100.1')])
+        self.assertEqual(
+            [(str(k), v) for k, v in endpoint.neighbours.items()],
+            [('192.168.100.1', 'fa:16:3e:00:00:01')])
+        self.test_config.set('enable-dpdk', False)
+        self.assertEqual(context.dpdk_tunnel_endpoint(), None)
+
+    def test_dpdk_tunnel_endpoint_invalid(self):
+        self.test_config.set('dpdk-tunnel-address', '192.168.100.10/24')
+        for option, value in (('dpdk-tunnel-bridge', 'br-ex'),
+                              ('dpdk-tunnel-address', '192.168.100.10'),
+                              ('dpdk-tunnel-routes', '10.20.0.0/16'),
+                              ('dpdk-tunnel-neighbours',
+                               '192.168.100.1=fa:16:3e')):
+            self.test_config.set('dpdk-tunnel-bridge', 'br-phynet1')
+            default = self.test_config.get(option)
+            self.test_config.set(option, value)
+            self.assertRaises(ValueError, context.dpdk_tunnel_endpoint)
+            self.test_config.set(option, default)
+
+
 class TestDPDKDeviceContext(CharmTestCase):
 
     _dpdk_bridges = {
@@ -898,19 +1597,54 @@ class TestDPDKDeviceContext(CharmTestCase):
         self.resolve_dpdk_bridges.return_value = self._dpdk_bridges
         self.resolve_dpdk_bonds.return_value = self._dpdk_bonds
 
-    def test_context(self):
+    @patch.object(context, 'get_pci_driver')
+    def test_context(self, _get_pci_driver):
+        _get_pci_driver.return_value = 'ixgbe'
         self.test_config.set('dpdk-driver', 'uio_pci_generic')
-        devices = copy.deepcopy(self._dpdk_bridges)
-        devices.update(self._dpdk_bonds)
         self.assertEqual(self.test_context(), {
-            'devices': devices,
-            'driver': 'uio_pci_generic'
+            'devices': {
+                '0000:00:1c.0': 'uio_pci_generic',
+                '0000:00:1d.0': 'uio_pci_generic',
+                '0000:00:1c.1': 'uio_pci_generic',
+                '0000:00:1d.1': 'uio_pci_generic',
+            },
         })
-        self.config.assert_called_with('dpdk-driver')
+        self.config.assert_any_call('dpdk-driver')
 
-    def test_context_none_driver(self):
+    @patch.object(context, 'get_pci_driver')
+    def test_context_none_driver(self, _get_pci_driver):
+        _get_pci_driver.return_value = 'ixgbe'
         self.assertEqual(self.test_context(), {})
-        self.config.assert_called_with('dpdk-driver')
+        self.config.assert_any_call('dpdk-driver')
+
+    @patch.object(context, 'kv')
+    @patch.object(context, 'get_pci_driver')
+    def test_context_driver_overrides(self, _get_pci_driver, _kv):
+        _get_pci_driver.side_effect = lambda pci: (
+            'mlx5_core' if pci == '0000:00:1d.1' else 'ixgbe')
+        _kv.return_value = unitdata.Storage(':memory:')
+        _kv.return_value.set('fa:16:3e:00:00:01', '0000:00:1c.0')
+        _kv.return_value.set('fa:16:3e:00:00:02', '0000:00:1d.0')
+        self.test_config.set('dpdk-driver', 'uio_pci_generic')
+        self.test_config.set('dpdk-driver-overrides',
+                             'FA:16:3E:00:00:01=vfio-pci '
+                             'fa:16:3e:00:00:02=none')
+        self.assertEqual(self.test_context(), {
+            'devices': {
+                '0000:00:1c.0': 'vfio-pci',
+                '0000:00:1c.1': 'uio_pci_generic',
+            },
+        })
+
+    def test_parse_dpdk_driver_overrides(self):
+        self.assertEqual(context.parse_dpdk_driver_overrides(None), {})
+        self.assertEqual(
+            context.parse_dpdk_driver_overrides('FA:16:3E:00:00:01=none'),
+            {'fa:16:3e:00:00:01': 'none'})
+        for invalid in ('fa:16:3e:00:00:01', 'eth0=vfio-pci',
+                        'fa:16:3e:00:00:01='):
+            self.assertRaises(ValueError,
+                              context.parse_dpdk_driver_overrides, invalid)
 
 
 class TestRemoteRestartContext(CharmTestCase):
@@ -1042,16 +1776,253 @@ class TestHostIPContext(CharmTestCase):
     def test_host_ip_context(self, _get_relation_ip, _kv, _getfqdn,
                              _os_release):
         _os_release.return_value = 'stein'
-        _kv.return_value = {'install_version': 0}
+        db = unitdata.Storage(':memory:')
+        _kv.return_value = db
+        _get_relation_ip.return_value = '10.5.0.1'
         _getfqdn.return_value = 'some'
         ctxt = context.HostIPContext()
         self.assertDictEqual({}, ctxt())
         _getfqdn.return_value = 'some.hostname'
         ctxt = context.HostIPContext()
         self.assertDictEqual({}, ctxt())
-        _kv.return_value = {'neutron-ovs-charm-use-fqdn': True}
+        db.set('neutron-ovs-charm-use-fqdn', True)
         ctxt = context.HostIPContext()
         self.assertDictEqual({'host': 'some.hostname'}, ctxt())
         _os_release.return_value = 'rocky'
         ctxt = context.HostIPContext()
         self.assertDictEqual({}, ctxt())
+
+    @patch.object(context.os_utils, 'os_release')
+    @patch.object(context.socket, 'getfqdn')
+    @patch.object(context, 'kv')
+    @patch.object(context, 'get_relation_ip')
+    def test_host_ip_context_pinned(self, _get_relation_ip, _kv, _getfqdn,
+                                    _os_release):
+        _os_release.return_value = 'stein'
+        db = unitdata.Storage(':memory:')
+        db.set('neutron-ovs-charm-use-fqdn', True)
+        _kv.return_value = db
+        _get_relation_ip.return_value = '10.5.0.1'
+        _getfqdn.return_value = 'some.hostname'
+        self.assertDictEqual({'host': 'some.hostname'},
+                             context.HostIPContext()())
+        self.assertEqual(db.get(context.HOST_FQDN_KEY), 'some.hostname')
+        # Neither a failed lookup nor a different answer changes host
+        db.unset(context.DNS_CACHE_KEY)
+        _getfqdn.return_value = '10.5.0.1'
+        self.assertDictEqual({'host': 'some.hostname'},
+                             context.HostIPContext()())
+        _getfqdn.return_value = 'other.hostname'
+        self.assertDictEqual({'host': 'some.hostname'},
+                             context.HostIPContext()())
+        _get_relation_ip.return_value = None
+        self.assertDictEqual({'host': 'some.hostname'},
+                             context.HostIPContext()())
+        self.assertEqual(_getfqdn.call_count, 1)
+
+
+class TestNameResolution(CharmTestCase):
+
+    def setUp(self):
+        super(TestNameResolution, self).setUp(context,
+                                              TO_PATCH + ['kv', 'log'])
+        self.kv.return_value = unitdata.Storage(':memory:')
+        context._dns_timed_out.clear()
+
+    def test_resolve_host_ip_literal(self):
+        self.assertEqual(context.resolve_host_ip('10.5.0.1'), '10.5.0.1')
+        self.assertEqual(context.resolve_host_ip('2001:db8::1'),
+                         '2001:db8::1')
+        self.get_host_ip.assert_not_called()
+
+    @patch.object(context.time, 'time')
+    def test_resolve_host_ip_cached(self, _time):
+        _time.return_value = 1000
+        self.get_host_ip.return_value = '10.5.0.1'
+        self.assertEqual(context.resolve_host_ip('host1'), '10.5.0.1')
+        self.get_host_ip.return_value = '10.5.0.2'
+        self.assertEqual(context.resolve_host_ip('host1'), '10.5.0.1')
+        self.assertEqual(self.get_host_ip.call_count, 1)
+        # Positive answers expire after DNS_POSITIVE_TTL
+        _time.return_value = 1000 + context.DNS_POSITIVE_TTL + 1
+        self.assertEqual(context.resolve_host_ip('host1'), '10.5.0.2')
+        self.assertEqual(self.get_host_ip.call_count, 2)
+
+    @patch.object(context.time, 'time')
+    def test_resolve_host_ip_negative_cached(self, _time):
+        _time.return_value = 1000
+        self.get_host_ip.return_value = None
+        self.assertEqual(context.resolve_host_ip('host1', 'fb'), 'fb')
+        self.assertEqual(context.resolve_host_ip('host1', 'fb'), 'fb')
+        self.assertEqual(self.get_host_ip.call_count, 1)
+        # Negative answers expire after DNS_NEGATIVE_TTL
+        self.get_host_ip.return_value = '10.5.0.1'
+        _time.return_value = 1000 + context.DNS_NEGATIVE_TTL + 1
+        self.assertEqual(context.resolve_host_ip('host1', 'fb'), '10.5.0.1')
+
+    @patch.object(context.time, 'time')
+    def test_resolve_host_ip_timeout(self, _time):
+        _time.return_value = 1000
+        self.get_host_ip.return_value = '10.5.0.1'
+        self.assertEqual(context.resolve_host_ip('host1', 'fb'), '10.5.0.1')
+        # A timed out lookup falls back to the last known answer and is
+        # not retried for the rest of the hook
+        _time.return_value = 1000 + context.DNS_POSITIVE_TTL + 1
+        self.get_host_ip.side_effect = dns.exception.Timeout
+        self.assertEqual(context.resolve_host_ip('host1', 'fb'), '10.5.0.1')
+        self.assertEqual(context.resolve_host_ip('host1', 'fb'), '10.5.0.1')
+        self.assertEqual(self.get_host_ip.call_count, 2)
+        self.assertEqual(context.resolve_host_ip('host2', 'fb'), 'fb')
+        # Timeouts are not cached beyond the hook
+        context._dns_timed_out.clear()
+        self.get_host_ip.side_effect = None
+        self.get_host_ip.return_value = '10.5.0.2'
+        self.assertEqual(context.resolve_host_ip('host2', 'fb'), '10.5.0.2')
+
+    @patch('dns.resolver.get_default_resolver')
+    def test_dns_resolver_lifetime(self, _get_default_resolver):
+        resolver = _get_default_resolver.return_value
+        resolver.timeout = 10
+        self.assertEqual(context._dns_resolver(), dns)
+        self.assertEqual(resolver.lifetime, context.DNS_TIMEOUT)
+        self.assertEqual(resolver.timeout, context.DNS_TIMEOUT)
+
+    @patch.object(context.socket, 'getfqdn')
+    def test_resolve_fqdn(self, _getfqdn):
+        _getfqdn.side_effect = lambda address: address
+        self.assertEqual(context.resolve_fqdn('10.5.0.1'), None)
+        _getfqdn.side_effect = None
+        _getfqdn.return_value = 'host1.maas'
+        self.assertEqual(context.resolve_fqdn('10.5.0.2'), 'host1.maas')
+        _getfqdn.assert_called_with('10.5.0.2')
+
+    @patch.object(context.time, 'time')
+    def test_resolve_host_ip_failure_keeps_last_answer(self, _time):
+        _time.return_value = 1000
+        self.get_host_ip.return_value = '10.5.0.1'
+        self.assertEqual(context.resolve_host_ip('host1', 'fb'), '10.5.0.1')
+        _time.return_value = 1000 + context.DNS_POSITIVE_TTL + 1
+        self.get_host_ip.side_effect = dns.resolver.NoNameservers
+        self.assertEqual(context.resolve_host_ip('host1', 'fb'), '10.5.0.1')
+        self.assertEqual(context.resolve_host_ip('host1', 'fb'), '10.5.0.1')
+        self.assertEqual(self.get_host_ip.call_count, 2)
+
+
+class TestInterfaceIndex(CharmTestCase):
+
+    def setUp(self):
+        super(TestInterfaceIndex, self).setUp(context, TO_PATCH)
+        self.config.side_effect = self.test_config.get
+        charmhelpers.core.hookenv.cache = {}
+        self.sysfs = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.sysfs)
+        self.sys_class_net = os.path.join(self.sysfs, 'class', 'net')
+        os.makedirs(self.sys_class_net)
+        self._add_interface('lo', '00:00:00:00:00:00', virtual=True)
+        self._add_interface('eth0', 'fa:16:3e:00:00:01')
+        self._add_interface('eth1', 'fa:16:3e:00:00:02', master='bond0')
+        self._add_interface('bond0', 'fa:16:3e:00:00:02', virtual=True,
+                            bonding=True)
+        self._add_interface('eth2', 'fa:16:3e:00:00:03', brport=True)
+        self._add_interface('eth3', 'fa:16:3e:00:00:04')
+        self.addresses = {
+            'eth0': {context.netifaces.AF_INET: [
+                {'addr': '10.5.0.10', 'netmask': '255.255.0.0'}],
+                context.netifaces.AF_INET6: [
+                {'addr': 'fe80::1%eth0', 'netmask': 'ffff:ffff::/64'},
+                {'addr': '2001:db8::10', 'netmask': 'ffff:ffff::/32'}]},
+        }
+        patcher = patch.object(context, 'SYS_CLASS_NET', self.sys_class_net)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(context.netifaces, 'ifaddresses',
+                               side_effect=lambda i: self.addresses.get(i, {}))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        super(TestInterfaceIndex, self).tearDown()
+        charmhelpers.core.hookenv.cache = {}
+
+    def _add_interface(self, name, hwaddr, virtual=False, master=None,
+                       bonding=False, brport=False):
+        bus = 'virtual' if virtual else 'pci0000:00'
+        device = os.path.join(self.sysfs, 'devices', bus, 'net', name)
+        os.makedirs(device)
+        with open(os.path.join(device, 'address'), 'w') as f:
+            f.write(hwaddr + '\n')
+        if bonding:
+            os.mkdir(os.path.join(device, 'bonding'))
+        if brport:
+            os.mkdir(os.path.join(device, 'brport'))
+        if master:
+            os.symlink(os.path.join(self.sys_class_net, master),
+                       os.path.join(device, 'master'))
+        os.symlink(device, os.path.join(self.sys_class_net, name))
+
+    def test_interface_index(self):
+        index = context.interface_index()
+        self.assertEqual(sorted(index.keys()),
+                         ['bond0', 'eth0', 'eth1', 'eth2', 'eth3', 'lo'])
+        self.assertEqual(index['eth0'], {
+            'hwaddr': 'fa:16:3e:00:00:01',
+            'addresses': ['10.5.0.10/16', '2001:db8::10/32'],
+            'physical': True,
+            'bond_master': None,
+            'bridge_member': False,
+        })
+        self.assertEqual(index['eth1']['bond_master'], 'bond0')
+        self.assertTrue(index['eth2']['bridge_member'])
+        self.assertFalse(index['lo']['physical'])
+        self.assertFalse(index['bond0']['physical'])
+
+    def test_interface_index_cached(self):
+        context.interface_index()
+        context.interface_index()
+        self.assertEqual(context.netifaces.ifaddresses.call_count, 6)
+
+    def test_resolve_ports(self):
+        ctxt = context.DataPortContext()
+        self.assertEqual(
+            sorted(ctxt.resolve_ports(['fa:16:3e:00:00:01',
+                                       'fa:16:3e:00:00:02',
+                                       'fa:16:3e:00:00:03',
+                                       'fa:16:3e:00:00:04',
+                                       'eth9', 'lo'])),
+            # eth0 has an address, eth2 is a bridge member, eth9 is absent
+            ['bond0', 'eth3', 'lo'])
+        self.assertEqual(ctxt.resolve_ports([]), None)
+
+    def test_data_port_context(self):
+        self.test_config.set('data-port',
+                             'br-data:fa:16:3e:00:00:04 br-bond:bond0')
+        self.assertEqual(context.DataPortContext()(),
+                         {'eth3': 'br-data', 'bond0': 'br-bond'})
+
+    @patch.object(context, 'resolve_bridge_mtus')
+    def test_phy_nic_mtu_context(self, _resolve_bridge_mtus):
+        self.test_config.set('data-port',
+                             'br-data:fa:16:3e:00:00:04 br-bond:bond0')
+        _resolve_bridge_mtus.return_value = {'br-data': 9000,
+                                             'br-bond': 1500}
+        self.glob.glob.return_value = []
+        # Data ports get their MTU through OVS
+        self.assertEqual(context.PhyNICMTUContext()(), {})
+        self.glob.glob.side_effect = lambda path: (
+            ['/sys/class/net/eth3/lower_eth1'] if '/eth3/' in path else [])
+        self.assertEqual(context.PhyNICMTUContext()(),
+                         {'devs': 'eth1', 'mtu': 9000})
+        _resolve_bridge_mtus.assert_called_with(provided_only=True)
+        # Left alone without an MTU set by neutron-api
+        _resolve_bridge_mtus.return_value = {}
+        self.assertEqual(context.PhyNICMTUContext()(), {})
+
+    def test_get_address_in_network(self):
+        self.assertEqual(
+            context.get_address_in_network('10.5.0.0/16'), '10.5.0.10')
+        self.assertEqual(
+            context.get_address_in_network('192.168.0.0/24 2001:db8::/32'),
+            '2001:db8::10')
+        self.assertEqual(
+            context.get_address_in_network('192.168.0.0/24', 'fb'), 'fb')
+        self.assertEqual(context.get_address_in_network(None, 'fb'), 'fb')
@@ -16,6 +16,8 @@ from mock import MagicMock, patch, mock_open
 
 from test_utils import CharmTestCase
 
+import charmhelpers.core.unitdata as unitdata
+
 with patch('charmhelpers.core.hookenv.config') as config:
     config.return_value = 'neutron'
     import neutron_ovs_utils as utils
@@ -52,6 +54,16 @@ TO_PATCH = [
     'purge_packages',
     'determine_purge_packages',
     'is_container',
+    'is_unit_paused_set',
+    'use_dpdk',
+    'enable_ovs_dpdk',
+    'determine_reconcile_subsystems',
+    'determine_relation_subsystems',
+    'request_full_reconcile',
+    'request_full_reconcile_after_reboot',
+    'clear_full_reconcile',
+    'kv',
+    'atexit',
 ]
 NEUTRON_CONF_DIR = "/etc/neutron"
 
@@ -65,6 +77,11 @@ class NeutronOVSHooksTests(CharmTestCase):
 
         self.config.side_effect = self.test_config.get
         self.is_container.return_value = False
+        self.is_unit_paused_set.return_value = False
+        self.use_dpdk.return_value = False
+        self.determine_reconcile_subsystems.return_value = set(
+            utils.RECONCILE_SUBSYSTEMS)
+        self.determine_relation_subsystems.return_value = set()
         hooks.hooks._config_save = False
 
     def _call_hook(self, hookname):
@@ -119,12 +136,98 @@ class NeutronOVSHooksTests(CharmTestCase):
                         self.CONFIGS.write.assert_not_called()
                     self.assertEqual(0, mock_restart.call_count)
 
+    @patch('neutron_ovs_hooks.enable_sriov', MagicMock(return_value=False))
+    @patch.object(hooks, 'restart_map', MagicMock(return_value={}))
+    @patch.object(hooks.neutron_ovs_context, 'record_legacy_cpu_mask')
+    def test_upgrade_charm_dpdk(self, _record_legacy_cpu_mask):
+        self._call_hook('upgrade-charm')
+        _record_legacy_cpu_mask.assert_not_called()
+        self.use_dpdk.return_value = True
+        self._call_hook('upgrade-charm')
+        _record_legacy_cpu_mask.assert_called_once_with()
+        self.request_full_reconcile.assert_called_with()
+
     def test_config_changed_dvr(self):
         self._call_hook('config-changed')
         self.install_packages.assert_called_with()
         self.assertTrue(self.CONFIGS.write_all.called)
         self.configure_ovs.assert_called_with()
 
+    def test_config_changed_paused(self):
+        self.is_unit_paused_set.return_value = True
+        self._call_hook('config-changed')
+        self.request_full_reconcile.assert_called_once_with()
+        self.install_packages.assert_not_called()
+        self.configure_ovs.assert_not_called()
+        self.assertFalse(self.CONFIGS.write_all.called)
+
+    def test_config_changed_templates_only(self):
+        self.determine_reconcile_subsystems.return_value = set([
+            utils.RECONCILE_TEMPLATES])
+        self._call_hook('config-changed')
+        self.install_packages.assert_not_called()
+        self.purge_packages.assert_not_called()
+        self.create_sysctl.assert_not_called()
+        self.configure_ovs.assert_not_called()
+        self.configure_sriov.assert_not_called()
+        self.relation_set.assert_not_called()
+        self.assertTrue(self.CONFIGS.write_all.called)
+        self.clear_full_reconcile.assert_not_called()
+
+    def test_config_changed_full_reconcile(self):
+        self._call_hook('config-changed')
+        self.request_full_reconcile_after_reboot.assert_called_once_with()
+        self.configure_ovs.assert_called_once_with()
+        self.assertTrue(self.CONFIGS.write_all.called)
+        self.clear_full_reconcile.assert_called_once_with()
+
+    def test_full_reconcile(self):
+        self.determine_reconcile_subsystems.return_value = set(
+            utils.RECONCILE_SUBSYSTEMS)
+        hooks.full_reconcile()
+        self.determine_reconcile_subsystems.assert_called_once_with(
+            force=True)
+        self.install_packages.assert_called_once_with()
+        self.configure_ovs.assert_called_once_with()
+        self.configure_sriov.assert_called_once_with()
+        self.assertTrue(self.CONFIGS.write_all.called)
+        self.clear_full_reconcile.assert_called_once_with()
+
+    def test_config_changed_dpdk_only(self):
+        self.use_dpdk.return_value = True
+        self.determine_reconcile_subsystems.return_value = set([
+            utils.RECONCILE_DPDK])
+        self._call_hook('config-changed')
+        self.install_packages.assert_not_called()
+        self.enable_ovs_dpdk.assert_called_once_with()
+        self.configure_ovs.assert_called_once_with()
+        self.assertFalse(self.CONFIGS.write_all.called)
+
+    def test_config_changed_nothing_changed(self):
+        self.determine_reconcile_subsystems.return_value = set()
+        self._call_hook('config-changed')
+        self.install_packages.assert_not_called()
+        self.configure_ovs.assert_not_called()
+        self.assertFalse(self.CONFIGS.write_all.called)
+
+    def test_neutron_plugin_changed(self):
+        self.determine_relation_subsystems.return_value = set([
+            utils.RECONCILE_TEMPLATES])
+        self._call_hook('neutron-plugin-relation-changed')
+        self.determine_relation_subsystems.assert_called_once_with(
+            'neutron-plugin')
+        self.request_full_reconcile_after_reboot.assert_called_once_with()
+        self.install_packages.assert_not_called()
+        self.configure_ovs.assert_not_called()
+        self.configure_sriov.assert_not_called()
+        self.assertTrue(self.CONFIGS.write_all.called)
+
+    def test_neutron_plugin_changed_no_delta(self):
+        self._call_hook('neutron-plugin-relation-changed')
+        self.install_packages.assert_not_called()
+        self.configure_ovs.assert_not_called()
+        self.assertFalse(self.CONFIGS.write_all.called)
+
     def test_config_changed_sysctl_overrides(self):
         self.test_config.set(
             'sysctl',
@@ -275,6 +378,88 @@ class NeutronOVSHooksTests(CharmTestCase):
             relation_id=None
         )
 
+    @patch.object(hooks.neutron_ovs_context, 'HostIPContext')
+    def test_neutron_plugin_joined_unchanged(self, _HostIPContext):
+        self.kv.return_value = unitdata.Storage(':memory:')
+        self.enable_nova_metadata.return_value = False
+        self.enable_local_dhcp.return_value = False
+        self.use_dvr.return_value = False
+        _HostIPContext()().get.return_value = 'fq.dn'
+        hooks.neutron_plugin_joined(relation_id='neutron-plugin:1')
+        self.relation_set.assert_called_once_with(
+            relation_id='neutron-plugin:1',
+            **{'metadata-shared-secret': None, 'host': 'fq.dn'})
+        self.relation_set.reset_mock()
+        hooks.neutron_plugin_joined(relation_id='neutron-plugin:1')
+        self.relation_set.assert_not_called()
+        # restart requests are always published
+        hooks.neutron_plugin_joined(relation_id='neutron-plugin:1',
+                                    request_restart=True)
+        self.assertTrue(self.relation_set.called)
+        self.assertTrue(
+            'restart-nonce' in self.relation_set.call_args[1])
+        self.relation_set.reset_mock()
+        hooks.neutron_plugin_joined(relation_id='neutron-plugin:1')
+        self.relation_set.assert_not_called()
+        # changed data is published
+        _HostIPContext()().get.return_value = 'other.fq.dn'
+        hooks.neutron_plugin_joined(relation_id='neutron-plugin:1')
+        self.relation_set.assert_called_once_with(
+            relation_id='neutron-plugin:1',
+            **{'metadata-shared-secret': None, 'host': 'other.fq.dn'})
+
+    def test_amqp_joined_unchanged(self):
+        self.kv.return_value = unitdata.Storage(':memory:')
+        hooks.amqp_joined(relation_id='amqp:2')
+        hooks.amqp_joined(relation_id='amqp:2')
+        self.relation_set.assert_called_once_with(
+            relation_id='amqp:2',
+            username='neutron',
+            vhost='openstack')
+
+    def test_amqp_joined_failed_hook_republishes(self):
+        db = unitdata.Storage(':memory:')
+        self.kv.return_value = db
+        hooks.amqp_joined(relation_id='amqp:2')
+        # Juju discards the relation data of a failed hook, as does the
+        # kv store for its uncommitted state
+        db.flush(False)
+        hooks.amqp_joined(relation_id='amqp:2')
+        self.assertEqual(self.relation_set.call_count, 2)
+
+    def test_amqp_joined_flushed_on_completion(self):
+        db = unitdata.Storage(':memory:')
+        self.kv.return_value = db
+        hooks.amqp_joined(relation_id='amqp:2')
+        self.atexit.assert_called_once_with(db.flush)
+        self.atexit.reset_mock()
+        hooks.amqp_joined(relation_id='amqp:2')
+        self.atexit.assert_not_called()
+
+    @patch.object(hooks, 'current_relation_id')
+    def test_relation_broken(self, _current_relation_id):
+        db = unitdata.Storage(':memory:')
+        self.kv.return_value = db
+        hooks.amqp_joined(relation_id='amqp:2')
+        hooks.amqp_joined(relation_id='amqp:3')
+        _current_relation_id.return_value = 'amqp:2'
+        self._call_hook('amqp-relation-broken')
+        self.assertEqual(
+            list(db.get(hooks.PUBLISHED_RELATION_DATA_KEY)), ['amqp:3'])
+        # A relation established again with the same id publishes its data
+        self.relation_set.reset_mock()
+        hooks.amqp_joined(relation_id='amqp:2')
+        self.relation_set.assert_called_once_with(
+            relation_id='amqp:2',
+            username='neutron',
+            vhost='openstack')
+        # Relations without published data are left alone
+        _current_relation_id.return_value = 'neutron-plugin:1'
+        self._call_hook('neutron-plugin-relation-broken')
+        self.assertEqual(
+            sorted(db.get(hooks.PUBLISHED_RELATION_DATA_KEY)),
+            ['amqp:2', 'amqp:3'])
+
     def test_amqp_changed(self):
         self.CONFIGS.complete_contexts.return_value = ['amqp']
         self._call_hook('amqp-relation-changed')
@@ -283,3 +468,20 @@ class NeutronOVSHooksTests(CharmTestCase):
     def test_amqp_departed(self):
         self._call_hook('amqp-relation-departed')
         self.assertTrue(self.CONFIGS.write.called_with(NEUTRON_CONF))
+
+    @patch.object(hooks, 'record_hook_profile')
+    @patch.object(hooks, 'assess_status')
+    @patch.object(hooks, 'hook_name')
+    @patch.object(hooks, 'profile_hook')
+    @patch.object(hooks.hooks, 'execute')
+    def test_main_profiled(self, _execute, _profile_hook, _hook_name,
+                           _assess_status, _record_hook_profile):
+        summary = {}
+        _profile_hook.return_value.__enter__.return_value = summary
+        _hook_name.return_value = 'config-changed'
+        _record_hook_profile.return_value = {'dns-blocked-seconds': 0.1}
+        hooks.main()
+        _profile_hook.assert_called_once_with('config-changed')
+        self.assertTrue(_execute.called)
+        self.assertTrue(_assess_status.called)
+        self.assertEqual(summary, {'dns-blocked-seconds': 0.1})
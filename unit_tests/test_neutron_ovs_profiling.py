@@ -0,0 +1,90 @@
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import marshal
+import os
+import shutil
+import tempfile
+
+from mock import patch
+
+from test_utils import CharmTestCase
+import neutron_ovs_profiling as profiling
+
+TO_PATCH = [
+    'config',
+    'log',
+]
+
+
+class TestHookProfiling(CharmTestCase):
+
+    def setUp(self):
+        super(TestHookProfiling, self).setUp(profiling, TO_PATCH)
+        self.config.side_effect = self.test_config.get
+        self.test_config.set('profile-hooks', True)
+        self.test_config.set('profile-hooks-retention', 2)
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        patcher = patch.object(profiling, 'PROFILE_DIR',
+                               os.path.join(self.tmpdir, 'profiles'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _run_hook(self, hook, start):
+        with patch.object(profiling.time, 'time', return_value=start):
+            with profiling.profile_hook(hook) as summary:
+                summary['dns-blocked-seconds'] = 0.5
+                sorted(range(100))
+
+    def test_disabled(self):
+        self.test_config.set('profile-hooks', False)
+        with patch.dict(os.environ, {profiling.PROFILE_ENV: ''}):
+            self._run_hook('config-changed', 1000)
+        self.assertEqual(profiling.list_profiles(), [])
+
+    def test_enabled_by_environment(self):
+        self.test_config.set('profile-hooks', False)
+        with patch.dict(os.environ, {profiling.PROFILE_ENV: '1'}):
+            self.assertTrue(profiling.profiling_enabled())
+
+    def test_profile_hook(self):
+        self._run_hook('config-changed', 1000)
+        profiles = profiling.list_profiles()
+        self.assertEqual(len(profiles), 1)
+        self.assertEqual(profiles[0]['name'], '1000.000000-config-changed')
+        self.assertEqual(profiles[0]['hook'], 'config-changed')
+        self.assertEqual(profiles[0]['dns-blocked-seconds'], 0.5)
+        self.assertIn('peak', profiles[0]['traced-memory'])
+        path = profiling.profile_path('1000.000000-config-changed')
+        with gzip.open(path, 'rb') as f:
+            stats = marshal.loads(f.read())
+        self.assertTrue(any('sorted' in func[2] for func in stats))
+
+    def test_ring_buffer(self):
+        self._run_hook('install', 1000)
+        self._run_hook('config-changed', 1001)
+        self._run_hook('update-status', 1002)
+        self.assertEqual(
+            [p['name'] for p in profiling.list_profiles()],
+            ['1001.000000-config-changed', '1002.000000-update-status'])
+        self.assertEqual(len(os.listdir(profiling.PROFILE_DIR)), 4)
+
+    def test_profile_path_invalid(self):
+        self._run_hook('install', 1000)
+        self.assertRaises(ValueError, profiling.profile_path,
+                          '1001.000000-install')
+        self.assertRaises(ValueError, profiling.profile_path,
+                          '../../etc/passwd')
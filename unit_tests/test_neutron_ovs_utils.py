@@ -13,9 +13,10 @@
 # limitations under the License.
 
 import hashlib
+import json
 import subprocess
 
-from mock import MagicMock, patch, call
+from mock import ANY, MagicMock, patch, call
 from collections import OrderedDict
 import charmhelpers.contrib.openstack.templating as templating
 
@@ -26,9 +27,11 @@ import neutron_ovs_context
 
 from test_utils import (
     CharmTestCase,
+    patch_open,
 )
 import charmhelpers
 import charmhelpers.core.hookenv as hookenv
+import charmhelpers.core.unitdata as unitdata
 
 
 TO_PATCH = [
@@ -41,6 +44,12 @@ TO_PATCH = [
     'dpdk_set_bond_config',
     'dpdk_set_mtu_request',
     'dpdk_set_interfaces_mtu',
+    'dpdk_set_interface_options',
+    'dpdk_set_interface_other_config',
+    'configure_datapath_tuning',
+    'configure_dpdk_tunnel_endpoint',
+    'bind_dpdk_devices',
+    'configure_hardware_offload',
     'apt_install',
     'apt_update',
     'config',
@@ -58,6 +67,7 @@ TO_PATCH = [
     'headers_package',
     'status_set',
     'use_dpdk',
+    'use_afxdp',
     'os_application_version_set',
     'remote_restart',
     'PCINetDevices',
@@ -108,8 +118,27 @@ class TestNeutronOVSUtils(CharmTestCase):
         self.neutron_plugin_attribute.side_effect = _mock_npa
         self.config.side_effect = self.test_config.get
         self.use_dpdk.return_value = False
+        self.use_afxdp.return_value = False
         self.ovs_has_late_dpdk_init.return_value = False
         self.ovs_vhostuser_client.return_value = False
+        self.bind_dpdk_devices.return_value = {}
+        patcher = patch.object(neutron_ovs_context, 'resolve_kernel_bridges',
+                               return_value=OrderedDict())
+        self.resolve_kernel_bridges = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(neutron_ovs_context, 'config',
+                               side_effect=self.test_config.get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(neutron_ovs_context, 'NeutronAPIContext',
+                               return_value=DummyContext(
+                                   return_value={'global_physnet_mtu': 1500}))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(neutron_ovs_context, '_neutron_api_provides',
+                               return_value=True)
+        self._neutron_api_provides = patcher.start()
+        self.addCleanup(patcher.stop)
 
     def tearDown(self):
         # Reset cached cache
@@ -442,6 +471,22 @@ class TestNeutronOVSUtils(CharmTestCase):
         [self.assertIn(q_conf, _map.keys()) for q_conf in confs]
         self.assertEqual(_map[nutils.NEUTRON_CONF]['services'], svcs)
 
+    @patch.object(nutils, 'use_dpdk')
+    @patch.object(nutils, 'use_dvr')
+    def test_resource_map_dpdk_late_init(self, _use_dvr, _use_dpdk):
+        _use_dvr.return_value = False
+        _use_dpdk.return_value = True
+        self.lsb_release.return_value = {'DISTRIB_CODENAME': 'xenial'}
+        for release in ('liberty', 'mitaka'):
+            self.os_release.return_value = release
+            self.ovs_has_late_dpdk_init.return_value = False
+            self.assertEqual(
+                nutils.restart_map()[nutils.OVS_DEFAULT],
+                ['openvswitch-switch'])
+            # DPDK_OPTS are not rendered, nor restarted on, with late init
+            self.ovs_has_late_dpdk_init.return_value = True
+            self.assertNotIn(nutils.OVS_DEFAULT, nutils.restart_map())
+
     @patch.object(nutils, 'enable_sriov')
     @patch.object(nutils, 'use_dvr')
     def test_resource_map_kilo_sriov(self, _use_dvr, _enable_sriov):
@@ -558,16 +603,19 @@ class TestNeutronOVSUtils(CharmTestCase):
             self.assertTrue(expect[item] == _restart_map[item])
         self.assertEqual(len(_restart_map.keys()), 2)
 
-    @patch('charmhelpers.contrib.openstack.context.list_nics',
-           return_value=['eth0'])
+    @patch.object(neutron_ovs_context, 'interface_index')
     @patch.object(nutils, 'use_dvr')
-    @patch('charmhelpers.contrib.openstack.context.config')
-    def test_configure_ovs_ovs_data_port(self, mock_config, _use_dvr, _nics):
+    @patch.object(neutron_ovs_context, 'config')
+    def test_configure_ovs_ovs_data_port(self, mock_config, _use_dvr,
+                                         _index):
         _use_dvr.return_value = False
         self.is_linuxbridge_interface.return_value = False
         mock_config.side_effect = self.test_config.get
         self.config.side_effect = self.test_config.get
-        _nics.return_value = ['eth0']
+        _index.return_value = {
+            'eth0': {'hwaddr': 'fa:16:3e:00:00:01', 'addresses': [],
+                     'physical': True, 'bond_master': None,
+                     'bridge_member': False}}
         self.ExternalPortContext.return_value = \
             DummyContext(return_value=None)
         # Test back-compatibility i.e. port but no bridge (so br-data is
@@ -594,12 +642,48 @@ class TestNeutronOVSUtils(CharmTestCase):
         # Not called since we have a bogus bridge in data-ports
         self.assertFalse(self.add_bridge_port.called)
 
-    @patch('charmhelpers.contrib.openstack.context.list_nics',
-           return_value=['eth0', 'br-juju'])
+    @patch.object(neutron_ovs_context, 'NeutronAPIContext')
+    @patch.object(neutron_ovs_context, 'interface_index')
     @patch.object(nutils, 'use_dvr')
-    @patch('charmhelpers.contrib.openstack.context.config')
+    def test_configure_ovs_data_port_mtu(self, _use_dvr, _index,
+                                         _NeutronAPIContext):
+        _use_dvr.return_value = False
+        _NeutronAPIContext.return_value = DummyContext(return_value={
+            'global_physnet_mtu': 1500,
+            'physical_network_mtus': 'physnet1:9000'})
+        self.is_linuxbridge_interface.return_value = False
+        self.ExternalPortContext.return_value = \
+            DummyContext(return_value=None)
+        _index.return_value = {
+            'eth0': {'hwaddr': 'fa:16:3e:00:00:01', 'addresses': [],
+                     'physical': True, 'bond_master': None,
+                     'bridge_member': False},
+            'eth1': {'hwaddr': 'fa:16:3e:00:00:02', 'addresses': [],
+                     'physical': True, 'bond_master': None,
+                     'bridge_member': False}}
+        self.test_config.set('bridge-mappings',
+                             'physnet1:br-foo physnet2:br-bar')
+        self.test_config.set('data-port', 'br-foo:eth0 br-bar:eth1')
+        nutils.configure_ovs()
+        self.add_bridge_port.assert_has_calls([
+            call('br-foo', 'eth0', promisc=True),
+            call('br-bar', 'eth1', promisc=True),
+        ], any_order=True)
+        self.dpdk_set_mtu_request.assert_has_calls([
+            call('eth0', 9000),
+            call('eth1', 1500),
+        ], any_order=True)
+        # Without a global MTU from neutron-api only physnet MTUs are set
+        self._neutron_api_provides.return_value = False
+        self.dpdk_set_mtu_request.reset_mock()
+        nutils.configure_ovs()
+        self.dpdk_set_mtu_request.assert_called_once_with('eth0', 9000)
+
+    @patch.object(neutron_ovs_context, 'interface_index')
+    @patch.object(nutils, 'use_dvr')
+    @patch.object(neutron_ovs_context, 'config')
     def test_configure_ovs_data_port_with_bridge(
-            self, mock_config, _use_dvr, _nics):
+            self, mock_config, _use_dvr, _index):
         _use_dvr.return_value = False
         self.is_linuxbridge_interface.return_value = True
         mock_config.side_effect = self.test_config.get
@@ -610,14 +694,17 @@ class TestNeutronOVSUtils(CharmTestCase):
         # Now test with bridge:bridge format
         self.test_config.set('bridge-mappings', 'physnet1:br-foo')
         self.test_config.set('data-port', 'br-foo:br-juju')
-        _nics.return_value = ['br-juju']
+        _index.return_value = {
+            'br-juju': {'hwaddr': 'fa:16:3e:00:00:02', 'addresses': [],
+                        'physical': False, 'bond_master': None,
+                        'bridge_member': False}}
         self.add_bridge.reset_mock()
         self.add_bridge_port.reset_mock()
         nutils.configure_ovs()
         self.assertTrue(self.add_ovsbridge_linuxbridge.called)
 
     @patch.object(nutils, 'use_dvr')
-    @patch('charmhelpers.contrib.openstack.context.config')
+    @patch.object(neutron_ovs_context, 'config')
     def test_configure_ovs_starts_service_if_required(self, mock_config,
                                                       _use_dvr):
         _use_dvr.return_value = False
@@ -628,7 +715,7 @@ class TestNeutronOVSUtils(CharmTestCase):
         self.assertTrue(self.full_restart.called)
 
     @patch.object(nutils, 'use_dvr')
-    @patch('charmhelpers.contrib.openstack.context.config')
+    @patch.object(neutron_ovs_context, 'config')
     def test_configure_ovs_doesnt_restart_service(self, mock_config, _use_dvr):
         _use_dvr.return_value = False
         mock_config.side_effect = self.test_config.get
@@ -638,7 +725,7 @@ class TestNeutronOVSUtils(CharmTestCase):
         self.assertFalse(self.full_restart.called)
 
     @patch.object(nutils, 'use_dvr')
-    @patch('charmhelpers.contrib.openstack.context.config')
+    @patch.object(neutron_ovs_context, 'config')
     def test_configure_ovs_ovs_ext_port(self, mock_config, _use_dvr):
         _use_dvr.return_value = True
         mock_config.side_effect = self.test_config.get
@@ -654,6 +741,206 @@ class TestNeutronOVSUtils(CharmTestCase):
         ])
         self.add_bridge_port.assert_called_with('br-ex', 'eth0')
 
+    @patch.object(nutils, 'set_bond_config')
+    @patch.object(nutils, 'add_bridge_bond')
+    @patch.object(neutron_ovs_context, 'NeutronAPIContext')
+    @patch.object(neutron_ovs_context, 'resolve_kernel_bonds')
+    @patch.object(nutils, 'use_dvr')
+    @patch.object(neutron_ovs_context, 'config')
+    def test_configure_ovs_kernel_bonds(self, mock_config, _use_dvr,
+                                        _resolve_kernel_bonds,
+                                        _NeutronAPIContext,
+                                        _add_bridge_bond, _set_bond_config):
+        _use_dvr.return_value = False
+        _NeutronAPIContext.return_value = DummyContext(
+            return_value={'global_physnet_mtu': 9000})
+        _resolve_kernel_bonds.return_value = OrderedDict([
+            ('enp1s0f0', 'bond0'), ('enp1s0f1', 'bond0'),
+            ('enp2s0f0', 'bond1')])
+        self.parse_data_port_mappings.return_value = {'bond0': 'br-data'}
+        mock_config.side_effect = self.test_config.get
+        self.test_config.set('bond-config',
+                             'bond0:balance-tcp:active:fast:'
+                             'lb-output-action=true')
+        nutils.configure_ovs()
+        self.add_bridge.assert_has_calls([call('br-data', 'system')])
+        _add_bridge_bond.assert_called_once_with(
+            'br-data', 'bond0', ['enp1s0f0', 'enp1s0f1'])
+        self.dpdk_set_interfaces_mtu.assert_called_once_with(
+            9000, ['enp1s0f0', 'enp1s0f1'])
+        _set_bond_config.assert_called_once_with(
+            'bond0', {'mode': 'balance-tcp',
+                      'lacp': 'active',
+                      'lacp-time': 'fast',
+                      'lb-output-action': 'true'})
+
+    @patch.object(neutron_ovs_context, 'NeutronAPIContext')
+    @patch.object(neutron_ovs_context, 'resolve_dpdk_bonds')
+    @patch.object(neutron_ovs_context, 'resolve_dpdk_bridges')
+    @patch.object(nutils, 'use_dvr')
+    @patch('charmhelpers.contrib.openstack.context.config')
+    def test_configure_ovs_dpdk_kernel_ports(self, mock_config, _use_dvr,
+                                             _resolve_dpdk_bridges,
+                                             _resolve_dpdk_bonds,
+                                             _NeutronAPIContext):
+        _NeutronAPIContext.return_value = DummyContext(
+            return_value={'global_physnet_mtu': 9000})
+        _resolve_dpdk_bridges.return_value = OrderedDict([
+            ('0000:001c.01', 'br-phynet1')])
+        _resolve_dpdk_bonds.return_value = OrderedDict()
+        self.resolve_kernel_bridges.return_value = OrderedDict([
+            ('eno1', 'br-mgmt')])
+        self.test_config.set('bridge-mappings', 'physnet1:br-phynet1 '
+                             'mgmt:br-mgmt vlan:br-vlan')
+        self.is_linuxbridge_interface.return_value = False
+        _use_dvr.return_value = False
+        self.use_dpdk.return_value = True
+        self.ovs_has_late_dpdk_init.return_value = True
+        mock_config.side_effect = self.test_config.get
+        self.config.side_effect = self.test_config.get
+        self.test_config.set('enable-dpdk', True)
+        nutils.configure_ovs()
+        self.add_bridge.assert_has_calls([
+            call('br-phynet1', 'netdev'),
+            call('br-mgmt', 'netdev'),
+            call('br-vlan', 'netdev')],
+            any_order=True
+        )
+        self.add_bridge_port.assert_called_once_with('br-mgmt', 'eno1',
+                                                     promisc=True)
+        self.dpdk_set_mtu_request.assert_has_calls([
+            call('dpdk-ac48d24', 9000),
+            call('eno1', 9000)])
+
+    @patch.object(neutron_ovs_context, 'NeutronAPIContext')
+    @patch.object(neutron_ovs_context, 'resolve_dpdk_bonds')
+    @patch.object(neutron_ovs_context, 'resolve_dpdk_bridges')
+    @patch.object(nutils, 'use_dvr')
+    def test_configure_ovs_dpdk_physnet_mtus(self, _use_dvr,
+                                             _resolve_dpdk_bridges,
+                                             _resolve_dpdk_bonds,
+                                             _NeutronAPIContext):
+        _NeutronAPIContext.return_value = DummyContext(
+            return_value={'global_physnet_mtu': 1500,
+                          'physical_network_mtus': 'storage:9000'})
+        _resolve_dpdk_bridges.return_value = OrderedDict([
+            ('0000:001c.01', 'br-phynet1'),
+            ('0000:001c.02', 'br-storage')])
+        _resolve_dpdk_bonds.return_value = OrderedDict([
+            ('0000:001c.03', 'bond0')])
+        self.parse_data_port_mappings.return_value = {'bond0': 'br-storage'}
+        self.resolve_kernel_bridges.return_value = OrderedDict([
+            ('eno1', 'br-storage')])
+        self.test_config.set('bridge-mappings', 'physnet1:br-phynet1 '
+                             'storage:br-storage')
+        self.is_linuxbridge_interface.return_value = False
+        _use_dvr.return_value = False
+        self.use_dpdk.return_value = True
+        self.ovs_has_late_dpdk_init.return_value = True
+        self.test_config.set('enable-dpdk', True)
+        nutils.configure_ovs()
+        self.dpdk_set_mtu_request.assert_has_calls([
+            call('dpdk-ac48d24', 1500),
+            call('dpdk-82c1c9e', 9000),
+            call('eno1', 9000)])
+        self.dpdk_set_interfaces_mtu.assert_called_once_with(
+            9000, {'dpdk-aebdb4d': None}.keys())
+        self.assertEqual(self.disable_ipfix.call_count, 4)
+
+    @patch.object(neutron_ovs_context, 'NeutronAPIContext')
+    @patch.object(neutron_ovs_context, 'resolve_dpdk_bonds')
+    @patch.object(neutron_ovs_context, 'resolve_dpdk_bridges')
+    @patch.object(nutils, 'use_dvr')
+    @patch('charmhelpers.contrib.openstack.context.config')
+    def test_configure_ovs_dpdk_unbound_device(self, mock_config, _use_dvr,
+                                               _resolve_dpdk_bridges,
+                                               _resolve_dpdk_bonds,
+                                               _NeutronAPIContext):
+        _NeutronAPIContext.return_value = DummyContext(
+            return_value={'global_physnet_mtu': 1500})
+        _resolve_dpdk_bridges.return_value = OrderedDict([
+            ('0000:001c.01', 'br-phynet1'),
+            ('0000:001c.02', 'br-phynet2')])
+        _resolve_dpdk_bonds.return_value = OrderedDict([
+            ('0000:001c.03', 'bond0')])
+        self.parse_data_port_mappings.return_value = {'bond0': 'br-phynet3'}
+        self.bind_dpdk_devices.return_value = {
+            '0000:001c.01': 'no IOMMU group',
+            '0000:001c.03': 'no IOMMU group'}
+        _use_dvr.return_value = False
+        self.use_dpdk.return_value = True
+        self.ovs_has_late_dpdk_init.return_value = True
+        mock_config.side_effect = self.test_config.get
+        self.test_config.set('enable-dpdk', True)
+        nutils.configure_ovs()
+        self.dpdk_add_bridge_port.assert_called_once_with(
+            'br-phynet2', 'dpdk-82c1c9e', '0000:001c.02')
+        self.dpdk_add_bridge_bond.assert_not_called()
+
+    @patch.object(nutils, 'afxdp_add_bridge_port')
+    @patch.object(neutron_ovs_context, 'NeutronAPIContext')
+    @patch.object(neutron_ovs_context, 'resolve_afxdp_bridges')
+    @patch.object(nutils, 'use_dvr')
+    @patch.object(neutron_ovs_context, 'config')
+    def test_configure_ovs_afxdp(self, mock_config, _use_dvr,
+                                 _resolve_afxdp_bridges, _NeutronAPIContext,
+                                 _afxdp_add_bridge_port):
+        _use_dvr.return_value = False
+        _NeutronAPIContext.return_value = DummyContext(
+            return_value={'global_physnet_mtu': 9000})
+        _resolve_afxdp_bridges.return_value = OrderedDict([
+            ('ens1f0', 'br-phynet1'),
+            ('ens1f1', 'br-phynet2'),
+        ])
+        mock_config.side_effect = self.test_config.get
+        self.config.side_effect = self.test_config.get
+        self.test_config.set('enable-afxdp', True)
+        self.test_config.set('afxdp-n-rxq', 4)
+        self.use_afxdp.return_value = True
+        nutils.configure_ovs()
+        self.add_bridge.assert_has_calls([
+            call('br-int', 'netdev'),
+            call('br-ex', 'netdev'),
+            call('br-phynet1', 'netdev'),
+            call('br-phynet2', 'netdev')],
+            any_order=True
+        )
+        _afxdp_add_bridge_port.assert_has_calls([
+            call('br-phynet1', 'ens1f0', 'best-effort', 4),
+            call('br-phynet2', 'ens1f1', 'best-effort', 4),
+        ])
+        self.dpdk_set_mtu_request.assert_has_calls([
+            call('ens1f0', 9000),
+            call('ens1f1', 9000),
+        ])
+        self.assertFalse(self.add_bridge_port.called)
+
+        _afxdp_add_bridge_port.reset_mock()
+        self.test_config.set('afxdp-mode', 'zerocopy')
+        nutils.configure_ovs()
+        self.assertFalse(_afxdp_add_bridge_port.called)
+
+    @patch.object(nutils.subprocess, 'check_call')
+    def test_afxdp_add_bridge_port(self, _check_call):
+        nutils.afxdp_add_bridge_port('br-phynet1', 'ens1f0', 'native', 2)
+        _check_call.assert_called_once_with(
+            ['ovs-vsctl', '--', '--may-exist', 'add-port', 'br-phynet1',
+             'ens1f0', '--', 'set', 'Interface', 'ens1f0', 'type=afxdp',
+             'options:xdp-mode=native', 'options:n_rxq=2'])
+
+    @patch.object(neutron_ovs_context, 'config')
+    def test_assess_afxdp_config(self, mock_config):
+        mock_config.side_effect = self.test_config.get
+        self.assertEqual(nutils.assess_afxdp_config('configs'),
+                         (None, None))
+        self.test_config.set('enable-afxdp', True)
+        self.assertEqual(nutils.assess_afxdp_config('configs'),
+                         (None, None))
+        self.test_config.set('enable-dpdk', True)
+        self.assertEqual(nutils.assess_afxdp_config('configs'),
+                         ('blocked', 'enable-afxdp and enable-dpdk are '
+                                     'mutually exclusive'))
+
     def _run_configure_ovs_dpdk(self, mock_config, _use_dvr,
                                 _resolve_dpdk_bridges, _resolve_dpdk_bonds,
                                 _late_init, _test_bonds,
@@ -809,8 +1096,51 @@ class TestNeutronOVSUtils(CharmTestCase):
                                             _late_init=True,
                                             _test_bonds=True)
 
+    @patch.object(nutils, 'kv')
+    @patch.object(neutron_ovs_context, 'NeutronAPIContext')
+    @patch.object(neutron_ovs_context, 'resolve_dpdk_bonds')
+    @patch.object(neutron_ovs_context, 'resolve_dpdk_bridges')
     @patch.object(nutils, 'use_dvr')
     @patch('charmhelpers.contrib.openstack.context.config')
+    def test_configure_ovs_dpdk_port_queues(self, mock_config, _use_dvr,
+                                            _resolve_dpdk_bridges,
+                                            _resolve_dpdk_bonds,
+                                            _NeutronAPIContext,
+                                            _kv):
+        _NeutronAPIContext.return_value = DummyContext(
+            return_value={'global_physnet_mtu': 1500})
+        _kv.return_value = unitdata.Storage(':memory:')
+        self.test_config.set('dpdk-port-queues', '2:4096')
+        self._run_configure_ovs_dpdk(mock_config, _use_dvr,
+                                     _resolve_dpdk_bridges,
+                                     _resolve_dpdk_bonds,
+                                     _late_init=True,
+                                     _test_bonds=True)
+        options = OrderedDict([('n_rxq', 2), ('n_rxq_desc', 4096),
+                               ('n_txq_desc', None)])
+        self.dpdk_set_interface_options.assert_has_calls([
+            call('dpdk-ac48d24', options),
+            call('dpdk-82c1c9e', options),
+            call('dpdk-aebdb4d', options)],
+            any_order=True)
+        # Options and affinity no longer configured are removed
+        self.test_config.set('dpdk-port-queues', '')
+        self.dpdk_set_interface_options.reset_mock()
+        self.dpdk_set_interface_other_config.reset_mock()
+        self._run_configure_ovs_dpdk(mock_config, _use_dvr,
+                                     _resolve_dpdk_bridges,
+                                     _resolve_dpdk_bonds,
+                                     _late_init=True,
+                                     _test_bonds=True)
+        self.dpdk_set_interface_options.assert_any_call(
+            'dpdk-ac48d24', OrderedDict([('n_rxq', None),
+                                         ('n_rxq_desc', None),
+                                         ('n_txq_desc', None)]))
+        self.dpdk_set_interface_other_config.assert_any_call(
+            'dpdk-ac48d24', 'pmd-rxq-affinity', None)
+
+    @patch.object(nutils, 'use_dvr')
+    @patch.object(neutron_ovs_context, 'config')
     def test_configure_ovs_enable_ipfix(self, mock_config, mock_use_dvr):
         mock_use_dvr.return_value = False
         mock_config.side_effect = self.test_config.get
@@ -859,29 +1189,130 @@ class TestNeutronOVSUtils(CharmTestCase):
         make_assess_status_func.assert_called_once_with(
             'test-config',
             {'Test': True},
+            charm_func=nutils.assess_charm_status,
             services='s1',
             ports=None)
 
     def test_pause_unit_helper(self):
         with patch.object(nutils, '_pause_resume_helper') as prh:
             nutils.pause_unit_helper('random-config')
-            prh.assert_called_once_with(nutils.pause_unit, 'random-config')
+            prh.assert_called_once_with(nutils.pause_unit, 'random-config',
+                                        'pause', None)
         with patch.object(nutils, '_pause_resume_helper') as prh:
             nutils.resume_unit_helper('random-config')
-            prh.assert_called_once_with(nutils.resume_unit, 'random-config')
+            prh.assert_called_once_with(nutils.resume_unit, 'random-config',
+                                        'resume', None)
 
+    @patch.object(nutils, 'manage_services_parallel')
     @patch.object(nutils, 'services')
     @patch.object(nutils, 'determine_ports')
-    def test_pause_resume_helper(self, determine_ports, services):
+    def test_pause_resume_helper(self, determine_ports, services,
+                                 manage_services_parallel):
         f = MagicMock()
         services.return_value = 's1'
         determine_ports.return_value = 'p1'
+        timings = {}
         with patch.object(nutils, 'assess_status_func') as asf:
             asf.return_value = 'assessor'
-            nutils._pause_resume_helper(f, 'some-config')
+            nutils._pause_resume_helper(f, 'some-config', 'pause', timings)
             asf.assert_called_once_with('some-config')
             # ports=None whilst port checks are disabled.
-            f.assert_called_once_with('assessor', services='s1', ports=None)
+            f.assert_called_once_with('assessor', services=None, ports=None,
+                                      charm_func=ANY)
+            f.call_args[1]['charm_func']()
+            manage_services_parallel.assert_called_once_with(
+                'pause', 's1', timings)
+
+    @patch.object(nutils, 'configure_dpdk_tunnel_endpoint')
+    @patch.object(nutils, 'kv')
+    @patch.object(nutils, 'manage_services_parallel')
+    @patch.object(nutils, 'services')
+    def test_resume_unit_helper_clears_ovs_restart(
+            self, services, manage_services_parallel, kv,
+            configure_dpdk_tunnel_endpoint):
+        db = unitdata.Storage(':memory:')
+        kv.return_value = db
+        service_running = self.service_running
+        manage_services_parallel.return_value = None
+        service_running.return_value = True
+        nutils.defer_ovs_restart(['dpdk-init'])
+        configs = MagicMock()
+
+        def _resume_unit(assess_status_func, services, ports, charm_func):
+            # resume_unit() assesses the status once the services resumed
+            self.assertIsNone(charm_func())
+            self.assertEqual(nutils.assess_ovs_restart(configs),
+                             (None, None))
+
+        with patch.object(nutils, 'resume_unit', _resume_unit), \
+                patch.object(nutils, 'assess_status_func'):
+            nutils.resume_unit_helper(configs)
+        service_running.assert_called_once_with('openvswitch-switch')
+        configure_dpdk_tunnel_endpoint.assert_called_once_with()
+        # Not cleared when openvswitch-switch failed to start
+        nutils.defer_ovs_restart(['dpdk-init'])
+        service_running.return_value = False
+        with patch.object(nutils, 'resume_unit') as resume_unit, \
+                patch.object(nutils, 'assess_status_func'):
+            nutils.resume_unit_helper(configs)
+            resume_unit.call_args[1]['charm_func']()
+        self.assertEqual(db.get(nutils.OVS_RESTART_PENDING_KEY),
+                         ['dpdk-init'])
+        configure_dpdk_tunnel_endpoint.assert_called_once_with()
+
+    @patch.object(nutils, 'service_resume')
+    @patch.object(nutils, 'service_pause')
+    def test_manage_services_parallel(self, service_pause, service_resume):
+        events = []
+        running = {'openvswitch-switch': False,
+                   'neutron-openvswitch-agent': False,
+                   'neutron-dhcp-agent': False}
+
+        def _resume(service_name):
+            events.append(service_name)
+            running[service_name] = service_name != 'neutron-dhcp-agent'
+            return running[service_name]
+
+        service_resume.side_effect = _resume
+        self.service_running.side_effect = lambda s: running[s]
+        timings = {}
+        with patch.object(nutils, 'SERVICE_READY_TIMEOUT', 0), \
+                patch.object(nutils, 'SERVICE_READY_INTERVAL', 0):
+            message = nutils.manage_services_parallel(
+                'resume', sorted(running.keys()), timings)
+        self.assertEqual(message,
+                         "neutron-dhcp-agent didn't resume cleanly.")
+        # openvswitch-switch is started before the agents
+        self.assertEqual(events[0], 'openvswitch-switch')
+        self.assertEqual(sorted(timings.keys()), sorted(running.keys()))
+
+    @patch.object(nutils, 'service_pause')
+    def test_manage_services_parallel_pause(self, service_pause):
+        events = []
+        running = {'openvswitch-switch': True,
+                   'neutron-openvswitch-agent': True}
+
+        def _pause(service_name):
+            events.append(service_name)
+            running[service_name] = False
+            return True
+
+        service_pause.side_effect = _pause
+        self.service_running.side_effect = lambda s: running[s]
+        self.assertEqual(nutils.manage_services_parallel(
+            'pause', sorted(running.keys())), None)
+        # openvswitch-switch is stopped after the agents
+        self.assertEqual(events, ['neutron-openvswitch-agent',
+                                  'openvswitch-switch'])
+
+    @patch.object(nutils.time, 'sleep')
+    def test_wait_for_service(self, _sleep):
+        self.service_running.side_effect = [False, False, True]
+        self.assertTrue(nutils.wait_for_service('ovs', True, timeout=10))
+        self.assertEqual(_sleep.call_count, 2)
+        self.service_running.side_effect = None
+        self.service_running.return_value = False
+        self.assertFalse(nutils.wait_for_service('ovs', True, timeout=0))
 
     def _configure_sriov_base(self, config):
         self.mock_config = MagicMock()
@@ -1035,6 +1466,7 @@ class TestNeutronOVSUtils(CharmTestCase):
             ['systemd-tmpfiles', '--create']
         )
 
+    @patch.object(nutils, 'get_Open_vSwitch_column_value')
     @patch.object(nutils, 'is_unit_paused_set')
     @patch.object(nutils.subprocess, 'check_call')
     @patch.object(neutron_ovs_context, 'OVSDPDKDeviceContext')
@@ -1043,14 +1475,18 @@ class TestNeutronOVSUtils(CharmTestCase):
                              _set_Open_vSwitch_column_value,
                              _OVSDPDKDeviceContext,
                              _check_call,
-                             _is_unit_paused_set):
+                             _is_unit_paused_set,
+                             _get_Open_vSwitch_column_value):
         mock_context = MagicMock()
         mock_context.cpu_mask.return_value = '0x03'
         mock_context.socket_memory.return_value = '4096,4096'
+        mock_context.eal_args.return_value = '-n 4'
         mock_context.pci_whitelist.return_value = \
             '--pci-whitelist 00:0300:01'
+        mock_context.pmd_cpu_mask.return_value = '0x0c'
         _OVSDPDKDeviceContext.return_value = mock_context
         _set_Open_vSwitch_column_value.return_value = True
+        _get_Open_vSwitch_column_value.return_value = None
         self.ovs_has_late_dpdk_init.return_value = True
         self.ovs_vhostuser_client.return_value = False
         _is_unit_paused_set.return_value = False
@@ -1060,14 +1496,16 @@ class TestNeutronOVSUtils(CharmTestCase):
             call('other_config:dpdk-socket-mem', '4096,4096'),
             call('other_config:dpdk-init', 'true'),
             call('other_config:dpdk-extra',
-                 '--vhost-owner libvirt-qemu:kvm --vhost-perm 0660 '
-                 '--pci-whitelist 00:0300:01')
+                 '-n 4 --vhost-owner libvirt-qemu:kvm --vhost-perm 0660 '
+                 '--pci-whitelist 00:0300:01'),
+            call('other_config:pmd-cpu-mask', '0x0c'),
         ])
         _check_call.assert_called_once_with(
             nutils.UPDATE_ALTERNATIVES + [nutils.OVS_DPDK_BIN]
         )
         self.service_restart.assert_called_with('openvswitch-switch')
 
+    @patch.object(nutils, 'get_Open_vSwitch_column_value')
     @patch.object(nutils, 'is_unit_paused_set')
     @patch.object(nutils.subprocess, 'check_call')
     @patch.object(neutron_ovs_context, 'OVSDPDKDeviceContext')
@@ -1077,14 +1515,18 @@ class TestNeutronOVSUtils(CharmTestCase):
             _set_Open_vSwitch_column_value,
             _OVSDPDKDeviceContext,
             _check_call,
-            _is_unit_paused_set):
+            _is_unit_paused_set,
+            _get_Open_vSwitch_column_value):
         mock_context = MagicMock()
         mock_context.cpu_mask.return_value = '0x03'
         mock_context.socket_memory.return_value = '4096,4096'
+        mock_context.eal_args.return_value = '-n 4'
         mock_context.pci_whitelist.return_value = \
             '--pci-whitelist 00:0300:01'
+        mock_context.pmd_cpu_mask.return_value = '0x0c'
         _OVSDPDKDeviceContext.return_value = mock_context
         _set_Open_vSwitch_column_value.return_value = True
+        _get_Open_vSwitch_column_value.return_value = None
         self.ovs_has_late_dpdk_init.return_value = True
         self.ovs_vhostuser_client.return_value = True
         _is_unit_paused_set.return_value = False
@@ -1094,13 +1536,605 @@ class TestNeutronOVSUtils(CharmTestCase):
             call('other_config:dpdk-socket-mem', '4096,4096'),
             call('other_config:dpdk-init', 'true'),
             call('other_config:dpdk-extra',
-                 '--pci-whitelist 00:0300:01')
+                 '-n 4 --pci-whitelist 00:0300:01'),
+            call('other_config:pmd-cpu-mask', '0x0c'),
         ])
         _check_call.assert_called_once_with(
             nutils.UPDATE_ALTERNATIVES + [nutils.OVS_DPDK_BIN]
         )
         self.service_restart.assert_called_with('openvswitch-switch')
 
+    @patch.object(nutils, 'defer_ovs_restart')
+    @patch.object(nutils, 'get_Open_vSwitch_column_value')
+    @patch.object(nutils, 'is_unit_paused_set')
+    @patch.object(nutils.subprocess, 'check_call')
+    @patch.object(neutron_ovs_context, 'OVSDPDKDeviceContext')
+    @patch.object(nutils, 'set_Open_vSwitch_column_value')
+    def test_enable_ovs_dpdk_deferred_restart(
+            self,
+            _set_Open_vSwitch_column_value,
+            _OVSDPDKDeviceContext,
+            _check_call,
+            _is_unit_paused_set,
+            _get_Open_vSwitch_column_value,
+            _defer_ovs_restart):
+        mock_context = MagicMock()
+        mock_context.cpu_mask.return_value = '0x03'
+        mock_context.socket_memory.return_value = '4096,4096'
+        mock_context.eal_args.return_value = '-n 4'
+        mock_context.pci_whitelist.return_value = ''
+        mock_context.pmd_cpu_mask.return_value = '0x0c'
+        _OVSDPDKDeviceContext.return_value = mock_context
+        _set_Open_vSwitch_column_value.side_effect = \
+            lambda column, value: column in (
+                'other_config:dpdk-socket-mem', 'other_config:pmd-cpu-mask')
+        _get_Open_vSwitch_column_value.side_effect = \
+            lambda column: 'true' if column == 'other_config:dpdk-init' \
+            else None
+        self.ovs_has_late_dpdk_init.return_value = True
+        self.ovs_vhostuser_client.return_value = True
+        _is_unit_paused_set.return_value = False
+        nutils.enable_ovs_dpdk()
+        _get_Open_vSwitch_column_value.assert_any_call(
+            'other_config:dpdk-init')
+        _defer_ovs_restart.assert_called_once_with(['dpdk-socket-mem'])
+        self.assertFalse(self.service_restart.called)
+
+    @patch.object(nutils, 'get_Open_vSwitch_column_value')
+    @patch.object(nutils, 'is_unit_paused_set')
+    @patch.object(nutils.subprocess, 'check_call')
+    @patch.object(neutron_ovs_context, 'OVSDPDKDeviceContext')
+    @patch.object(nutils, 'set_Open_vSwitch_column_value')
+    def test_enable_ovs_dpdk_pmd_mask_only(
+            self,
+            _set_Open_vSwitch_column_value,
+            _OVSDPDKDeviceContext,
+            _check_call,
+            _is_unit_paused_set,
+            _get_Open_vSwitch_column_value):
+        mock_context = MagicMock()
+        mock_context.eal_args.return_value = '-n 4'
+        mock_context.pci_whitelist.return_value = ''
+        mock_context.pmd_cpu_mask.return_value = '0x0c'
+        _OVSDPDKDeviceContext.return_value = mock_context
+        _set_Open_vSwitch_column_value.side_effect = \
+            lambda column, value: column == 'other_config:pmd-cpu-mask'
+        _get_Open_vSwitch_column_value.return_value = None
+        self.ovs_has_late_dpdk_init.return_value = True
+        _is_unit_paused_set.return_value = False
+        nutils.enable_ovs_dpdk()
+        _set_Open_vSwitch_column_value.assert_any_call(
+            'other_config:pmd-cpu-mask', '0x0c')
+        # PMD mask changes do not require a restart
+        self.assertFalse(self.service_restart.called)
+
+
+class TestOVSOtherConfig(CharmTestCase):
+
+    def setUp(self):
+        super(TestOVSOtherConfig, self).setUp(nutils, ['log'])
+
+    @patch.object(nutils.subprocess, 'check_call')
+    @patch.object(nutils.subprocess, 'check_output')
+    def test_set_ovs_other_config_tc_policy(self, _check_output,
+                                            _check_call):
+        # ovs-vsctl does not quote the tc-policy values
+        _check_output.side_effect = lambda cmd: {
+            'other_config:hw-offload': b'"true"\n',
+            'other_config:tc-policy': b'skip_sw\n',
+        }[cmd[-1]]
+        self.assertEqual(
+            nutils.set_ovs_other_config(OrderedDict([
+                ('hw-offload', 'true'),
+                ('tc-policy', 'skip_sw'),
+            ])),
+            [])
+        self.assertEqual(
+            nutils.set_ovs_other_config(OrderedDict([
+                ('hw-offload', 'true'),
+                ('tc-policy', 'none'),
+            ])),
+            ['tc-policy'])
+        _check_call.assert_called_once_with(
+            ['ovs-vsctl', 'set', 'Open_vSwitch', '.',
+             'other_config:tc-policy=none'])
+        _check_call.reset_mock()
+        self.assertEqual(
+            nutils.set_ovs_other_config(OrderedDict([
+                ('hw-offload', None),
+                ('tc-policy', None),
+            ])),
+            ['hw-offload', 'tc-policy'])
+        _check_call.assert_has_calls([
+            call(['ovs-vsctl', 'remove', 'Open_vSwitch', '.',
+                  'other_config', 'hw-offload']),
+            call(['ovs-vsctl', 'remove', 'Open_vSwitch', '.',
+                  'other_config', 'tc-policy']),
+        ])
+
+
+class TestOVSRestart(CharmTestCase):
+
+    def setUp(self):
+        super(TestOVSRestart, self).setUp(
+            nutils, ['kv', 'log', 'service_restart',
+                     'set_Open_vSwitch_column_value'])
+        self.db = unitdata.Storage(':memory:')
+        self.kv.return_value = self.db
+
+    def test_set_ovs_other_config(self):
+        self.set_Open_vSwitch_column_value.side_effect = \
+            lambda column, value: column != 'other_config:dpdk-init'
+        self.assertEqual(
+            nutils.set_ovs_other_config(OrderedDict([
+                ('dpdk-init', 'true'),
+                ('dpdk-extra', '-a 0000:01:00.0'),
+                ('pmd-cpu-mask', '0x0c'),
+                ('emc-insert-inv-prob', '100'),
+            ])),
+            ['dpdk-extra'])
+
+    @patch.object(nutils, 'remove_Open_vSwitch_column_key')
+    @patch.object(nutils, 'get_Open_vSwitch_column_value')
+    def test_set_ovs_other_config_remove(self, _get, _remove):
+        _get.side_effect = lambda column: (
+            'true' if column == 'other_config:per-port-memory' else None)
+        self.assertEqual(
+            nutils.set_ovs_other_config(OrderedDict([
+                ('per-port-memory', None),
+                ('userspace-tso-enable', None),
+            ])),
+            ['per-port-memory'])
+        _remove.assert_called_once_with('other_config', 'per-port-memory')
+
+    @patch.object(nutils, 'config')
+    @patch.object(neutron_ovs_context, 'dpdk_tunnel_endpoint')
+    @patch.object(neutron_ovs_context, 'validate_eal_config')
+    @patch.object(nutils, 'use_dpdk')
+    def test_assess_dpdk_config(self, _use_dpdk, _validate_eal_config,
+                                _dpdk_tunnel_endpoint, _config):
+        _config.side_effect = self.test_config.get
+        _use_dpdk.return_value = True
+        self.assertEqual(nutils.assess_dpdk_config('configs'), (None, None))
+        _validate_eal_config.side_effect = ValueError(
+            'Invalid dpdk-iova-mode: auto')
+        self.assertEqual(nutils.assess_dpdk_config('configs'),
+                         ('blocked', 'Invalid dpdk-iova-mode: auto'))
+        _validate_eal_config.side_effect = None
+        _dpdk_tunnel_endpoint.side_effect = ValueError(
+            'dpdk-tunnel-bridge br-foo is not a DPDK bridge')
+        self.assertEqual(nutils.assess_dpdk_config('configs'),
+                         ('blocked',
+                          'dpdk-tunnel-bridge br-foo is not a DPDK bridge'))
+        _dpdk_tunnel_endpoint.side_effect = None
+        self.test_config.set('dpdk-driver-overrides', 'eth0=vfio-pci')
+        self.assertEqual(nutils.assess_dpdk_config('configs'),
+                         ('blocked',
+                          'Invalid dpdk-driver-overrides entry: '
+                          'eth0=vfio-pci'))
+        self.test_config.set('dpdk-driver-overrides', '')
+        self.test_config.set('dpdk-pmd-rxq-assign', 'random')
+        self.assertEqual(nutils.assess_dpdk_config('configs'),
+                         ('blocked',
+                          'Invalid dpdk-pmd-rxq-assign: random (valid: '
+                          'cycles, roundrobin, group)'))
+        self.test_config.set('dpdk-pmd-rxq-assign', '')
+        self.db.set(nutils.DPDK_BIND_FAILURES_KEY,
+                    {'0000:02:00.0': 'no IOMMU group'})
+        self.assertEqual(nutils.assess_dpdk_config('configs'),
+                         ('blocked',
+                          'DPDK devices not bound: '
+                          '0000:02:00.0 (no IOMMU group)'))
+        _use_dpdk.return_value = False
+        self.assertEqual(nutils.assess_dpdk_config('configs'), (None, None))
+
+    @patch.object(nutils, 'bind_pci_devices')
+    @patch.object(neutron_ovs_context, 'dpdk_device_drivers')
+    def test_bind_dpdk_devices(self, _dpdk_device_drivers,
+                               _bind_pci_devices):
+        drivers = OrderedDict([('0000:01:00.0', 'vfio-pci'),
+                               ('0000:02:00.0', 'vfio-pci')])
+        _dpdk_device_drivers.return_value = drivers
+        _bind_pci_devices.return_value = OrderedDict([
+            ('0000:02:00.0', 'no IOMMU group')])
+        self.assertEqual(nutils.bind_dpdk_devices(),
+                         {'0000:02:00.0': 'no IOMMU group'})
+        _bind_pci_devices.assert_called_once_with(drivers)
+        self.assertEqual(self.db.get(nutils.DPDK_BIND_FAILURES_KEY),
+                         {'0000:02:00.0': 'no IOMMU group'})
+        _bind_pci_devices.return_value = OrderedDict()
+        nutils.bind_dpdk_devices()
+        self.assertEqual(self.db.get(nutils.DPDK_BIND_FAILURES_KEY), {})
+
+    def test_defer_ovs_restart(self):
+        nutils.defer_ovs_restart(['dpdk-socket-mem'])
+        nutils.defer_ovs_restart(['dpdk-extra', 'dpdk-socket-mem'])
+        self.assertEqual(self.db.get(nutils.OVS_RESTART_PENDING_KEY),
+                         ['dpdk-extra', 'dpdk-socket-mem'])
+        self.assertEqual(
+            nutils.assess_ovs_restart('configs'),
+            ('blocked', 'openvswitch-switch restart required to apply '
+                        'dpdk-extra, dpdk-socket-mem, run the '
+                        'restart-openvswitch action'))
+
+    @patch.object(nutils, 'configure_dpdk_tunnel_endpoint')
+    def test_restart_openvswitch(self, _configure_dpdk_tunnel_endpoint):
+        nutils.defer_ovs_restart(['dpdk-extra'])
+        nutils.restart_openvswitch()
+        self.service_restart.assert_called_once_with('openvswitch-switch')
+        _configure_dpdk_tunnel_endpoint.assert_called_once_with()
+        self.assertIsNone(self.db.get(nutils.OVS_RESTART_PENDING_KEY))
+        self.assertEqual(nutils.assess_ovs_restart('configs'),
+                         (None, None))
+
+    @patch.object(nutils, 'assess_hw_offload_config')
+    @patch.object(nutils, 'assess_afxdp_config')
+    @patch.object(nutils, 'assess_dpdk_config')
+    @patch.object(nutils, 'assess_hugepages')
+    def test_assess_charm_status(self, _assess_hugepages,
+                                 _assess_dpdk_config, _assess_afxdp_config,
+                                 _assess_hw_offload_config):
+        _assess_dpdk_config.return_value = (None, None)
+        _assess_afxdp_config.return_value = (None, None)
+        _assess_hw_offload_config.return_value = (None, None)
+        _assess_hugepages.return_value = (None, None)
+        self.assertEqual(nutils.assess_charm_status('configs'),
+                         (None, None))
+        nutils.defer_ovs_restart(['dpdk-extra'])
+        _assess_hugepages.return_value = ('blocked', 'Insufficient hugepages')
+        state, message = nutils.assess_charm_status('configs')
+        self.assertEqual(state, 'blocked')
+        self.assertTrue(message.startswith('Insufficient hugepages; '
+                                           'openvswitch-switch restart'))
+
+
+class TestHardwareOffload(CharmTestCase):
+
+    def setUp(self):
+        super(TestHardwareOffload, self).setUp(
+            nutils, ['config', 'log', 'subprocess', 'use_hw_offload',
+                     'PCINetDevices', 'configure_sriov_vfs',
+                     'get_vf_pci_addresses', 'get_vf_representors',
+                     'unbind_pci_device', 'probe_pci_device',
+                     'add_bridge', 'add_bridge_port',
+                     'determine_datapath_type', 'set_ovs_other_config',
+                     'defer_ovs_restart', 'kv'])
+        self.db = unitdata.Storage(':memory:')
+        self.kv.return_value = self.db
+        self.config.side_effect = self.test_config.get
+        patcher = patch.object(neutron_ovs_context, 'config',
+                               side_effect=self.test_config.get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.test_config.set('enable-hardware-offload', True)
+        self.test_config.set('sriov-device-mappings',
+                             'physnet1:enp59s0f0 physnet2:eno1')
+        self.test_config.set('bridge-mappings', 'physnet1:br-data')
+        self.subprocess.CalledProcessError = \
+            subprocess.CalledProcessError
+        self.use_hw_offload.return_value = True
+        self.determine_datapath_type.return_value = 'system'
+        self.get_vf_pci_addresses.return_value = ['0000:3b:00.2',
+                                                  '0000:3b:00.3']
+        self.get_vf_representors.return_value = OrderedDict([
+            (0, 'enp59s0f0_0'), (1, 'enp59s0f0_1')])
+        self.pf = MagicMock(pci_address='0000:3b:00.0', sriov=True)
+        self.PCINetDevices.return_value.get_device_from_interface_name \
+            .side_effect = lambda name: (
+                self.pf if name == 'enp59s0f0' else None)
+        self.devlink_mode = 'legacy'
+        self.subprocess.check_output.side_effect = self.fake_devlink
+
+    def fake_devlink(self, cmd, **kwargs):
+        # devlink stand-in reporting the eswitch mode of 0000:3b:00.0
+        device = cmd[-1]
+        if device != 'pci/0000:3b:00.0':
+            raise subprocess.CalledProcessError(1, cmd)
+        return json.dumps({'dev': {device: {
+            'mode': self.devlink_mode,
+            'inline-mode': 'none',
+            'encap': 'enable'}}}).encode('UTF-8')
+
+    def test_get_eswitch_mode(self):
+        self.assertEqual(nutils.get_eswitch_mode('0000:3b:00.0'), 'legacy')
+        self.subprocess.check_output.assert_called_once_with(
+            ['devlink', '-j', 'dev', 'eswitch', 'show', 'pci/0000:3b:00.0'],
+            stderr=self.subprocess.STDOUT)
+        self.assertIsNone(nutils.get_eswitch_mode('0000:5e:00.0'))
+
+    def test_enable_switchdev(self):
+        self.assertTrue(nutils.enable_switchdev('0000:3b:00.0'))
+        self.unbind_pci_device.assert_has_calls([call('0000:3b:00.2'),
+                                                 call('0000:3b:00.3')])
+        self.subprocess.check_call.assert_called_once_with(
+            ['devlink', 'dev', 'eswitch', 'set', 'pci/0000:3b:00.0',
+             'mode', 'switchdev'])
+        self.probe_pci_device.assert_has_calls([call('0000:3b:00.2'),
+                                                call('0000:3b:00.3')])
+        self.devlink_mode = 'switchdev'
+        self.subprocess.check_call.reset_mock()
+        self.assertFalse(nutils.enable_switchdev('0000:3b:00.0'))
+        self.subprocess.check_call.assert_not_called()
+
+    def test_enable_switchdev_failure(self):
+        self.subprocess.check_call.side_effect = \
+            subprocess.CalledProcessError(1, 'devlink')
+        self.assertRaises(subprocess.CalledProcessError,
+                          nutils.enable_switchdev, '0000:3b:00.0')
+        self.probe_pci_device.assert_has_calls([call('0000:3b:00.2'),
+                                                call('0000:3b:00.3')])
+
+    def test_configure_hardware_offload(self):
+        self.set_ovs_other_config.return_value = ['hw-offload']
+        nutils.configure_hardware_offload()
+        self.configure_sriov_vfs.assert_called_once_with(
+            self.PCINetDevices.return_value)
+        self.add_bridge.assert_called_once_with('br-data', 'system')
+        self.add_bridge_port.assert_called_once_with('br-data', 'enp59s0f0',
+                                                     promisc=True)
+        self.subprocess.check_call.assert_has_calls([
+            call(['devlink', 'dev', 'eswitch', 'set', 'pci/0000:3b:00.0',
+                  'mode', 'switchdev']),
+            call(['ip', 'link', 'set', 'enp59s0f0_0', 'up']),
+            call(['ip', 'link', 'set', 'enp59s0f0_1', 'up'])])
+        self.set_ovs_other_config.assert_called_once_with(OrderedDict([
+            ('hw-offload', 'true'), ('tc-policy', 'none')]))
+        self.defer_ovs_restart.assert_called_once_with(['hw-offload'])
+        self.assertEqual(self.db.get(nutils.HW_OFFLOAD_SWITCHDEV_KEY),
+                         ['0000:3b:00.0'])
+
+    def test_configure_hardware_offload_after_reboot(self):
+        # The eswitch is back in legacy mode after a reboot
+        self.db.set(nutils.HW_OFFLOAD_SWITCHDEV_KEY, ['0000:3b:00.0'])
+        nutils.configure_hardware_offload()
+        self.subprocess.check_call.assert_any_call(
+            ['devlink', 'dev', 'eswitch', 'set', 'pci/0000:3b:00.0',
+             'mode', 'switchdev'])
+
+    def test_configure_hardware_offload_removed_device(self):
+        self.devlink_mode = 'switchdev'
+        self.db.set(nutils.HW_OFFLOAD_SWITCHDEV_KEY, ['0000:3b:00.0'])
+        self.test_config.set('sriov-device-mappings', 'physnet2:eno1')
+        nutils.configure_hardware_offload()
+        self.subprocess.check_call.assert_called_once_with(
+            ['devlink', 'dev', 'eswitch', 'set', 'pci/0000:3b:00.0',
+             'mode', 'legacy'])
+        self.assertEqual(self.db.get(nutils.HW_OFFLOAD_SWITCHDEV_KEY), [])
+
+    def test_configure_hardware_offload_invalid(self):
+        self.test_config.set('hw-offload-tc-policy', 'skip')
+        nutils.configure_hardware_offload()
+        self.PCINetDevices.assert_not_called()
+        self.set_ovs_other_config.assert_not_called()
+        self.assertEqual(nutils.assess_hw_offload_config('configs'),
+                         ('blocked', 'Invalid hw-offload-tc-policy: skip '
+                          '(valid: none, skip_sw, skip_hw)'))
+
+    def test_configure_hardware_offload_disabled(self):
+        self.use_hw_offload.return_value = False
+        self.set_ovs_other_config.return_value = []
+        self.devlink_mode = 'switchdev'
+        self.db.set(nutils.HW_OFFLOAD_SWITCHDEV_KEY, ['0000:3b:00.0'])
+        nutils.configure_hardware_offload()
+        self.PCINetDevices.assert_not_called()
+        self.unbind_pci_device.assert_has_calls([call('0000:3b:00.2'),
+                                                 call('0000:3b:00.3')])
+        self.subprocess.check_call.assert_called_once_with(
+            ['devlink', 'dev', 'eswitch', 'set', 'pci/0000:3b:00.0',
+             'mode', 'legacy'])
+        self.assertEqual(self.db.get(nutils.HW_OFFLOAD_SWITCHDEV_KEY), [])
+        self.set_ovs_other_config.assert_called_once_with(OrderedDict([
+            ('hw-offload', None), ('tc-policy', None)]))
+        self.defer_ovs_restart.assert_not_called()
+        self.set_ovs_other_config.return_value = ['hw-offload']
+        nutils.configure_hardware_offload()
+        self.defer_ovs_restart.assert_called_once_with(['hw-offload'])
+
+
+class TestHugepages(CharmTestCase):
+
+    def setUp(self):
+        super(TestHugepages, self).setUp(nutils, ['config', 'log',
+                                                  'use_dpdk'])
+        self.config.side_effect = self.test_config.get
+        self.use_dpdk.return_value = True
+        patcher = patch.object(neutron_ovs_context, 'numa_node_cores',
+                               return_value={'0': [0, 1], '1': [2, 3]})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch.object(neutron_ovs_context, 'reserve_node_hugepages')
+    def test_configure_hugepages(self, _reserve):
+        _reserve.side_effect = lambda node, size_kb, count: count
+        self.test_config.set('dpdk-hugepages', '2M:1024 1:2M:512 0:1G:4')
+        nutils.configure_hugepages()
+        _reserve.assert_has_calls([
+            call('0', 2048, 1024),
+            call('1', 2048, 512),
+            call('0', 1048576, 4),
+        ], any_order=True)
+        self.assertEqual(_reserve.call_count, 3)
+        self.assertFalse(self.log.called)
+
+    @patch.object(neutron_ovs_context, 'reserve_node_hugepages')
+    def test_configure_hugepages_shortfall(self, _reserve):
+        _reserve.return_value = 2
+        self.test_config.set('dpdk-hugepages', '0:1G:4')
+        nutils.configure_hugepages()
+        _reserve.assert_called_once_with('0', 1048576, 4)
+        self.log.assert_called_once_with(
+            'Only 2 of 4 1048576kB hugepages reserved on NUMA node 0',
+            level=nutils.WARNING)
+
+    @patch.object(neutron_ovs_context, 'reserve_node_hugepages')
+    def test_configure_hugepages_invalid(self, _reserve):
+        self.test_config.set('dpdk-hugepages', '4M:10')
+        nutils.configure_hugepages()
+        self.assertFalse(_reserve.called)
+        self.assertEqual(nutils.assess_hugepages('configs'),
+                         ('blocked', 'Invalid hugepage reservation: 4M:10'))
+
+    @patch.object(neutron_ovs_context, 'node_hugepages')
+    @patch.object(neutron_ovs_context, 'OVSDPDKDeviceContext')
+    def test_assess_hugepages(self, _OVSDPDKDeviceContext, _node_hugepages):
+        _OVSDPDKDeviceContext.return_value.socket_memory.return_value = \
+            '4096,1024'
+        _node_hugepages.return_value = {
+            '0': {2048: {'total': 1024, 'free': 0},
+                  1048576: {'total': 4, 'free': 4}},
+            '1': {2048: {'total': 256, 'free': 256},
+                  1048576: {'total': 0, 'free': 0}},
+        }
+        self.assertEqual(nutils.assess_hugepages('configs'),
+                         ('blocked',
+                          'Insufficient hugepages: node1 needs 1024MB '
+                          '(1024MB socket memory + 0MB guests), has 512MB'))
+
+        _node_hugepages.return_value['1'][2048]['total'] = 512
+        self.assertEqual(nutils.assess_hugepages('configs'), (None, None))
+
+        self.test_config.set('dpdk-guest-hugepage-memory', 2048)
+        self.assertEqual(nutils.assess_hugepages('configs'),
+                         ('blocked',
+                          'Insufficient hugepages: node1 needs 3072MB '
+                          '(1024MB socket memory + 2048MB guests), has '
+                          '1024MB'))
+
+        self.test_config.set('dpdk-guest-hugepage-memory', 4096)
+        self.assertEqual(nutils.assess_hugepages('configs')[1],
+                         'Insufficient hugepages: node0 needs 8192MB '
+                         '(4096MB socket memory + 4096MB guests), has '
+                         '6144MB; node1 needs 5120MB (1024MB socket memory '
+                         '+ 4096MB guests), has 1024MB')
+
+    def test_assess_hugepages_no_dpdk(self):
+        self.use_dpdk.return_value = False
+        self.assertEqual(nutils.assess_hugepages('configs'), (None, None))
+
+
+class FakeConfig(dict):
+
+    def __init__(self, current, previous=None):
+        super(FakeConfig, self).__init__(current)
+        self.previous_config = previous
+
+    def changed(self, key):
+        if self.previous_config is None:
+            return True
+        return self.previous_config.get(key) != self.get(key)
+
+
+class TestReconcileSubsystems(CharmTestCase):
+
+    def setUp(self):
+        super(TestReconcileSubsystems, self).setUp(
+            nutils, ['config', 'kv', 'log', 'relation_ids', 'related_units',
+                     'relation_get'])
+        self.db = unitdata.Storage(':memory:')
+        self.kv.return_value = self.db
+
+    def test_first_run(self):
+        self.config.return_value = FakeConfig({'debug': False})
+        self.assertEqual(nutils.determine_reconcile_subsystems(),
+                         set(nutils.RECONCILE_SUBSYSTEMS))
+
+    def test_no_changes(self):
+        nutils.clear_full_reconcile()
+        self.config.return_value = FakeConfig({'debug': False},
+                                              {'debug': False})
+        self.assertEqual(nutils.determine_reconcile_subsystems(), set())
+
+    def test_changes(self):
+        nutils.clear_full_reconcile()
+        self.config.return_value = FakeConfig(
+            {'debug': True, 'sysctl': '{}', 'dpdk-bond-config': ':'},
+            {'debug': False, 'sysctl': '{}', 'dpdk-bond-config': ''})
+        self.assertEqual(nutils.determine_reconcile_subsystems(),
+                         set([nutils.RECONCILE_TEMPLATES,
+                              nutils.RECONCILE_OVS]))
+
+    def test_forced(self):
+        nutils.clear_full_reconcile()
+        self.config.return_value = FakeConfig({'debug': False},
+                                              {'debug': False})
+        self.assertEqual(nutils.determine_reconcile_subsystems(force=True),
+                         set(nutils.RECONCILE_SUBSYSTEMS))
+        nutils.request_full_reconcile()
+        self.assertEqual(nutils.determine_reconcile_subsystems(),
+                         set(nutils.RECONCILE_SUBSYSTEMS))
+        nutils.clear_full_reconcile()
+        self.assertEqual(nutils.determine_reconcile_subsystems(), set())
+
+    def test_full_reconcile_after_reboot(self):
+        nutils.clear_full_reconcile()
+        self.config.return_value = FakeConfig({'debug': False},
+                                              {'debug': False})
+        with patch_open() as (_open, _file):
+            _file.read.return_value = 'boot-1\n'
+            # First run records the boot id
+            self.assertTrue(nutils.request_full_reconcile_after_reboot())
+            _open.assert_called_once_with(nutils.BOOT_ID_FILE)
+            nutils.clear_full_reconcile()
+            self.assertFalse(nutils.request_full_reconcile_after_reboot())
+            self.assertEqual(nutils.determine_reconcile_subsystems(), set())
+            _file.read.return_value = 'boot-2\n'
+            self.assertTrue(nutils.request_full_reconcile_after_reboot())
+        self.assertEqual(nutils.determine_reconcile_subsystems(),
+                         set(nutils.RECONCILE_SUBSYSTEMS))
+        self.assertEqual(self.db.get(nutils.BOOT_ID_KEY), 'boot-2')
+
+    def test_full_reconcile_after_reboot_no_boot_id(self):
+        nutils.clear_full_reconcile()
+        with patch_open() as (_open, _file):
+            _open.side_effect = IOError
+            self.assertFalse(nutils.request_full_reconcile_after_reboot())
+        self.assertFalse(self.db.get(nutils.RECONCILE_FORCE_KEY))
+
+    def test_relation_subsystems(self):
+        nutils.clear_full_reconcile()
+        self.relation_ids.return_value = ['neutron-plugin:1']
+        self.related_units.return_value = ['nova-compute/0']
+        self.relation_get.return_value = {
+            'private-address': '10.5.0.1',
+            'restart-trigger': 'abc',
+        }
+        self.assertEqual(
+            nutils.determine_relation_subsystems('neutron-plugin'),
+            set([nutils.RECONCILE_TEMPLATES]))
+        # Unchanged relation data
+        self.assertEqual(
+            nutils.determine_relation_subsystems('neutron-plugin'),
+            set())
+        # Changes to keys which do not affect the unit are ignored
+        self.relation_get.return_value = {
+            'private-address': '10.5.0.2',
+            'restart-trigger': 'abc',
+        }
+        self.assertEqual(
+            nutils.determine_relation_subsystems('neutron-plugin'),
+            set())
+        self.relation_get.return_value = {
+            'private-address': '10.5.0.2',
+            'restart-trigger': 'def',
+        }
+        self.assertEqual(
+            nutils.determine_relation_subsystems('neutron-plugin'),
+            set([nutils.RECONCILE_TEMPLATES]))
+
+    def test_relation_subsystems_full_reconcile_pending(self):
+        self.relation_ids.return_value = ['neutron-plugin:1']
+        self.related_units.return_value = ['nova-compute/0']
+        self.relation_get.return_value = {'restart-trigger': 'abc'}
+        nutils.request_full_reconcile()
+        self.assertEqual(
+            nutils.determine_relation_subsystems('neutron-plugin'),
+            set(nutils.RECONCILE_SUBSYSTEMS))
+        # Relation data is still recorded while the request is pending
+        nutils.clear_full_reconcile()
+        self.assertEqual(
+            nutils.determine_relation_subsystems('neutron-plugin'),
+            set())
+
 
 class TestDPDKBridgeBondMap(CharmTestCase):
 
@@ -1154,6 +2188,436 @@ class TestDPDKBondsConfig(CharmTestCase):
                           'lacp-time': 'fast'
                           })
 
+    def test_get_bond_config_options(self):
+        self.test_config.set('dpdk-bond-config',
+                             'bond0:balance-tcp:active:fast:'
+                             'lb-output-action=true:rebalance-interval=0 '
+                             'bond1:active-backup:off:slow:'
+                             'detect-mode=miimon:miimon-interval=100:'
+                             'updelay=500')
+        bonds_config = nutils.DPDKBondsConfig()
+        self.assertEqual(bonds_config.get_bond_config('bond0'),
+                         {'mode': 'balance-tcp',
+                          'lacp': 'active',
+                          'lacp-time': 'fast',
+                          'lb-output-action': 'true',
+                          'rebalance-interval': 0,
+                          })
+        self.assertEqual(bonds_config.get_bond_config('bond1'),
+                         {'mode': 'active-backup',
+                          'lacp': 'off',
+                          'lacp-time': 'slow',
+                          'detect-mode': 'miimon',
+                          'miimon-interval': 100,
+                          'updelay': 500,
+                          })
+
+    def test_get_bond_config_invalid_options(self):
+        for bond_config in ('bond0:balance-slb:off:fast:lb-output-action=true',
+                            'bond0:balance-tcp:active:fast:'
+                            'lb-output-action=yes',
+                            'bond0:::fast:rebalance-interval=20000',
+                            'bond0:::fast:miimon-interval=0',
+                            'bond0:::fast:detect-mode=arp',
+                            'bond0:::fast:updelay=-1',
+                            'bond0:::fast:foo=bar'):
+            self.test_config.set('dpdk-bond-config', bond_config)
+            self.assertRaises(AssertionError, nutils.DPDKBondsConfig)
+
+
+class TestDPDKSetBondConfig(CharmTestCase):
+
+    def setUp(self):
+        super(TestDPDKSetBondConfig, self).setUp(
+            nutils, ['ovs_has_late_dpdk_init', 'subprocess'])
+
+    def test_add_bridge_bond(self):
+        nutils.add_bridge_bond('br-data', 'bond0', ['eth0', 'eth1'])
+        self.subprocess.check_call.assert_has_calls([
+            call(['ovs-vsctl', '--may-exist', 'add-bond', 'br-data',
+                  'bond0', 'eth0', 'eth1']),
+            call(['ip', 'link', 'set', 'eth0', 'up']),
+            call(['ip', 'link', 'set', 'eth0', 'promisc', 'on']),
+            call(['ip', 'link', 'set', 'eth1', 'up']),
+            call(['ip', 'link', 'set', 'eth1', 'promisc', 'on']),
+        ])
+
+    def test_dpdk_set_bond_config_old_ovs(self):
+        self.ovs_has_late_dpdk_init.return_value = False
+        self.assertRaises(Exception, nutils.dpdk_set_bond_config, 'bond0',
+                          {'mode': 'balance-tcp', 'lacp': 'active',
+                           'lacp-time': 'fast'})
+        self.subprocess.check_call.assert_not_called()
+
+    def test_dpdk_set_bond_config(self):
+        self.ovs_has_late_dpdk_init.return_value = True
+        nutils.dpdk_set_bond_config('bond0', {
+            'mode': 'balance-tcp',
+            'lacp': 'active',
+            'lacp-time': 'fast',
+            'lb-output-action': 'true',
+            'updelay': 500,
+        })
+        self.subprocess.check_call.assert_called_once_with([
+            'ovs-vsctl',
+            '--', 'set', 'port', 'bond0', 'bond_mode=balance-tcp',
+            '--', 'set', 'port', 'bond0', 'lacp=active',
+            '--', 'set', 'port', 'bond0', 'other_config:lacp-time=fast',
+            '--', 'set', 'port', 'bond0', 'bond_updelay=500',
+            '--', 'set', 'port', 'bond0', 'bond_downdelay=0',
+            '--', 'set', 'port', 'bond0',
+            'other_config:lb-output-action=true',
+            '--', 'remove', 'port', 'bond0', 'other_config',
+            'bond-rebalance-interval',
+            '--', 'remove', 'port', 'bond0', 'other_config',
+            'bond-detect-mode',
+            '--', 'remove', 'port', 'bond0', 'other_config',
+            'bond-miimon-interval',
+        ])
+
+
+class TestDPDKPortQueuesConfig(CharmTestCase):
+
+    def setUp(self):
+        super(TestDPDKPortQueuesConfig, self).setUp(nutils, ['config', 'kv'])
+        self.config.side_effect = self.test_config.get
+        self.db = unitdata.Storage(':memory:')
+        self.kv.return_value = self.db
+        self.db.set('00:11:22:33:44:55', '0000:00:1c.0')
+
+    def test_get_port_config(self):
+        self.test_config.set('dpdk-port-queues',
+                             'auto::2048 00:11:22:33:44:55=4:4096 '
+                             '0000:00:1d.0=:512')
+        queues_config = nutils.DPDKPortQueuesConfig()
+        self.assertEqual(queues_config.get_port_config('0000:00:1c.0'),
+                         {'n_rxq': 4, 'n_rxq_desc': 4096,
+                          'n_txq_desc': 2048})
+        self.assertEqual(queues_config.get_port_config('0000:00:1d.0'),
+                         {'n_rxq': 'auto', 'n_rxq_desc': 512,
+                          'n_txq_desc': 2048})
+        self.assertEqual(queues_config.get_port_config('0000:00:1e.0'),
+                         {'n_rxq': 'auto', 'n_txq_desc': 2048})
+
+    def test_get_port_config_unset(self):
+        self.assertEqual(
+            nutils.DPDKPortQueuesConfig().get_port_config('0000:00:1c.0'),
+            {})
+
+    def test_invalid_port_config(self):
+        for invalid in ('0', 'x', '1:1000', '1:8192', '1:2:4:8'):
+            self.test_config.set('dpdk-port-queues', invalid)
+            self.assertRaises(AssertionError, nutils.DPDKPortQueuesConfig)
+
+    @patch.object(neutron_ovs_context, 'OVSDPDKDeviceContext')
+    def test_dpdk_port_queue_options(self, _OVSDPDKDeviceContext):
+        _OVSDPDKDeviceContext.return_value.local_pmd_cores.return_value = 3
+        self.test_config.set('dpdk-port-queues', 'auto::2048')
+        queues_config = nutils.DPDKPortQueuesConfig()
+        self.assertEqual(
+            nutils.dpdk_port_queue_options('0000:00:1c.0', queues_config),
+            OrderedDict([('n_rxq', 3), ('n_txq_desc', 2048)]))
+        _OVSDPDKDeviceContext.return_value.local_pmd_cores.\
+            assert_called_once_with('0000:00:1c.0')
+
+        # No PMD cores allocated, leave n_rxq to OVS
+        _OVSDPDKDeviceContext.return_value.local_pmd_cores.return_value = 0
+        self.assertEqual(
+            nutils.dpdk_port_queue_options('0000:00:1c.0', queues_config),
+            OrderedDict([('n_txq_desc', 2048)]))
+
+    @patch.object(nutils, 'subprocess')
+    def test_dpdk_set_interface_options(self, mock_subprocess):
+        nutils.dpdk_set_interface_options(
+            'dpdk1', OrderedDict([('n_rxq', 2), ('n_rxq_desc', 4096)]))
+        mock_subprocess.check_call.assert_called_once_with(
+            ['ovs-vsctl', '--', 'set', 'Interface', 'dpdk1',
+             'options:n_rxq=2', 'options:n_rxq_desc=4096'])
+        mock_subprocess.check_call.reset_mock()
+        nutils.dpdk_set_interface_options(
+            'dpdk1', OrderedDict([('n_rxq', 2), ('n_rxq_desc', None),
+                                  ('n_txq_desc', None)]))
+        mock_subprocess.check_call.assert_called_once_with(
+            ['ovs-vsctl', '--', 'set', 'Interface', 'dpdk1',
+             'options:n_rxq=2',
+             '--', 'remove', 'Interface', 'dpdk1', 'options', 'n_rxq_desc',
+             '--', 'remove', 'Interface', 'dpdk1', 'options', 'n_txq_desc'])
+
+
+class TestPMDRxqScheduling(CharmTestCase):
+
+    def setUp(self):
+        super(TestPMDRxqScheduling, self).setUp(
+            nutils, ['config', 'kv', 'log', 'set_Open_vSwitch_column_value',
+                     'set_ovs_other_config'])
+        self.config.side_effect = self.test_config.get
+        self.db = unitdata.Storage(':memory:')
+        self.kv.return_value = self.db
+        self.db.set('00:11:22:33:44:55', '0000:00:1c.0')
+
+    def test_configure_pmd_rxq_scheduling_defaults(self):
+        nutils.configure_pmd_rxq_scheduling()
+        self.set_ovs_other_config.assert_called_once_with(OrderedDict([
+            ('pmd-rxq-assign', None),
+            ('pmd-auto-lb', None),
+            ('pmd-auto-lb-load-threshold', None),
+            ('pmd-auto-lb-improvement-threshold', None),
+            ('pmd-auto-lb-rebal-interval', None),
+        ]))
+
+    def test_configure_pmd_rxq_scheduling(self):
+        self.test_config.set('dpdk-pmd-rxq-assign', 'group')
+        self.test_config.set('dpdk-pmd-auto-lb', True)
+        self.test_config.set('dpdk-pmd-auto-lb-load-threshold', 80)
+        nutils.configure_pmd_rxq_scheduling()
+        self.set_ovs_other_config.assert_called_once_with(OrderedDict([
+            ('pmd-rxq-assign', 'group'),
+            ('pmd-auto-lb', 'true'),
+            ('pmd-auto-lb-load-threshold', '80'),
+            ('pmd-auto-lb-improvement-threshold', '25'),
+            ('pmd-auto-lb-rebal-interval', '1'),
+        ]))
+
+    @patch.object(nutils.subprocess, 'check_output')
+    def test_get_Open_vSwitch_column_value(self, _check_output):
+        _check_output.return_value = b'"0:2,1:3"\n'
+        self.assertEqual(
+            nutils.get_Open_vSwitch_column_value('other_config:a'), '0:2,1:3')
+        _check_output.assert_called_once_with(
+            ['ovs-vsctl', '--if-exists', 'get', 'Open_vSwitch', '.',
+             'other_config:a'])
+        _check_output.return_value = b'true\n'
+        self.assertTrue(
+            nutils.get_Open_vSwitch_column_value('dpdk_initialized'))
+        # Identifier-like strings are not quoted by ovs-vsctl
+        _check_output.return_value = b'cycles\n'
+        self.assertEqual(
+            nutils.get_Open_vSwitch_column_value(
+                'other_config:pmd-rxq-assign'), 'cycles')
+        # Missing keys print nothing with --if-exists
+        _check_output.return_value = b'\n'
+        self.assertIsNone(
+            nutils.get_Open_vSwitch_column_value('other_config:a'))
+        _check_output.side_effect = subprocess.CalledProcessError(1, 'get')
+        self.assertIsNone(
+            nutils.get_Open_vSwitch_column_value('other_config:a'))
+
+    def test_configure_pmd_rxq_scheduling_invalid(self):
+        self.test_config.set('dpdk-pmd-rxq-assign', 'random')
+        nutils.configure_pmd_rxq_scheduling()
+        # An invalid mode leaves the current assignment mode in place
+        self.set_ovs_other_config.assert_called_once_with(OrderedDict([
+            ('pmd-auto-lb', None),
+            ('pmd-auto-lb-load-threshold', None),
+            ('pmd-auto-lb-improvement-threshold', None),
+            ('pmd-auto-lb-rebal-interval', None),
+        ]))
+        self.assertTrue(self.log.called)
+
+    @patch.object(nutils, 'log')
+    @patch.object(neutron_ovs_context, 'OVSDPDKDeviceContext')
+    def test_rxq_affinity_config(self, _OVSDPDKDeviceContext, _log):
+        _OVSDPDKDeviceContext.return_value.pmd_cpu_mask.return_value = '0x0c'
+        self.test_config.set('dpdk-pmd-rxq-affinity',
+                             '00:11:22:33:44:55=0:2,1:3 0000:00:1d.0=0:4')
+        affinity_config = nutils.DPDKRxqAffinityConfig()
+        self.assertEqual(affinity_config.get_port_affinity('0000:00:1c.0'),
+                         '0:2,1:3')
+        self.assertEqual(affinity_config.get_port_affinity('0000:00:1d.0'),
+                         '0:4')
+        self.assertEqual(affinity_config.get_port_affinity('0000:00:1e.0'),
+                         None)
+        _log.assert_called_once_with(
+            'Core 4 pinned for port 0000:00:1d.0 is not a PMD core',
+            level=nutils.WARNING)
+
+    def test_dpdk_port_matches(self):
+        self.assertTrue(nutils.dpdk_port_matches('00:11:22:33:44:55',
+                                                 '0000:00:1c.0'))
+        self.assertTrue(nutils.dpdk_port_matches('00:11:22:33:44:55'.upper(),
+                                                 '0000:00:1c.0'))
+        self.assertTrue(nutils.dpdk_port_matches('0000:00:1C.0',
+                                                 '0000:00:1c.0'))
+        self.assertFalse(nutils.dpdk_port_matches('00:11:22:33:44:55',
+                                                  '0000:00:1d.0'))
+
+    @patch.object(neutron_ovs_context, 'OVSDPDKDeviceContext')
+    def test_rxq_affinity_config_invalid(self, _OVSDPDKDeviceContext):
+        for invalid in ('0:2', '00:11:22:33:44:55=0-2'):
+            self.test_config.set('dpdk-pmd-rxq-affinity', invalid)
+            self.assertRaises(AssertionError, nutils.DPDKRxqAffinityConfig)
+
+    @patch.object(nutils, 'subprocess')
+    def test_dpdk_set_interface_other_config(self, mock_subprocess):
+        nutils.dpdk_set_interface_other_config('dpdk1', 'pmd-rxq-affinity',
+                                               '0:2,1:3')
+        mock_subprocess.check_call.assert_called_once_with(
+            ['ovs-vsctl', 'set', 'Interface', 'dpdk1',
+             'other_config:pmd-rxq-affinity="0:2,1:3"'])
+        mock_subprocess.check_call.reset_mock()
+        nutils.dpdk_set_interface_other_config('dpdk1', 'pmd-rxq-affinity',
+                                               None)
+        mock_subprocess.check_call.assert_called_once_with(
+            ['ovs-vsctl', 'remove', 'Interface', 'dpdk1', 'other_config',
+             'pmd-rxq-affinity'])
+
+
+class TestDPDKTunnelEndpoint(CharmTestCase):
+
+    def setUp(self):
+        super(TestDPDKTunnelEndpoint, self).setUp(
+            nutils, ['kv', 'log', 'subprocess'])
+        self.db = unitdata.Storage(':memory:')
+        self.kv.return_value = self.db
+        self.endpoint = neutron_ovs_context.TunnelEndpoint(
+            'br-phynet1',
+            neutron_ovs_context.netaddr.IPNetwork('192.168.100.10/24'),
+            OrderedDict([(
+                neutron_ovs_context.netaddr.IPNetwork('10.20.0.0/16'),
+                neutron_ovs_context.netaddr.IPAddress('192.168.100.1'))]),
+            OrderedDict([(
+                neutron_ovs_context.netaddr.IPAddress('192.168.100.1'),
+                'fa:16:3e:00:00:01')]))
+        patcher = patch.object(neutron_ovs_context, 'dpdk_tunnel_endpoint')
+        self.dpdk_tunnel_endpoint = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_configure_dpdk_tunnel_endpoint(self):
+        self.dpdk_tunnel_endpoint.return_value = self.endpoint
+        nutils.configure_dpdk_tunnel_endpoint()
+        self.subprocess.check_call.assert_has_calls([
+            call(['ip', 'addr', 'replace', '192.168.100.10/24',
+                  'dev', 'br-phynet1']),
+            call(['ip', 'link', 'set', 'dev', 'br-phynet1', 'up']),
+            call(['ovs-appctl', 'ovs/route/add', '192.168.100.0/24',
+                  'br-phynet1']),
+            call(['ovs-appctl', 'ovs/route/add', '10.20.0.0/16',
+                  'br-phynet1', '192.168.100.1']),
+            call(['ovs-appctl', 'tnl/neigh/set', 'br-phynet1',
+                  '192.168.100.1', 'fa:16:3e:00:00:01']),
+        ])
+        self.assertFalse(self.subprocess.call.called)
+        self.assertEqual(self.db.get(nutils.DPDK_TUNNEL_ADDRESS_KEY),
+                         ['br-phynet1', '192.168.100.10/24'])
+
+    def test_configure_dpdk_tunnel_endpoint_removed(self):
+        self.db.set(nutils.DPDK_TUNNEL_ADDRESS_KEY,
+                    ['br-phynet2', '192.168.200.10/24'])
+        self.dpdk_tunnel_endpoint.return_value = None
+        nutils.configure_dpdk_tunnel_endpoint()
+        self.subprocess.call.assert_called_once_with(
+            ['ip', 'addr', 'del', '192.168.200.10/24', 'dev', 'br-phynet2'])
+        self.assertFalse(self.subprocess.check_call.called)
+        self.assertEqual(self.db.get(nutils.DPDK_TUNNEL_ADDRESS_KEY), None)
+
+    def test_configure_dpdk_tunnel_endpoint_stale_routes(self):
+        self.dpdk_tunnel_endpoint.return_value = self.endpoint
+        nutils.configure_dpdk_tunnel_endpoint()
+        self.assertFalse(self.subprocess.call.called)
+        # Move the endpoint and replace its route and neighbour
+        self.subprocess.reset_mock()
+        self.dpdk_tunnel_endpoint.return_value = \
+            neutron_ovs_context.TunnelEndpoint(
+                'br-phynet1',
+                neutron_ovs_context.netaddr.IPNetwork('192.168.101.10/24'),
+                OrderedDict([(
+                    neutron_ovs_context.netaddr.IPNetwork('10.30.0.0/16'),
+                    neutron_ovs_context.netaddr.IPAddress('192.168.101.1'))]),
+                OrderedDict([(
+                    neutron_ovs_context.netaddr.IPAddress('192.168.101.1'),
+                    'fa:16:3e:00:00:02')]))
+        nutils.configure_dpdk_tunnel_endpoint()
+        self.subprocess.call.assert_has_calls([
+            call(['ip', 'addr', 'del', '192.168.100.10/24',
+                  'dev', 'br-phynet1']),
+            call(['ovs-appctl', 'ovs/route/del', '192.168.100.0/24']),
+            call(['ovs-appctl', 'ovs/route/del', '10.20.0.0/16']),
+            call(['ovs-appctl', 'tnl/neigh/flush']),
+        ])
+        self.subprocess.check_call.assert_has_calls([
+            call(['ovs-appctl', 'ovs/route/add', '192.168.101.0/24',
+                  'br-phynet1']),
+            call(['ovs-appctl', 'ovs/route/add', '10.30.0.0/16',
+                  'br-phynet1', '192.168.101.1']),
+            call(['ovs-appctl', 'tnl/neigh/set', 'br-phynet1',
+                  '192.168.101.1', 'fa:16:3e:00:00:02']),
+        ])
+        # Disabling the endpoint removes everything installed
+        self.subprocess.reset_mock()
+        self.dpdk_tunnel_endpoint.return_value = None
+        nutils.configure_dpdk_tunnel_endpoint()
+        self.subprocess.call.assert_has_calls([
+            call(['ip', 'addr', 'del', '192.168.101.10/24',
+                  'dev', 'br-phynet1']),
+            call(['ovs-appctl', 'ovs/route/del', '192.168.101.0/24']),
+            call(['ovs-appctl', 'ovs/route/del', '10.30.0.0/16']),
+            call(['ovs-appctl', 'tnl/neigh/flush']),
+        ])
+        self.assertFalse(self.subprocess.check_call.called)
+        self.assertEqual(self.db.get(nutils.DPDK_TUNNEL_ROUTES_KEY), [])
+        self.assertEqual(self.db.get(nutils.DPDK_TUNNEL_NEIGHBOURS_KEY), [])
+
+    def test_configure_dpdk_tunnel_endpoint_invalid(self):
+        self.db.set(nutils.DPDK_TUNNEL_ADDRESS_KEY,
+                    ['br-phynet2', '192.168.200.10/24'])
+        self.dpdk_tunnel_endpoint.side_effect = ValueError('invalid')
+        nutils.configure_dpdk_tunnel_endpoint()
+        self.assertFalse(self.subprocess.call.called)
+        self.assertFalse(self.subprocess.check_call.called)
+
+
+class TestDatapathTuning(CharmTestCase):
+
+    def setUp(self):
+        super(TestDatapathTuning, self).setUp(
+            nutils, ['config', 'use_dpdk', 'set_Open_vSwitch_column_value',
+                     'remove_Open_vSwitch_column_key'])
+        self.config.side_effect = self.test_config.get
+        self.use_dpdk.return_value = False
+        patcher = patch.object(neutron_ovs_context, 'numa_node_cores',
+                               return_value={'0': list(range(8)),
+                                             '1': list(range(8, 16))})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_datapath_tuning_defaults(self):
+        self.assertEqual(nutils.datapath_tuning(), OrderedDict([
+            ('max-idle', None),
+            ('flow-limit', None),
+            ('n-handler-threads', '16'),
+            ('n-revalidator-threads', '5'),
+        ]))
+
+    @patch.object(neutron_ovs_context, 'OVSDPDKDeviceContext')
+    def test_datapath_tuning_dpdk(self, _OVSDPDKDeviceContext):
+        _OVSDPDKDeviceContext.return_value.pmd_cpu_mask.return_value = \
+            '0x0f0f'
+        self.use_dpdk.return_value = True
+        self.test_config.set('dpdk-emc-insert-inv-prob', 1000)
+        self.test_config.set('dpdk-smc-enable', True)
+        self.test_config.set('ovs-flow-limit', 500000)
+        self.test_config.set('ovs-n-revalidator-threads', 2)
+        self.assertEqual(nutils.datapath_tuning(), OrderedDict([
+            ('emc-insert-inv-prob', '1000'),
+            ('smc-enable', 'true'),
+            ('tx-flush-interval', None),
+            ('max-idle', None),
+            ('flow-limit', '500000'),
+            ('n-handler-threads', '8'),
+            ('n-revalidator-threads', '2'),
+        ]))
+
+    def test_configure_datapath_tuning(self):
+        self.test_config.set('ovs-max-idle', 30000)
+        nutils.configure_datapath_tuning()
+        self.set_Open_vSwitch_column_value.assert_has_calls([
+            call('other_config:max-idle', '30000'),
+            call('other_config:n-handler-threads', '16'),
+            call('other_config:n-revalidator-threads', '5'),
+        ])
+        self.remove_Open_vSwitch_column_key.assert_called_once_with(
+            'other_config', 'flow-limit')
+
 
 class TestMTURequest(CharmTestCase):
 
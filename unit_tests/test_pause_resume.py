@@ -26,22 +26,57 @@ class PauseTestCase(CharmTestCase):
 
     def setUp(self):
         super(PauseTestCase, self).setUp(
-            actions, ["pause_unit_helper"])
+            actions, ["pause_unit_helper", "action_set"])
 
     def test_pauses_services(self):
+        def _pause(configs, timings):
+            timings['neutron-openvswitch-agent'] = 1.5
+        self.pause_unit_helper.side_effect = _pause
         actions.pause([])
-        self.pause_unit_helper.assert_called_once_with('test-config')
+        self.pause_unit_helper.assert_called_once_with('test-config',
+                                                       mock.ANY)
+        self.action_set.assert_called_once_with(
+            {'timings.neutron-openvswitch-agent': 1.5})
 
 
 class ResumeTestCase(CharmTestCase):
 
     def setUp(self):
         super(ResumeTestCase, self).setUp(
-            actions, ["resume_unit_helper"])
+            actions, ["resume_unit_helper", "action_set"])
 
     def test_pauses_services(self):
         actions.resume([])
-        self.resume_unit_helper.assert_called_once_with('test-config')
+        self.resume_unit_helper.assert_called_once_with('test-config', {})
+        self.assertFalse(self.action_set.called)
+
+    def test_resume_failure_reports_timings(self):
+        def _resume(configs, timings):
+            timings['neutron-openvswitch-agent'] = 60.0
+            raise Exception("Couldn't resume")
+        self.resume_unit_helper.side_effect = _resume
+        self.assertRaises(Exception, actions.resume, [])
+        self.action_set.assert_called_once_with(
+            {'timings.neutron-openvswitch-agent': 60.0})
+
+
+class RestartTestCase(CharmTestCase):
+
+    def setUp(self):
+        super(RestartTestCase, self).setUp(
+            actions, ["restart_openvswitch", "assess_status",
+                      "is_unit_paused_set"])
+
+    def test_restarts_openvswitch(self):
+        self.is_unit_paused_set.return_value = False
+        actions.restart([])
+        self.restart_openvswitch.assert_called_once_with()
+        self.assess_status.assert_called_once_with('test-config')
+
+    def test_restart_paused(self):
+        self.is_unit_paused_set.return_value = True
+        self.assertRaises(Exception, actions.restart, [])
+        self.assertFalse(self.restart_openvswitch.called)
 
 
 class MainTestCase(CharmTestCase):
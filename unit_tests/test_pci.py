@@ -22,6 +22,10 @@ from test_pci_helper import (
     mocked_realpath,
 )
 from mock import patch, MagicMock, call
+import os
+import shutil
+import tempfile
+
 import pci
 
 TO_PATCH = [
@@ -178,6 +182,25 @@ class PCINetDeviceTest(CharmTestCase):
         self.assertEqual(
             pci.get_sysnet_interface('/sys/class/net/eth3'), 'eth3')
 
+    @patch('pci.get_sysnet_interfaces_and_macs')
+    def test_update_interface_info_multiport(self, mock_sysnet_ints):
+        mock_sysnet_ints.return_value = [{
+            'interface': 'ens1',
+            'mac_address': 'a8:9d:21:cf:93:fc',
+            'pci_address': '0000:10:00.0',
+            'state': 'up',
+            'sriov': False,
+        }, {
+            'interface': 'ens1d1',
+            'mac_address': 'a8:9d:21:cf:93:fd',
+            'pci_address': '0000:10:00.0',
+            'state': 'up',
+            'sriov': False,
+        }]
+        dev = pci.PCINetDevice('0000:10:00.0')
+        self.assertEqual(dev.mac_addresses,
+                         ['a8:9d:21:cf:93:fc', 'a8:9d:21:cf:93:fd'])
+
     @patch('pci.get_sysnet_interfaces_and_macs')
     def test__set_sriov_numvfs(self, mock_sysnet_ints):
         mock_sysnet_ints.side_effect = [{
@@ -321,3 +344,193 @@ class PCINetDevicesTest(CharmTestCase):
         self.assertTrue(check_device(
             devices.get_device_from_pci_address('0000:10:00.1'),
             expect['0000:10:00.1']))
+
+
+class PCIBindTest(CharmTestCase):
+
+    def setUp(self):
+        super(PCIBindTest, self).setUp(pci, TO_PATCH)
+        self.sysfs = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.sysfs)
+        patcher = patch.object(pci, 'SYS_BUS_PCI', self.sysfs)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for driver in ('ixgbe', 'vfio-pci', 'pcieport'):
+            os.makedirs(os.path.join(self.sysfs, 'drivers', driver))
+        self.add_device('0000:01:00.0', 'ixgbe', 1)
+        self.add_device('0000:01:00.1', 'ixgbe', 1)
+        self.add_device('0000:02:00.0', 'ixgbe', 2)
+        self.add_device('0000:00:01.0', 'pcieport', 2)
+        self.add_device('0000:03:00.0', 'ixgbe', None)
+        write_patcher = patch.object(pci, '_write_sysfs',
+                                     side_effect=self.fake_write)
+        self._write_sysfs = write_patcher.start()
+        self.addCleanup(write_patcher.stop)
+
+    def device_path(self, pci_address, *path):
+        return os.path.join(self.sysfs, 'devices', pci_address, *path)
+
+    def add_device(self, pci_address, driver, group):
+        os.makedirs(self.device_path(pci_address))
+        if driver:
+            os.symlink(os.path.join(self.sysfs, 'drivers', driver),
+                       self.device_path(pci_address, 'driver'))
+        if group is not None:
+            group_path = os.path.join(self.sysfs, 'iommu_groups', str(group))
+            if not os.path.isdir(group_path):
+                os.makedirs(os.path.join(group_path, 'devices'))
+            os.symlink(self.device_path(pci_address),
+                       os.path.join(group_path, 'devices', pci_address))
+            os.symlink(group_path,
+                       self.device_path(pci_address, 'iommu_group'))
+
+    def fake_write(self, path, value):
+        # Emulate the kernel handling of the sysfs PCI bus attributes
+        if path.endswith('/unbind'):
+            os.remove(self.device_path(value, 'driver'))
+        elif path.endswith('/drivers_probe'):
+            with open(self.device_path(value, 'driver_override')) as f:
+                driver = f.read()
+            os.symlink(os.path.join(self.sysfs, 'drivers', driver),
+                       self.device_path(value, 'driver'))
+        else:
+            with open(path, 'w') as f:
+                f.write(value)
+
+    def test_get_pci_driver(self):
+        self.assertEqual(pci.get_pci_driver('0000:01:00.0'), 'ixgbe')
+        self.assertIsNone(pci.get_pci_driver('0000:04:00.0'))
+
+    def test_get_iommu_group_devices(self):
+        self.assertEqual(pci.get_iommu_group_devices('0000:01:00.0'),
+                         ['0000:01:00.0', '0000:01:00.1'])
+        self.assertIsNone(pci.get_iommu_group_devices('0000:03:00.0'))
+
+    def test_check_vfio_iommu_group(self):
+        pci.check_vfio_iommu_group('0000:02:00.0')
+        pci.check_vfio_iommu_group('0000:01:00.0', ['0000:01:00.1'])
+        with self.assertRaises(ValueError) as cm:
+            pci.check_vfio_iommu_group('0000:01:00.0')
+        self.assertEqual(str(cm.exception),
+                         'IOMMU group shared with 0000:01:00.1 bound to '
+                         'ixgbe')
+        self.assertRaises(ValueError, pci.check_vfio_iommu_group,
+                          '0000:03:00.0')
+
+    def test_ensure_pci_driver_loaded(self):
+        self.assertTrue(pci.ensure_pci_driver_loaded('vfio-pci'))
+        self.subprocess.call.assert_not_called()
+        self.assertFalse(pci.ensure_pci_driver_loaded('igb_uio'))
+        self.subprocess.call.assert_called_once_with(['modprobe', 'igb_uio'])
+
+    def test_bind_pci_device(self):
+        self.assertTrue(pci.bind_pci_device('0000:02:00.0', 'vfio-pci'))
+        self.assertEqual(pci.get_pci_driver('0000:02:00.0'), 'vfio-pci')
+        self._write_sysfs.assert_has_calls([
+            call(self.device_path('0000:02:00.0', 'driver_override'),
+                 'vfio-pci'),
+            call(self.device_path('0000:02:00.0', 'driver', 'unbind'),
+                 '0000:02:00.0'),
+            call(os.path.join(self.sysfs, 'drivers_probe'),
+                 '0000:02:00.0'),
+        ])
+        self._write_sysfs.reset_mock()
+        self.assertFalse(pci.bind_pci_device('0000:02:00.0', 'vfio-pci'))
+        self._write_sysfs.assert_not_called()
+
+    def test_bind_pci_device_failures(self):
+        self.assertRaises(ValueError, pci.bind_pci_device,
+                          '0000:04:00.0', 'vfio-pci')
+        self._write_sysfs.side_effect = IOError('No such device')
+        self.assertRaises(ValueError, pci.bind_pci_device,
+                          '0000:02:00.0', 'vfio-pci')
+
+    def test_bind_pci_devices(self):
+        failures = pci.bind_pci_devices({
+            '0000:01:00.0': 'vfio-pci',
+            '0000:01:00.1': 'vfio-pci',
+            '0000:02:00.0': 'igb_uio',
+            '0000:03:00.0': 'vfio-pci',
+        })
+        self.assertEqual(dict(failures), {
+            '0000:02:00.0': 'driver igb_uio not available',
+            '0000:03:00.0': 'no IOMMU group, check intel_iommu=on or '
+                            'amd_iommu=on is set on the kernel command line',
+        })
+        self.assertEqual(pci.get_pci_driver('0000:01:00.0'), 'vfio-pci')
+        self.assertEqual(pci.get_pci_driver('0000:01:00.1'), 'vfio-pci')
+        self.assertEqual(pci.get_pci_driver('0000:03:00.0'), 'ixgbe')
+
+
+class PCISwitchdevTest(CharmTestCase):
+
+    def setUp(self):
+        super(PCISwitchdevTest, self).setUp(pci, ['subprocess'])
+        self.sysfs = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.sysfs)
+        self.net = os.path.join(self.sysfs, 'net')
+        for name, value in (('SYS_BUS_PCI', self.sysfs),
+                            ('SYS_CLASS_NET', self.net)):
+            patcher = patch.object(pci, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        os.makedirs(os.path.join(self.sysfs, 'drivers', 'mlx5_core'))
+        pf = os.path.join(self.sysfs, 'devices', '0000:3b:00.0')
+        os.makedirs(pf)
+        for index, vf in ((0, '0000:3b:00.2'), (1, '0000:3b:00.3'),
+                          (10, '0000:3b:01.4')):
+            os.makedirs(os.path.join(self.sysfs, 'devices', vf))
+            os.symlink(os.path.join(self.sysfs, 'devices', vf),
+                       os.path.join(pf, 'virtfn{}'.format(index)))
+        os.symlink(os.path.join(self.sysfs, 'drivers', 'mlx5_core'),
+                   os.path.join(self.sysfs, 'devices', '0000:3b:00.2',
+                                'driver'))
+        for netdev, switch_id, port_name in (
+                ('enp59s0f0', 'c2a7', 'p0'),
+                ('enp59s0f0_1', 'c2a7', 'pf0vf1'),
+                ('enp59s0f0_0', 'c2a7', 'pf0vf0'),
+                ('eth5', 'c2a7', None),
+                ('enp94s0f0_0', 'ffee', 'pf0vf0'),
+                ('eno1', None, None)):
+            os.makedirs(os.path.join(self.net, netdev))
+            for name, value in (('phys_switch_id', switch_id),
+                                ('phys_port_name', port_name)):
+                if value:
+                    with open(os.path.join(self.net, netdev, name),
+                              'w') as f:
+                        f.write(value + '\n')
+
+    def test_get_vf_pci_addresses(self):
+        self.assertEqual(pci.get_vf_pci_addresses('0000:3b:00.0'),
+                         ['0000:3b:00.2', '0000:3b:00.3', '0000:3b:01.4'])
+        self.assertEqual(pci.get_vf_pci_addresses('0000:3b:00.2'), [])
+
+    @patch.object(pci, '_write_sysfs')
+    def test_unbind_pci_device(self, _write_sysfs):
+        self.assertEqual(pci.unbind_pci_device('0000:3b:00.2'), 'mlx5_core')
+        _write_sysfs.assert_called_once_with(
+            os.path.join(self.sysfs, 'devices', '0000:3b:00.2', 'driver',
+                         'unbind'),
+            '0000:3b:00.2')
+        _write_sysfs.reset_mock()
+        self.assertIsNone(pci.unbind_pci_device('0000:3b:00.3'))
+        _write_sysfs.assert_not_called()
+
+    @patch.object(pci, '_write_sysfs')
+    def test_probe_pci_device(self, _write_sysfs):
+        pci.probe_pci_device('0000:3b:00.2')
+        _write_sysfs.assert_called_once_with(
+            os.path.join(self.sysfs, 'drivers_probe'), '0000:3b:00.2')
+
+    def test_read_sysfs(self):
+        self.assertEqual(pci.read_sysfs(os.path.join(
+            self.net, 'enp59s0f0', 'phys_port_name')), 'p0')
+        self.assertIsNone(pci.read_sysfs(os.path.join(
+            self.net, 'eno1', 'phys_port_name')))
+
+    def test_get_vf_representors(self):
+        self.assertEqual(pci.get_vf_representors('enp59s0f0'),
+                         {0: 'enp59s0f0_0', 1: 'enp59s0f0_1'})
+        self.assertEqual(list(pci.get_vf_representors('enp59s0f0')),
+                         [0, 1])
+        self.assertEqual(pci.get_vf_representors('eno1'), {})
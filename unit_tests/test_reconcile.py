@@ -0,0 +1,49 @@
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mock import MagicMock
+
+from test_utils import CharmTestCase
+
+import neutron_ovs_utils as utils
+
+_reg = utils.register_configs
+_map = utils.restart_map
+
+utils.register_configs = MagicMock()
+utils.restart_map = MagicMock()
+
+import reconcile as actions
+
+utils.register_configs = _reg
+utils.restart_map = _map
+
+
+class ReconcileTestCase(CharmTestCase):
+
+    def setUp(self):
+        super(ReconcileTestCase, self).setUp(
+            actions, ["assess_status", "full_reconcile",
+                      "is_unit_paused_set"])
+        self.is_unit_paused_set.return_value = False
+
+    def test_reconcile(self):
+        actions.reconcile([])
+        self.full_reconcile.assert_called_once_with()
+        self.assess_status.assert_called_once_with(actions.CONFIGS)
+
+    def test_reconcile_paused(self):
+        self.is_unit_paused_set.return_value = True
+        self.assertRaises(Exception, actions.reconcile, [])
+        self.full_reconcile.assert_not_called()